@@ -0,0 +1,80 @@
+"""
+Rendimiento de una descarga HLS según los fragmentos simultáneos.
+
+    python benchmarks/bench_fragments.py [--videos 3] [--size-mb 4] [--segments 60]
+                                         [--latency-ms 50] [--levels 1,2,4,8,16]
+
+Cada fragmento del servidor local tarda `--latency-ms` en responder, como la
+ida y vuelta a un CDN; con fragmentos en serie esa espera se suma una vez por
+fragmento. Si aria2c está instalado se mide también la descarga directa (MP4)
+con el descargador nativo y con aria2c.
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from downloader_core import (  # noqa: E402
+    DownloadEngine, DownloadHistory, FormatDecisions, InfoCache, aria2c_disponible,
+)
+from fixture_server import FixtureServer  # noqa: E402
+
+
+def run(urls, fragments=None, downloader="native"):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = DownloadEngine(
+            history=DownloadHistory(Path(tmp) / "history.db", legacy_json=None),
+            info_cache=InfoCache(Path(tmp) / "cache"),
+            formats=FormatDecisions(Path(tmp) / "formats.json"),
+            fragments=fragments,
+            downloader=downloader,
+        )
+        t0 = time.perf_counter()
+        ok = sum(engine.download(url, str(Path(tmp) / "out")) for url in urls)
+        elapsed = time.perf_counter() - t0
+        engine.close()
+        engine.history.close()
+    return elapsed, ok
+
+
+def report(name, elapsed, ok, urls, size):
+    mb = size * ok / (1024 * 1024)
+    print(f"{name:16s} {elapsed:6.2f} s  {mb / elapsed:6.2f} MB/s  "
+          f"{elapsed / len(urls):5.2f} s/video  ({ok}/{len(urls)} ok)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--videos", type=int, default=3)
+    parser.add_argument("--size-mb", type=float, default=4)
+    parser.add_argument("--segments", type=int, default=60)
+    parser.add_argument("--latency-ms", type=int, default=50)
+    parser.add_argument("--levels", default="1,2,4,8,16")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    levels = [int(n) for n in args.levels.split(",")]
+    with FixtureServer(videos=args.videos, size=size, segments=args.segments,
+                       latency=args.latency_ms / 1000) as srv:
+        hls = [srv.hls_url(i) for i in range(args.videos)]
+        run(hls[:1], fragments=1)       # Calentar imports de yt-dlp
+
+        print(f"HLS: {args.videos} video(s) × {args.segments} fragmentos, "
+              f"{args.latency_ms} ms por fragmento")
+        for n in levels:
+            report(f"{n} fragmento(s)", *run(hls, fragments=n), hls, size)
+
+        if aria2c_disponible():
+            mp4 = [srv.mp4_url(i) for i in range(args.videos)]
+            print("\nMP4 directo:")
+            for name in ("native", "aria2c"):
+                report(name, *run(mp4, downloader=name), mp4, size)
+        else:
+            print("\n(aria2c no está instalado: se omite la comparación nativo/aria2c)")
+
+
+if __name__ == "__main__":
+    main()
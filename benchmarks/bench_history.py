@@ -0,0 +1,122 @@
+"""
+Historial: JSON antiguo frente a DownloadHistory (SQLite).
+
+    python benchmarks/bench_history.py [--entries 100000] [--adds 20] [--queries 1000]
+                                       [--searches 20]
+
+- Carga/migración: abrir un historial con `--entries` descargas.
+- add: `--adds` descargas nuevas (el JSON reescribía el fichero entero cada vez).
+- is_duplicate: `--queries` consultas, mitad aciertos y mitad fallos.
+- búsqueda: `--searches` búsquedas del panel de historial (recuento + primera
+  página de HISTORY_BLOCK filas) y página: un bloque a mitad de resultados,
+  lo que cuesta arrastrar la barra de desplazamiento.
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from downloader_core import DownloadHistory  # noqa: E402
+from video_downloader import HISTORY_BLOCK  # noqa: E402
+
+
+class JsonHistory:
+    """La implementación anterior: lista en memoria + JSON con indent=2"""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "r", encoding="utf-8") as f:
+            self.history = json.load(f)
+
+    def add(self, url, title, uploader, duration):
+        entry = {"url": url, "title": title, "uploader": uploader,
+                 "duration": duration, "date": "2024-01-01 00:00"}
+        self.history = [h for h in self.history if h["url"] != url]
+        self.history.insert(0, entry)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.history, f, ensure_ascii=False, indent=2)
+
+    def is_duplicate(self, url):
+        return any(h["url"] == url for h in self.history)
+
+
+def _url(i):
+    return f"https://www.youtube.com/watch?v=vid{i:08d}"
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--adds", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--searches", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    queries = [_url(rng.randrange(args.entries)) if i % 2 else _url(args.entries * 2 + i)
+               for i in range(args.queries)]
+    words = ["gatos", "receta", "tutorial", "música", "vlog", "directo"]
+    searches = [" ".join(rng.sample(words, 1 + i % 2)) for i in range(args.searches)]
+    seed = [{"url": _url(i), "title": f"Video {i} {words[i % len(words)]} {words[i % 5]}",
+             "uploader": "canal",
+             "duration": 60, "date": "2024-01-01 00:00"} for i in range(args.entries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        json_path = tmp / "download_history.json"
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(seed, f, ensure_ascii=False, indent=2)
+
+        results = {}
+        stores = {}
+        results["json", "carga"] = _timed(lambda: stores.__setitem__("json", JsonHistory(json_path)))
+        results["sqlite", "carga"] = _timed(lambda: stores.__setitem__(
+            "sqlite", DownloadHistory(tmp / "history.db", legacy_json=json_path)))
+        # Reabrir sin migración: el arranque normal a partir de ahora
+        stores["sqlite"].close()
+        results["sqlite", "reapertura"] = _timed(lambda: stores.__setitem__(
+            "sqlite", DownloadHistory(tmp / "history.db", legacy_json=None)))
+
+        json_path.write_text(json.dumps(seed), encoding="utf-8")
+        stores["json"] = JsonHistory(json_path)
+
+        for name, store in stores.items():
+            results[name, "add"] = _timed(lambda: [
+                store.add(_url(args.entries + i), "nuevo", "canal", 60) for i in range(args.adds)
+            ])
+            results[name, "is_duplicate"] = _timed(lambda: [store.is_duplicate(u) for u in queries])
+
+        history = stores["sqlite"]
+        results["sqlite", "búsqueda"] = _timed(lambda: [
+            (history.count(q), history.search(q, 0, HISTORY_BLOCK)) for q in searches
+        ])
+        results["sqlite", "página"] = _timed(lambda: [
+            history.search(q, history.count(q) // 2, HISTORY_BLOCK) for q in searches
+        ])
+        history.close()
+
+    print(f"Historial con {args.entries} entradas\n")
+    print(f"{'':14s}{'json':>12s}{'sqlite':>12s}")
+    for op, unit, scale, n in (("carga", "s", 1, 1), ("reapertura", "s", 1, 1),
+                               ("add", "ms/add", 1000, args.adds),
+                               ("is_duplicate", "µs/consulta", 1e6, len(queries)),
+                               ("búsqueda", "ms/búsqueda", 1000, len(searches)),
+                               ("página", "ms/página", 1000, len(searches))):
+        row = f"{op:14s}"
+        for name in ("json", "sqlite"):
+            value = results.get((name, op))
+            row += f"{value * scale / n:12.2f}" if value is not None else f"{'—':>12s}"
+        print(f"{row}  {unit}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Rendimiento de la cola completa (DownloadQueue + DownloadEngine) sin red.
+
+    python benchmarks/bench_pipeline.py [--kinds mp4,hls,dash] [--levels 1,2,4,8]
+                                        [--videos 12] [--size-mb 2] [--segments 20]
+                                        [--bandwidth 4M] [--latency-ms 20]
+                                        [--json resultados.json] [--baseline anterior.json]
+
+Un servidor local sirve los mismos videos como MP4 directo, HLS y DASH, con
+`--bandwidth` bytes/s por conexión y `--latency-ms` antes de cada respuesta.
+Cada combinación (formato, descargas simultáneas) se ejecuta en un proceso
+nuevo con el mismo camino que `--batch` (run_job), así la CPU y el pico de
+memoria son solo suyos. Se informa del throughput, la latencia por video
+(p50/p95, de la telemetría de cada trabajo), el tiempo de CPU y el pico de
+RSS.
+
+Con `--json` se guardan los resultados junto al commit actual y con
+`--baseline` se comparan con los de otra ejecución (p. ej. de otro commit).
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+try:
+    import resource
+except ImportError:         # Windows: sin pico de RSS ni CPU de subprocesos
+    resource = None
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _children_cpu():
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def child(workers, urls):
+    """Proceso hijo: descarga `urls` con la cola y escribe el resultado en JSON"""
+    from download_queue import DownloadQueue, DONE
+    from downloader_core import DownloadEngine, DownloadHistory, FormatDecisions, InfoCache
+    from video_downloader import run_job
+
+    def engine_in(tmp):
+        return DownloadEngine(
+            history=DownloadHistory(Path(tmp) / "history.db", legacy_json=None),
+            info_cache=InfoCache(Path(tmp) / "cache"),
+            formats=FormatDecisions(Path(tmp) / "formats.json"),
+            yt_dlp_progress=False,
+        )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        (Path(tmp) / "warm").mkdir()
+        warm = engine_in(Path(tmp) / "warm")    # Imports y extractores de yt-dlp
+        warm.download(urls[0], str(Path(tmp) / "warm" / "out"))
+        warm.close()
+        warm.history.close()
+
+        engine = engine_in(tmp)
+        queue = DownloadQueue(max_workers=workers, scheduler=engine.scheduler)
+        options = {"output_path": str(Path(tmp) / "out"), "quality": "best", "use_cookies": "no"}
+        for url in urls:
+            queue.add(url, options)
+
+        cpu0, sub0 = time.process_time(), _children_cpu()
+        t0 = time.perf_counter()
+        queue.start(lambda job: run_job(engine, job))
+        queue.wait()
+        elapsed = time.perf_counter() - t0
+        cpu = time.process_time() - cpu0 + _children_cpu() - sub0
+
+        jobs = queue.jobs()
+        done = [j for j in jobs if j.state == DONE]
+        result = {
+            "elapsed": elapsed,
+            "ok": len(done),
+            "total": len(jobs),
+            "bytes": sum(j.metrics.bytes for j in done if j.metrics),
+            "latencies": sorted(j.metrics.t_total for j in done if j.metrics),
+            "cpu": cpu,
+            "peak_rss": _peak_rss(),
+        }
+        queue.close()
+        engine.close()
+        engine.history.close()
+    print(json.dumps(result))
+
+
+def run(kind, workers, urls):
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", str(workers), *urls],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{kind}/{workers}: {proc.stderr.strip()[-500:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result.update(kind=kind, workers=workers)
+    return result
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+def report(result, baseline=None):
+    mb = result["bytes"] / (1024 * 1024)
+    speed = mb / result["elapsed"]
+    lat = result["latencies"]
+    rss = f"{result['peak_rss'] / (1024 * 1024):6.1f} MB" if result["peak_rss"] else "     —"
+    line = (f"{result['kind']:5s} {result['workers']:3d}  {result['elapsed']:6.2f} s  "
+            f"{speed:6.2f} MB/s  p50 {percentile(lat, 50):5.2f} s  p95 {percentile(lat, 95):5.2f} s  "
+            f"CPU {result['cpu']:5.2f} s ({result['cpu'] / result['elapsed'] * 100:3.0f}%)  "
+            f"RSS {rss}  ({result['ok']}/{result['total']} ok)")
+    if baseline:
+        old = baseline["bytes"] / (1024 * 1024) / baseline["elapsed"]
+        line += f"  {(speed / old - 1) * 100:+5.1f}% vs base"
+    print(line)
+
+
+def git_commit():
+    proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                          capture_output=True, text=True)
+    return proc.stdout.strip() or None
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        return child(int(sys.argv[2]), sys.argv[3:])
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--kinds", default="mp4,hls,dash")
+    parser.add_argument("--levels", default="1,2,4,8")
+    parser.add_argument("--videos", type=int, default=12)
+    parser.add_argument("--size-mb", type=float, default=2)
+    parser.add_argument("--segments", type=int, default=20)
+    parser.add_argument("--bandwidth", default="4M",
+                        help="bytes/s por conexión (0 = sin límite)")
+    parser.add_argument("--latency-ms", type=int, default=20)
+    parser.add_argument("--json", metavar="FICHERO", help="guarda los resultados")
+    parser.add_argument("--baseline", metavar="FICHERO",
+                        help="compara con los resultados guardados de otra ejecución")
+    args = parser.parse_args()
+
+    from yt_dlp.utils import parse_bytes
+    from fixture_server import FixtureServer
+
+    bandwidth = parse_bytes(args.bandwidth) if args.bandwidth != "0" else None
+    params = {"videos": args.videos, "size_mb": args.size_mb, "segments": args.segments,
+              "bandwidth": bandwidth, "latency_ms": args.latency_ms}
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved["params"] != params:
+            print(f"⚠️  La base usa otros parámetros: {saved['params']}")
+        baseline = {(r["kind"], r["workers"]): r for r in saved["results"]}
+        print(f"Base: {args.baseline} (commit {saved.get('commit') or '?'})")
+
+    results = []
+    size = int(args.size_mb * 1024 * 1024)
+    with FixtureServer(videos=args.videos, size=size, segments=args.segments,
+                       latency=args.latency_ms / 1000, bandwidth=bandwidth) as srv:
+        print(f"{args.videos} video(s) de {args.size_mb} MB, "
+              f"{format(bandwidth / (1024 * 1024), '.1f') + ' MB/s' if bandwidth else 'sin límite'} "
+              f"por conexión, {args.latency_ms} ms de latencia")
+        for kind in args.kinds.split(","):
+            urls = [srv.url(kind, i) for i in range(args.videos)]
+            for n in (int(x) for x in args.levels.split(",")):
+                result = run(kind, n, urls)
+                results.append(result)
+                report(result, baseline.get((kind, n)))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"commit": git_commit(), "date": datetime.now().isoformat(timespec="seconds"),
+                       "python": sys.version.split()[0], "params": params, "results": results},
+                      f, indent=2)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Benchmark de arranque: modo --batch (sin Tk), imports de la GUI y tiempo
+hasta que la ventana es interactiva.
+
+    python benchmarks/bench_startup.py [--runs 10] [--history 0]
+                                       [--json resultados.json] [--baseline anterior.json]
+
+Mide el tiempo de pared de un intérprete nuevo en cada caso y, con
+`-X importtime`, los módulos que más pesan en cada camino.
+
+El caso "ventana" crea la app de verdad (necesita display; en Linux sin
+pantalla: `xvfb-run python ...`) con una copia de los módulos en una carpeta
+temporal, así no toca el historial ni la cola reales. `--history N` la
+arranca con un historial de N descargas. Se desglosa cada fase desde que
+arranca el intérprete: importar el módulo, la GUI (customtkinter), ventana
+pintada (interactiva), paneles de abajo y precarga de yt-dlp e historial.
+
+Con `--json` se guardan los resultados junto al commit actual y con
+`--baseline` se comparan con los de otra ejecución.
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+MODULES = ("video_downloader.py", "downloader_core.py", "download_queue.py")
+
+CASES = {
+    # Lo que paga `video_downloader.py --batch ...` antes de la primera descarga
+    "headless": "import video_downloader; import yt_dlp",
+    # Lo que paga la GUI antes de crear la ventana (yt-dlp llega después, en un hilo)
+    "gui":      "import video_downloader; import tkinter; import customtkinter",
+}
+
+# Proceso hijo del caso "ventana": imprime los segundos de cada fase en JSON
+WINDOW_CODE = """
+import json, time
+t0 = time.perf_counter()
+import video_downloader as vd
+phases = {"modulo": time.perf_counter() - t0}
+vd._load_gui()
+phases["gui"] = time.perf_counter() - t0
+app = vd.VideoDownloaderApp()
+offset = phases["gui"]
+app.window.update()
+phases["interactiva"] = time.perf_counter() - t0
+
+def done():
+    if not app.ready.is_set():
+        app.window.after(5, done)
+        return
+    phases.update({k: offset + v for k, v in app.startup.items()})
+    print(json.dumps(phases))
+    app.window.destroy()
+
+app.window.after(0, done)
+app.window.mainloop()
+"""
+PHASES = ("modulo", "gui", "ventana", "interactiva", "paneles", "yt_dlp", "historial")
+
+
+def _run(code, importtime=False, cwd=ROOT, env=None):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", code]
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, env=env)
+    return time.perf_counter() - t0, proc
+
+
+def top_imports(stderr, n=8):
+    """Módulos de primer nivel con más tiempo acumulado (µs)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumul_us, name = line[len("import time:"):].split("|")
+        # Sin sangría = import de primer nivel (los anidados llevan espacios)
+        if not name[1:].startswith(" "):
+            rows.append((int(cumul_us), name.strip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def _seed_history(path, entries):
+    sys.path.insert(0, str(path.parent))
+    from downloader_core import DownloadHistory
+
+    DownloadHistory(path, legacy_json=None).close()     # Crea el esquema actual
+    db = sqlite3.connect(str(path))
+    with db:
+        db.executemany(
+            "INSERT INTO downloads (url, url_key, extractor, video_id, title, uploader, duration, date) "
+            "VALUES (?, ?, 'Youtube', ?, ?, 'canal', 60, '2024-01-01 00:00')",
+            ((f"https://www.youtube.com/watch?v=vid{i:08d}", f"youtube.com/watch?v=vid{i:08d}",
+              f"vid{i:08d}", f"Video {i}") for i in range(entries)))
+    db.close()
+
+
+def window_case(runs, history):
+    """Mediana de cada fase del caso "ventana" (o None si no hay display)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in MODULES:
+            shutil.copy(ROOT / name, tmp)
+        if history:
+            _seed_history(Path(tmp) / "download_history.db", history)
+        env = dict(os.environ, HOME=tmp)        # ~/Downloads/MisVideos también temporal
+
+        samples = []
+        for _ in range(runs):
+            _, proc = _run(WINDOW_CODE, cwd=tmp, env=env)
+            if proc.returncode != 0:
+                missing = (proc.stderr.strip().splitlines() or ["?"])[-1]
+                print(f"{'ventana':9s} omitido: {missing}")
+                return None
+            samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        phases = {p: statistics.median(s[p] for s in samples) for p in PHASES if p in samples[0]}
+        print(f"{'ventana':9s} interactiva en {phases['interactiva'] * 1000:7.1f} ms  "
+              f"(n={runs}, historial de {history} descarga(s))")
+        for phase in PHASES:
+            if phase in phases:
+                print(f"    {phases[phase] * 1000:7.1f} ms  {phase}")
+
+        _, proc = _run(WINDOW_CODE, importtime=True, cwd=tmp, env=env)
+        for cumul_us, mod in top_imports(proc.stderr):
+            print(f"    {cumul_us / 1000:7.1f} ms  import {mod}")
+    return phases
+
+
+def git_commit():
+    proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                          capture_output=True, text=True)
+    return proc.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--history", type=int, default=0,
+                        help="descargas en el historial del caso ventana")
+    parser.add_argument("--json", metavar="FICHERO", help="guarda los resultados")
+    parser.add_argument("--baseline", metavar="FICHERO",
+                        help="compara con los resultados guardados de otra ejecución")
+    args = parser.parse_args()
+
+    results = {}
+    for name, code in CASES.items():
+        elapsed, proc = _run(code)
+        if proc.returncode != 0:
+            missing = proc.stderr.strip().splitlines()[-1]
+            print(f"{name:9s} omitido: {missing}")
+            continue
+        times = [elapsed] + [_run(code)[0] for _ in range(args.runs - 1)]
+        results[name] = statistics.median(times)
+        print(f"{name:9s} mediana {results[name] * 1000:7.1f} ms  "
+              f"(min {min(times) * 1000:.1f}, max {max(times) * 1000:.1f}, n={args.runs})")
+
+        _, proc = _run(code, importtime=True)
+        for cumul_us, mod in top_imports(proc.stderr):
+            print(f"    {cumul_us / 1000:7.1f} ms  {mod}")
+
+    if "headless" in results and "gui" in results:
+        print(f"\nheadless / gui = {results['headless'] / results['gui']:.0%}\n")
+
+    phases = window_case(args.runs, args.history)
+    if phases:
+        results.update({f"ventana.{phase}": value for phase, value in phases.items()})
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        print(f"\nBase: {args.baseline} (commit {saved.get('commit') or '?'})")
+        for key, value in results.items():
+            old = saved["results"].get(key)
+            if old:
+                print(f"  {key:20s} {old * 1000:7.1f} → {value * 1000:7.1f} ms  "
+                      f"({(value / old - 1) * 100:+5.1f}%)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"commit": git_commit(), "date": datetime.now().isoformat(timespec="seconds"),
+                       "python": sys.version.split()[0], "history": args.history,
+                       "results": results}, f, indent=2)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Latencia del bucle de Tk bajo una avalancha de eventos de progreso.
+
+    python benchmarks/bench_ui_pump.py [--threads 4] [--events 5000]
+
+Compara dos formas de llevar los eventos de los hilos de descarga a la UI:
+
+- directo: un `after(0, ...)` por evento con insert + see en el Text (lo que
+  hacían progress_hook/add_log antes).
+- pump:    UIEventBuffer + un drenado cada PUMP_INTERVAL_MS (lo actual).
+
+Una sonda programada cada 20 ms mide cuánto se retrasa el bucle principal.
+Necesita un display (en Linux sin pantalla: `xvfb-run python ...`).
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+import tkinter as tk
+from pathlib import Path
+from tkinter import ttk
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from video_downloader import PUMP_INTERVAL_MS, UIEventBuffer  # noqa: E402
+
+PROBE_MS = 20
+
+
+def run(mode, n_threads, n_events):
+    root = tk.Tk()
+    bar = ttk.Progressbar(root, maximum=1.0)
+    bar.pack()
+    text = tk.Text(root, height=10)
+    text.pack()
+
+    lateness = []
+    state = {"done_threads": 0, "applied": 0}
+    buffer = UIEventBuffer()
+    lock = threading.Lock()
+
+    def probe(expected):
+        now = time.perf_counter()
+        lateness.append((now - expected) * 1000)
+        root.after(PROBE_MS, probe, now + PROBE_MS / 1000)
+
+    def apply_direct(p, line):
+        bar["value"] = p
+        text.insert("end", line + "\n")
+        text.see("end")
+        state["applied"] += 1
+
+    def pump():
+        logs, progress, _, _ = buffer.drain()
+        if logs:
+            text.insert("end", "\n".join(line for _, line, _ in logs) + "\n")
+            text.see("end")
+            state["applied"] += len(logs)
+        for p in progress.values():
+            bar["value"] = p
+        root.after(PUMP_INTERVAL_MS, pump)
+
+    def producer(tid):
+        for i in range(n_events):
+            p = i / n_events
+            line = f"[#{tid}] Descargando: {p * 100:5.1f}% - Velocidad: 12.3MiB/s"
+            if mode == "directo":
+                root.after(0, apply_direct, p, line)
+            else:
+                buffer.progress(tid, p)
+                buffer.log(line)
+        with lock:
+            state["done_threads"] += 1
+
+    total = n_threads * n_events
+
+    def check_finished():
+        if state["done_threads"] == n_threads and state["applied"] >= total:
+            root.quit()
+        else:
+            root.after(10, check_finished)
+
+    t0 = time.perf_counter()
+    for tid in range(n_threads):
+        threading.Thread(target=producer, args=(tid,), daemon=True).start()
+    if mode == "pump":
+        pump()
+    root.after(PROBE_MS, probe, time.perf_counter() + PROBE_MS / 1000)
+    check_finished()
+    root.mainloop()
+    elapsed = time.perf_counter() - t0
+    root.destroy()
+    return elapsed, lateness
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--events", type=int, default=5000, help="eventos por hilo")
+    args = parser.parse_args()
+
+    try:
+        tk.Tk().destroy()
+    except tk.TclError as e:
+        sys.exit(f"Se necesita un display para este benchmark: {e}")
+
+    total = args.threads * args.events
+    print(f"{args.threads} hilos x {args.events} eventos = {total} eventos\n")
+    for mode in ("directo", "pump"):
+        elapsed, lateness = run(mode, args.threads, args.events)
+        lateness.sort()
+        p95 = lateness[int(len(lateness) * 0.95)] if lateness else 0
+        print(f"{mode:8s} {elapsed:6.2f} s  {total / elapsed:9.0f} ev/s  "
+              f"retraso del bucle: p50 {statistics.median(lateness or [0]):6.1f} ms  "
+              f"p95 {p95:6.1f} ms  max {max(lateness or [0]):6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Coste por elemento de una cola de 50 URLs locales, con y sin YDLPool.
+
+    python benchmarks/bench_ydl_pool.py [--videos 50] [--size-kb 64]
+
+Los videos son pequeños a propósito: lo que se mide es lo que cuesta cada
+elemento aparte de la transferencia (crear el YoutubeDL, inicializar el
+extractor, abrir conexiones). Con cookies de Brave la diferencia es mucho
+mayor, porque sin pool se descifra la base de datos de cookies en cada URL.
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from downloader_core import (  # noqa: E402
+    DownloadEngine, DownloadHistory, FormatDecisions, InfoCache, YDLPool,
+)
+from fixture_server import FixtureServer  # noqa: E402
+
+
+def run(pool, urls):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = DownloadEngine(
+            history=DownloadHistory(Path(tmp) / "history.db", legacy_json=None),
+            info_cache=InfoCache(Path(tmp) / "cache"),
+            formats=FormatDecisions(Path(tmp) / "formats.json"),
+            ydl_pool=pool,
+        )
+        t0 = time.perf_counter()
+        ok = sum(engine.download(url, str(Path(tmp) / "out")) for url in urls)
+        elapsed = time.perf_counter() - t0
+        engine.close()
+        engine.history.close()
+    return elapsed, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--videos", type=int, default=50)
+    parser.add_argument("--size-kb", type=int, default=64)
+    args = parser.parse_args()
+
+    with FixtureServer(videos=args.videos, size=args.size_kb * 1024) as srv:
+        urls = [srv.mp4_url(i) for i in range(args.videos)]
+        run(YDLPool(), urls[:2])    # Calentar imports de yt-dlp
+        for name, pool in (("sin pool", YDLPool(max_idle=0)), ("pool", YDLPool())):
+            elapsed, ok = run(pool, urls)
+            created, reused = pool.stats()
+            print(f"{name:9s} {elapsed:6.2f} s  {elapsed / len(urls) * 1000:7.1f} ms/elemento  "
+                  f"({ok}/{len(urls)} ok, {created} YoutubeDL creados, {reused} reutilizados)")
+
+
+if __name__ == "__main__":
+    main()
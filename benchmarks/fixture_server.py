@@ -0,0 +1,162 @@
+"""
+Servidor HTTP local con medios de prueba para los benchmarks (sin red).
+
+    with FixtureServer(videos=50, size=256 * 1024) as srv:
+        srv.mp4_url(0)      # http://127.0.0.1:PUERTO/v/0.mp4
+        srv.hls_url(0)      # http://127.0.0.1:PUERTO/h/0/v0.m3u8
+        srv.dash_url(0)     # http://127.0.0.1:PUERTO/d/0/v0.mpd
+
+Los videos son bytes deterministas servidos como video/mp4; el extractor
+genérico de yt-dlp los descarga como un archivo directo. Soporta HEAD y
+Range (yt-dlp los usa para reanudar).
+
+Las versiones HLS y DASH parten el mismo payload en `segments` fragmentos
+(.ts y .m4s). Cada petición de medios tarda `latency` segundos en empezar a
+responder (la ida y vuelta a un CDN real), que es lo que esconde la descarga
+concurrente, y con `bandwidth` (bytes/s) cada conexión se sirve como mucho
+a esa velocidad.
+"""
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHUNK = 64 * 1024       # Trozo de escritura cuando se limita el ancho de banda
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_bytes(self, data, content_type, head=False):
+        start, end = 0, len(data) - 1
+        m = re.match(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+        if m and (m.group(1) or m.group(2)):
+            if m.group(1):
+                start = int(m.group(1))
+                end = int(m.group(2)) if m.group(2) else end
+            else:
+                start = len(data) - int(m.group(2))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else:
+            self.send_response(200)
+        body = data[start:end + 1]
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        if head:
+            return
+        bandwidth = self.server.fixture.bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        t0 = time.monotonic()
+        try:
+            for off in range(0, len(body), CHUNK):
+                self.wfile.write(body[off:off + CHUNK])
+                ahead = (off + CHUNK) / bandwidth - (time.monotonic() - t0)
+                if ahead > 0:
+                    time.sleep(ahead)
+        except ConnectionError:
+            self.close_connection = True    # El cliente ya tenía bastante (sondeo)
+
+    def _route(self, head=False):
+        srv = self.server.fixture
+        path = self.path.split("?")[0]
+        m = re.fullmatch(r"/v/(\d+)\.mp4", path)
+        if m and int(m.group(1)) < srv.videos:
+            srv.wait()
+            return self._send_bytes(srv.payload, "video/mp4", head)
+        m = re.fullmatch(r"/h/(\d+)/v\1\.m3u8", path)
+        if m and int(m.group(1)) < srv.videos:
+            return self._send_bytes(srv.playlist.encode(), "application/vnd.apple.mpegurl", head)
+        m = re.fullmatch(r"/d/(\d+)/v\1\.mpd", path)
+        if m and int(m.group(1)) < srv.videos:
+            return self._send_bytes(srv.manifest.encode(), "application/dash+xml", head)
+        m = re.fullmatch(r"/([hd])/(\d+)/(\d+)\.(ts|m4s)", path)
+        if (m and int(m.group(2)) < srv.videos and int(m.group(3)) < srv.segments
+                and (m.group(1), m.group(4)) in (("h", "ts"), ("d", "m4s"))):
+            srv.wait()
+            return self._send_bytes(srv.segment(int(m.group(3))),
+                                    "video/mp2t" if m.group(4) == "ts" else "video/iso.segment", head)
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self._route()
+
+    def do_HEAD(self):
+        self._route(head=True)
+
+
+class FixtureServer:
+    def __init__(self, videos=50, size=256 * 1024, host="127.0.0.1", segments=20, latency=0.0,
+                 bandwidth=None):
+        self.videos = videos
+        self.payload = random.Random(0).randbytes(size)
+        self.segments = segments
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self._seg_size = -(-size // segments)
+        self.playlist = "".join(
+            ["#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:4\n#EXT-X-MEDIA-SEQUENCE:0\n"]
+            + [f"#EXTINF:4.0,\n{k}.ts\n" for k in range(segments)]
+            + ["#EXT-X-ENDLIST\n"]
+        )
+        # Una sola representación con vídeo y audio: no hace falta ffmpeg
+        self.manifest = "".join(
+            ['<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" '
+             f'mediaPresentationDuration="PT{4 * segments}S" minBufferTime="PT2S" '
+             'profiles="urn:mpeg:dash:profile:isoff-live:2011">\n'
+             '<Period><AdaptationSet mimeType="video/mp4" contentType="video">\n'
+             '<Representation id="0" codecs="avc1.4d401f,mp4a.40.2" bandwidth="1000000" '
+             'width="640" height="360">\n<SegmentList duration="4" timescale="1">\n']
+            + [f'<SegmentURL media="{k}.m4s"/>\n' for k in range(segments)]
+            + ['</SegmentList></Representation></AdaptationSet></Period></MPD>\n']
+        )
+        self._httpd = ThreadingHTTPServer((host, 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fixture = self
+        self.base_url = f"http://{host}:{self._httpd.server_address[1]}"
+
+    def mp4_url(self, i):
+        return f"{self.base_url}/v/{i}.mp4"
+
+    def hls_url(self, i):
+        # Nombre distinto por video: yt-dlp saca de él el id y el título
+        return f"{self.base_url}/h/{i}/v{i}.m3u8"
+
+    def dash_url(self, i):
+        return f"{self.base_url}/d/{i}/v{i}.mpd"
+
+    def url(self, kind, i):
+        """URL del video `i` en el formato `kind` ('mp4', 'hls' o 'dash')"""
+        return {"mp4": self.mp4_url, "hls": self.hls_url, "dash": self.dash_url}[kind](i)
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def segment(self, k):
+        return self.payload[k * self._seg_size:(k + 1) * self._seg_size]
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self._httpd.shutdown()
+        self._httpd.server_close()
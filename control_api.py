@@ -0,0 +1,429 @@
+"""
+API HTTP/JSON local para meter URLs en la cola de descargas y seguirla
+desde otros programas. Solo biblioteca estándar (asyncio).
+
+    POST   /jobs            {"url": ..., "options": {...}, "force": false}
+    POST   /jobs/bulk       {"urls": [...], "options": {...}, "force": false}
+    GET    /jobs[?state=pending,running]
+    GET    /jobs/<id>
+    DELETE /jobs/<id>       (o POST /jobs/<id>/cancel)
+    GET    /status
+    GET    /events          Server-Sent Events con cada trabajo que cambia
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from download_queue import PENDING, RUNNING, PROCESSING, DONE, FAILED
+from downloader_core import QUALITIES, es_lista
+
+
+API_HOST = "127.0.0.1"
+API_PORT = 8765
+SNAPSHOT_TTL = 0.25         # Segundos que las consultas comparten la misma foto de la cola
+EVENTS_INTERVAL = 0.5       # Cada cuánto /events manda los trabajos que cambiaron
+EVENTS_KEEPALIVE = 15       # Segundos sin cambios antes de mandar un comentario SSE
+MAX_BODY = 1024 * 1024      # Tamaño máximo de un cuerpo JSON
+MAX_BULK = 10000            # URLs por petición a /jobs/bulk
+
+# Opciones de un trabajo que se aceptan y sus valores válidos (None = texto libre)
+OPTION_CHOICES = {
+    "output_path": None,
+    "quality": QUALITIES,
+    "use_cookies": ("si", "no"),
+}
+LOCAL_HOSTS = {"127.0.0.1", "localhost", "[::1]", "::1"}
+JOB_PATH = re.compile(r"/jobs/(\d+)(/cancel)?")
+
+
+class ApiError(Exception):
+    """Error que se devuelve al cliente como {"error": mensaje} con `status`"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def job_dict(job):
+    """Lo que la API cuenta de un trabajo"""
+    return {
+        "id": job.id,
+        "url": job.url,
+        "state": job.state,
+        "title": job.title,
+        "progress": round(job.progress, 4),
+        "speed": round(job.speed) if job.speed else None,
+        "eta": round(job.eta) if job.eta is not None else None,
+        "size": (job.info or {}).get("size"),
+        "attempts": job.attempts,
+        "cancelled": job.cancelled,
+        "error": job.error,
+        "error_kind": job.error_kind,
+    }
+
+
+class ControlAPI:
+    """
+    Servidor HTTP/JSON en localhost sobre una DownloadQueue ya en uso (la de
+    la GUI o la del modo por lotes) y su DownloadEngine.
+
+    Corre en su propio hilo con un bucle asyncio. Las consultas se sirven de
+    una foto de la cola que se renueva como mucho cada SNAPSHOT_TTL, así
+    cientos de sondeos cuestan lo mismo que uno; lo que toca disco o SQLite
+    (altas, duplicados, cancelaciones) va al pool de hilos del bucle.
+
+    - `defaults()` da las opciones que completan las de cada alta (carpeta,
+      calidad, cookies) o None para dejar que las ponga `queue.start`.
+    - `expand(url, options, force)` expande una playlist (feed_playlist).
+    - `on_enqueue()` se llama tras cada alta (p. ej. para arrancar la cola).
+
+    Solo acepta peticiones a localhost y, en POST, cuerpos application/json:
+    una página web no puede usarla con un formulario ni con DNS rebinding.
+    """
+    def __init__(self, queue, engine, host=API_HOST, port=API_PORT, defaults=None,
+                 expand=None, on_enqueue=None, log=None):
+        self.queue = queue
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.defaults = defaults or (lambda: None)
+        self.expand = expand
+        self.on_enqueue = on_enqueue
+        self.log = log or (lambda msg: None)
+        self.address = None
+        self._loop = None
+        self._thread = None
+        self._started = threading.Event()
+        self._error = None
+        self._snapshot = None           # (momento, {id: job_dict}, estado de la cola)
+
+    # ─────────────────────────────────────────────
+    #  Arranque y parada
+    # ─────────────────────────────────────────────
+
+    def start(self):
+        """Arranca el servidor en su hilo; devuelve (host, puerto) o lanza OSError"""
+        self._thread = threading.Thread(target=self._run, name="control-api", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+        return self.address
+
+    def stop(self):
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        loop = self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            server = loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port))
+        except OSError as e:
+            self._error = e
+            self._started.set()
+            loop.close()
+            return
+        self.address = server.sockets[0].getsockname()[:2]
+        self._started.set()
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            # Las conexiones abiertas (sobre todo /events) no terminan solas
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+
+    # ─────────────────────────────────────────────
+    #  HTTP
+    # ─────────────────────────────────────────────
+
+    async def _handle(self, reader, writer):
+        """Una conexión: peticiones seguidas (keep-alive) hasta que el cliente cierre"""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, query, headers, body = request
+                    self._check_origin(method, headers)
+                    if method == "GET" and path == "/events":
+                        await self._events(writer)
+                        break
+                    status, payload = await self._dispatch(method, path, query, body)
+                except ApiError as e:
+                    await self._send(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._send(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """(método, ruta, query, cabeceras, cuerpo) o None si el cliente cerró"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise ApiError(400, "Petición HTTP no válida")
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise ApiError(400, "Content-Length no válido")
+        if length > MAX_BODY:
+            raise ApiError(413, f"El cuerpo supera {MAX_BODY} bytes")
+        body = await reader.readexactly(length) if length else b""
+        parts = urlsplit(target)
+        return method.upper(), parts.path.rstrip("/") or "/", parse_qs(parts.query), headers, body
+
+    @staticmethod
+    def _check_origin(method, headers):
+        host = headers.get("host", "")
+        host = host.rsplit(":", 1)[0] if not host.endswith("]") else host
+        if host not in LOCAL_HOSTS:
+            raise ApiError(403, "Solo se aceptan peticiones a localhost")
+        if method == "POST" and not headers.get("content-type", "").startswith("application/json"):
+            raise ApiError(415, "El cuerpo debe ser application/json")
+
+    async def _send(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                "Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _dispatch(self, method, path, query, body):
+        loop = asyncio.get_running_loop()
+        if path == "/status":
+            if method != "GET":
+                raise ApiError(405, "Usa GET")
+            return 200, self._status()
+
+        if path == "/jobs":
+            if method == "GET":
+                states = {s for value in query.get("state", []) for s in value.split(",") if s}
+                _, jobs, status = self._snap()
+                jobs = [j for j in jobs.values() if not states or j["state"] in states]
+                return 200, {"jobs": jobs, "status": status}
+            if method == "POST":
+                data = self._json(body)
+                url = self._url(data.get("url"))
+                result = await loop.run_in_executor(
+                    None, self._enqueue, [url], self._options(data), bool(data.get("force")))
+                result = result[0]
+                if "job" in result:
+                    return 201, result
+                return (202 if result.get("playlist") else 409), result
+            raise ApiError(405, "Usa GET o POST")
+
+        if path == "/jobs/bulk":
+            if method != "POST":
+                raise ApiError(405, "Usa POST")
+            data = self._json(body)
+            urls = data.get("urls")
+            if not isinstance(urls, list) or not urls:
+                raise ApiError(400, "'urls' debe ser una lista no vacía")
+            if len(urls) > MAX_BULK:
+                raise ApiError(413, f"Como mucho {MAX_BULK} URLs por petición")
+            urls = [self._url(url) for url in urls]
+            results = await loop.run_in_executor(
+                None, self._enqueue, urls, self._options(data), bool(data.get("force")))
+            added = sum(1 for r in results if "job" in r)
+            return 200, {"added": added, "skipped": len(results) - added, "results": results}
+
+        match = JOB_PATH.fullmatch(path)
+        if match:
+            job_id = int(match.group(1))
+            cancel = (method == "DELETE" and not match.group(2)) or (method == "POST" and match.group(2))
+            if cancel:
+                job = await loop.run_in_executor(None, self.queue.cancel, job_id)
+                self._snapshot = None
+                if job is None:
+                    if self.queue.get(job_id) is None:
+                        raise ApiError(404, f"No existe el trabajo {job_id}")
+                    raise ApiError(409, "El trabajo ya terminó o se está post-procesando")
+                self.log(f"✕ API: cancelado #{job_id}")
+                return 200, {"job": job_dict(job)}
+            if method == "GET" and not match.group(2):
+                job = self._jobs().get(job_id)
+                if job is None:
+                    job = self._jobs(fresh=True).get(job_id)
+                if job is None:
+                    raise ApiError(404, f"No existe el trabajo {job_id}")
+                return 200, {"job": job}
+            raise ApiError(405, "Usa GET o DELETE")
+
+        raise ApiError(404, f"No existe {path}")
+
+    # ─────────────────────────────────────────────
+    #  Peticiones
+    # ─────────────────────────────────────────────
+
+    @staticmethod
+    def _json(body):
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            raise ApiError(400, "JSON no válido")
+        if not isinstance(data, dict):
+            raise ApiError(400, "Se esperaba un objeto JSON")
+        return data
+
+    @staticmethod
+    def _url(url):
+        if not isinstance(url, str) or not url.strip().lower().startswith(("http://", "https://")):
+            raise ApiError(400, f"URL no válida: {url!r}")
+        return url.strip()
+
+    @staticmethod
+    def _options(data):
+        options = data.get("options") or {}
+        if not isinstance(options, dict):
+            raise ApiError(400, "'options' debe ser un objeto")
+        for key, value in options.items():
+            if key not in OPTION_CHOICES:
+                raise ApiError(400, f"Opción desconocida: {key}")
+            choices = OPTION_CHOICES[key]
+            if not isinstance(value, str) or (choices is not None and value not in choices):
+                valid = ", ".join(choices) if choices else "texto"
+                raise ApiError(400, f"Valor no válido para {key} ({valid})")
+        return options
+
+    def _enqueue(self, urls, options, force):
+        """Hilo del pool: da de alta las URLs igual que 'Agregar a Cola'"""
+        defaults = self.defaults()
+        if defaults or options or force:
+            options = {**(defaults or {}), **options}
+            if force:
+                options["force"] = True
+        else:
+            options = None
+        output_path = (options or {}).get("output_path")
+
+        results = []
+        for url in urls:
+            if es_lista(url):
+                if self.expand is None:
+                    results.append({"url": url, "skipped": "no se admiten listas"})
+                    continue
+                threading.Thread(target=self._expand, args=(url, options, force),
+                                 daemon=True).start()
+                results.append({"url": url, "playlist": True})
+                continue
+            if not force and self.engine.history.is_duplicate(url):
+                results.append({"url": url, "skipped": "ya descargado"})
+                continue
+            if not force and output_path and self.engine.in_folder(url, output_path) is not None:
+                results.append({"url": url, "skipped": "ya está en la carpeta"})
+                continue
+            job = self.queue.add(url, options)
+            if job is None:
+                results.append({"url": url, "skipped": "ya en cola"})
+            else:
+                results.append({"url": url, "job": job_dict(job)})
+
+        self._snapshot = None
+        added = sum(1 for r in results if "job" in r)
+        if added:
+            self.log(f"+ API: {added} URL(s) agregada(s) a la cola")
+            if self.on_enqueue:
+                self.on_enqueue()
+        return results
+
+    def _expand(self, url, options, force):
+        # La cola sigue "alimentándose" desde antes de avisar: si on_enqueue
+        # arranca la cola, no la encuentra vacía mientras llega la primera entrada
+        with self.queue.producer():
+            if self.on_enqueue:
+                self.on_enqueue()
+            self.log(f"+ API: expandiendo lista {url[:60]}")
+            self.expand(url, options, force)
+
+    # ─────────────────────────────────────────────
+    #  Estado
+    # ─────────────────────────────────────────────
+
+    def _snap(self, fresh=False):
+        """
+        Foto actual (momento, {id: job_dict}, estado de la cola); se renueva
+        cada SNAPSHOT_TTL. Las altas y cancelaciones la invalidan (None)
+        desde otros hilos, por eso se lee una sola vez en una variable.
+        """
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if fresh or snapshot is None or now - snapshot[0] > SNAPSHOT_TTL:
+            jobs = {job.id: job_dict(job) for job in self.queue.jobs()}
+            counts = dict.fromkeys((PENDING, RUNNING, PROCESSING, DONE, FAILED), 0)
+            for job in jobs.values():
+                counts[job["state"]] += 1
+            fraction, speed, eta = self.queue.progress()
+            status = {
+                "jobs": counts,
+                "total": len(jobs),
+                "running": self.queue.running,
+                "progress": round(fraction, 4),
+                "speed": round(speed) if speed else None,
+                "eta": round(eta) if eta is not None else None,
+            }
+            snapshot = self._snapshot = (now, jobs, status)
+        return snapshot
+
+    def _jobs(self, fresh=False):
+        return self._snap(fresh)[1]
+
+    def _status(self):
+        return self._snap()[2]
+
+    async def _events(self, writer):
+        """SSE: todos los trabajos al conectar y luego solo los que cambian"""
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/event-stream; charset=utf-8\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"Connection: keep-alive\r\n\r\n")
+        last = {}
+        quiet = 0.0
+        while True:
+            _, jobs, status = self._snap()
+            chunks = [_sse("job", job) for job_id, job in jobs.items() if last.get(job_id) != job]
+            chunks += [_sse("removed", {"id": job_id}) for job_id in last.keys() - jobs.keys()]
+            if chunks:
+                chunks.append(_sse("status", status))
+                quiet = 0.0
+            elif quiet >= EVENTS_KEEPALIVE:
+                chunks.append(b": keepalive\n\n")
+                quiet = 0.0
+            last = jobs
+            if chunks:
+                writer.write(b"".join(chunks))
+                await writer.drain()
+            await asyncio.sleep(EVENTS_INTERVAL)
+            quiet += EVENTS_INTERVAL
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
@@ -0,0 +1,574 @@
+"""Cola de descargas concurrente con un pool de workers acotado."""
+import concurrent.futures
+import contextlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from urllib.parse import urlparse
+
+
+QUEUE_DB = Path(__file__).parent / "download_queue.db"
+
+
+# Estados de un trabajo de la cola
+PENDING = "pending"
+RUNNING = "running"
+PROCESSING = "processing"   # Descargado, esperando/en post-procesado
+DONE    = "done"
+FAILED  = "failed"
+
+# Valor que puede devolver un worker para volver a poner el trabajo en espera
+RETRY = "retry"
+
+
+def host_de(url):
+    """Host normalizado de una URL (sin 'www.'), usado para ordenar por sitio"""
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class Job:
+    """Un elemento de la cola con su propio estado"""
+    def __init__(self, job_id, url, key=None, options=None):
+        self.id = job_id
+        self.url = url
+        self.key = key if key is not None else url
+        self.host = host_de(url)
+        self.options = options      # dict con carpeta, calidad, cookies...
+        self.group = self.host      # Grupo para los límites de concurrencia
+        self.state = PENDING
+        self.progress = 0.0         # Fracción de la transferencia (todos los streams)
+        self.speed = None           # bytes/s suavizados, None si no se sabe
+        self.eta = None             # segundos para terminar la transferencia
+        self.title = None
+        self.info = None            # Resumen de metadatos del prefetch (dict)
+        self.prefetch = None        # Future del prefetch en curso
+        self.error = None
+        self.error_kind = None      # Tipo de error del motor ('throttled', ...)
+        self.metrics = None         # Telemetría del último intento (DownloadMetrics)
+        self.attempts = 0
+        self.resumed = False        # Recuperado del diario tras un cierre
+        self.cancelled = False      # Cancelado: el motor corta la descarga en curso
+        self.removed = False        # Quitado de la cola: ya no se avisa de sus cambios
+
+    def __repr__(self):
+        return f"<Job #{self.id} {self.state} {self.url[:40]}>"
+
+
+class QueueJournal:
+    """
+    Diario en SQLite con el estado de cada trabajo de la cola.
+
+    Cada cambio de estado se escribe antes de que el trabajo avance, así que
+    si la app se cierra o se cae, `load()` devuelve exactamente lo que quedaba
+    por hacer. Los trabajos que estaban en curso vuelven como pendientes y
+    yt-dlp continúa sus ficheros .part (mismas opciones = mismo nombre).
+    """
+    def __init__(self, path=QUEUE_DB):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id      INTEGER PRIMARY KEY,
+                url     TEXT NOT NULL,
+                key     TEXT,
+                options TEXT,
+                state   TEXT NOT NULL,
+                title   TEXT,
+                error   TEXT
+            )
+        """)
+        self._db.commit()
+
+    @staticmethod
+    def _dump_key(key):
+        return json.dumps(list(key) if isinstance(key, tuple) else key)
+
+    @staticmethod
+    def _load_key(raw):
+        key = json.loads(raw)
+        return tuple(key) if isinstance(key, list) else key
+
+    def load(self):
+        """
+        Trabajos sin terminar de la sesión anterior, en orden de llegada.
+        Los terminados (completados o fallidos) se borran del diario.
+        """
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM jobs WHERE state IN (?, ?)", (DONE, FAILED))
+                rows = self._db.execute(
+                    "SELECT id, url, key, options, state, title FROM jobs ORDER BY id"
+                ).fetchall()
+        jobs = []
+        for job_id, url, key, options, state, title in rows:
+            job = Job(job_id, url, self._load_key(key),
+                      json.loads(options) if options else None)
+            job.title = title
+            job.resumed = state in (RUNNING, PROCESSING)
+            jobs.append(job)
+        return jobs
+
+    def next_id(self):
+        with self._lock:
+            (last,) = self._db.execute("SELECT MAX(id) FROM jobs").fetchone()
+        return (last or 0) + 1
+
+    def insert(self, job):
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO jobs (id, url, key, options, state, title, error) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job.id, job.url, self._dump_key(job.key),
+                     json.dumps(job.options) if job.options else None,
+                     job.state, job.title, job.error)
+                )
+
+    def update(self, job):
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "UPDATE jobs SET options = ?, state = ?, title = ?, error = ? WHERE id = ?",
+                    (json.dumps(job.options) if job.options else None,
+                     job.state, job.title, job.error, job.id)
+                )
+
+    def delete(self, job_ids):
+        with self._lock:
+            with self._db:
+                self._db.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in job_ids])
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class DownloadQueue:
+    """
+    Cola thread-safe que reparte los trabajos entre varios workers.
+
+    - Los trabajos de un mismo host (o grupo) arrancan en orden de llegada.
+    - `max_per_host` limita cuántos trabajos del mismo host corren a la vez
+      (None = sin límite, solo cuenta `max_workers`).
+    - `key_func(url)` da la clave con la que se detectan URLs repetidas
+      (por defecto la URL tal cual).
+    - `on_change(job)` se llama (desde el hilo del worker) cada vez que un
+      trabajo cambia de estado; `on_finish()` cuando la cola se vacía.
+    - Con `journal` (QueueJournal) la cola sobrevive a cierres: al crearla
+      se recuperan los trabajos sin terminar (ver `restored`).
+    - Con `scheduler` los trabajos se agrupan con `scheduler.group(url)` en
+      vez de por host; `scheduler.limit(grupo)` sustituye a `max_per_host` y
+      mientras `scheduler.wait_time(grupo)` > 0 no arranca ninguno del grupo.
+    - Si el worker devuelve RETRY el trabajo vuelve a quedar en espera.
+    - Si devuelve un Future (p. ej. el post-procesado encolado) el trabajo
+      pasa a PROCESSING, su hueco queda libre y se marca DONE/FAILED cuando
+      el Future termina.
+    - `prefetch(job)` se lanza en un pool de `prefetch_workers` hilos para
+      los `prefetch_ahead` primeros pendientes (p. ej. para extraer sus
+      metadatos mientras otros descargan). Un worker que coge el trabajo
+      espera a que acabe su prefetch en vez de repetir el trabajo.
+    - Mientras haya un `with queue.producer():` abierto (p. ej. expandiendo
+      una playlist) los workers esperan trabajos nuevos en vez de terminar.
+    - Lo que se añade con la cola en marcha arranca más workers si hace
+      falta, hasta `max_workers`, y recibe las `options` de `start` que no
+      traiga (igual que los pendientes al arrancar).
+    """
+    def __init__(self, max_workers=3, max_per_host=None, key_func=None,
+                 on_change=None, on_finish=None, journal=None, scheduler=None,
+                 prefetch=None, prefetch_workers=3, prefetch_ahead=20):
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.key_func = key_func
+        self.on_change = on_change
+        self.on_finish = on_finish
+        self.journal = journal
+        self.scheduler = scheduler
+        self.prefetch = prefetch
+        self.prefetch_ahead = prefetch_ahead
+        self._prefetch_pool = None
+        if prefetch is not None:
+            self._prefetch_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=prefetch_workers, thread_name_prefix="prefetch"
+            )
+
+        self._jobs = []                 # Orden de llegada
+        self._cond = threading.Condition()
+        self._active_groups = {}        # grupo -> trabajos en curso
+        self._workers = 0
+        self._worker = None             # Función de los workers (la de start)
+        self.options = None             # Opciones de start para lo que llegue en marcha
+        self._processing = 0            # Futures de post-procesado sin terminar
+        self._producers = 0
+        self._closing = False           # shutdown(): no se reparten más trabajos
+        self._cut = set()               # ids cortados por shutdown()
+        self._next_id = 1
+
+        self.restored = []
+        if journal is not None:
+            self.restored = journal.load()
+            for job in self.restored:
+                self._set_group(job)
+            self._jobs.extend(self.restored)
+            self._next_id = journal.next_id()
+            self._schedule_prefetch()
+
+    def _set_group(self, job):
+        if self.scheduler is not None:
+            job.group = self.scheduler.group(job.url)
+
+    # ─────────────────────────────────────────────
+    #  Gestión de trabajos
+    # ─────────────────────────────────────────────
+
+    def add(self, url, options=None):
+        """Añade una URL; devuelve el Job o None si ya está pendiente/en curso"""
+        key = self.key_func(url) if self.key_func else url
+        with self._cond:
+            if any(j.key == key and j.state in (PENDING, RUNNING, PROCESSING)
+                   for j in self._jobs):
+                return None
+            if self._workers > 0 and self.options is not None:
+                options = {**self.options, **(options or {})}
+            job = Job(self._next_id, url, key, options)
+            self._set_group(job)
+            self._next_id += 1
+            if self.journal is not None:
+                self.journal.insert(job)
+            self._jobs.append(job)
+            self._cond.notify_all()
+            self._schedule_prefetch()
+            # Con la cola en marcha, el trabajo nuevo no espera a que quede
+            # libre uno de los workers con los que arrancó
+            spawn = 0 < self._workers < self.max_workers
+            if spawn:
+                self._workers += 1
+        self._notify(job)
+        if spawn:
+            self._spawn(1)
+        return job
+
+    def remove(self, job_id):
+        """
+        Quita un trabajo que aún no ha empezado; devuelve el Job o None. Su
+        prefetch se cancela y, si ya estaba en marcha, termina sin avisar.
+        """
+        with self._cond:
+            for i, job in enumerate(self._jobs):
+                if job.id == job_id and job.state not in (RUNNING, PROCESSING):
+                    if self.journal is not None:
+                        self.journal.delete([job.id])
+                    del self._jobs[i]
+                    job.removed = True
+                    if job.prefetch is not None:
+                        job.prefetch.cancel()
+                    self._cond.notify_all()
+                    return job
+        return None
+
+    def cancel(self, job_id):
+        """
+        Cancela un trabajo. Si está en espera pasa a FAILED sin empezar; si
+        está descargando queda marcado y el worker lo corta en el próximo
+        progreso (ver DownloadEngine). Devuelve el Job, o None si no existe
+        o ya había terminado (o está en post-procesado).
+        """
+        with self._cond:
+            job = next((j for j in self._jobs if j.id == job_id), None)
+            if job is None or job.state not in (PENDING, RUNNING):
+                return None
+            job.cancelled = True
+            if job.state == PENDING:
+                job.state = FAILED
+                job.error, job.error_kind = "Cancelada", "cancelled"
+                if self.journal is not None:
+                    self.journal.update(job)
+                self._cond.notify_all()
+        self._notify(job)
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return next((j for j in self._jobs if j.id == job_id), None)
+
+    def clear_finished(self):
+        """Olvida los trabajos terminados (completados o fallidos)"""
+        with self._cond:
+            if self.journal is not None:
+                self.journal.delete([j.id for j in self._jobs if j.state in (DONE, FAILED)])
+            self._jobs = [j for j in self._jobs if j.state in (PENDING, RUNNING, PROCESSING)]
+
+    @contextlib.contextmanager
+    def producer(self):
+        """Marca que se siguen añadiendo trabajos (los workers no terminan)"""
+        with self._cond:
+            self._producers += 1
+        try:
+            yield self
+        finally:
+            with self._cond:
+                self._producers -= 1
+                self._cond.notify_all()
+
+    @property
+    def feeding(self):
+        with self._cond:
+            return self._producers > 0
+
+    def shutdown(self, timeout=None):
+        """
+        Para la cola antes de cerrar la app: no se reparten más trabajos, los
+        que descargan se cortan (Job.cancelled) y se espera a sus workers.
+        Lo que se corta así no se apunta en el diario, que los conserva como
+        en curso: al volver a abrir se reanudan. Los post-procesados ya
+        encolados siguen. Devuelve False si algún worker no terminó a tiempo.
+        """
+        with self._cond:
+            self._closing = True
+            for job in self._jobs:
+                if job.state == RUNNING and not job.cancelled:
+                    job.cancelled = True
+                    self._cut.add(job.id)
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._workers == 0, timeout)
+
+    def close(self):
+        """Cancela los prefetch que aún no han empezado"""
+        if self._prefetch_pool is not None:
+            self._prefetch_pool.shutdown(wait=False, cancel_futures=True)
+
+    def jobs(self):
+        """Copia de la lista de trabajos (para pintar la UI)"""
+        with self._cond:
+            return list(self._jobs)
+
+    def count(self, *states):
+        with self._cond:
+            return sum(1 for j in self._jobs if j.state in states)
+
+    def progress(self):
+        """
+        Progreso de toda la cola: (fracción, bytes/s, ETA en segundos o None).
+        Terminados y fallidos cuentan como completos; el ETA usa los bytes
+        que les quedan a los que descargan más el tamaño de los pendientes
+        cuando el prefetch lo conoce.
+        """
+        with self._cond:
+            jobs = list(self._jobs)
+        if not jobs:
+            return 0.0, None, None
+        done = 0.0
+        speed = 0.0
+        remaining = 0
+        for job in jobs:
+            if job.state == RUNNING:
+                done += job.progress
+                speed += job.speed or 0
+                size = (job.info or {}).get("size")
+                if size:
+                    remaining += size * (1 - job.progress)
+            elif job.state == PENDING:
+                remaining += (job.info or {}).get("size") or 0
+            else:
+                done += 1
+        eta = remaining / speed if speed and remaining else None
+        return done / len(jobs), speed or None, eta
+
+    @property
+    def running(self):
+        with self._cond:
+            return self._workers > 0
+
+    # ─────────────────────────────────────────────
+    #  Ejecución
+    # ─────────────────────────────────────────────
+
+    def start(self, worker, max_workers=None, options=None):
+        """
+        Arranca el pool. `worker(job)` descarga un trabajo y devuelve True si
+        terminó bien. Devuelve False si la cola ya estaba en marcha.
+        `options` completa las opciones de los pendientes; las que ya tenga
+        cada trabajo mandan (los recuperados del diario conservan las de su
+        sesión y, con ellas, el nombre de sus ficheros .part).
+        """
+        with self._cond:
+            if self._workers > 0:
+                return False
+            if max_workers:
+                self.max_workers = max_workers
+            self.options = options
+            if options is not None:
+                for job in self._jobs:
+                    merged = {**options, **(job.options or {})}
+                    if job.state == PENDING and merged != job.options:
+                        job.options = merged
+                        if self.journal is not None:
+                            self.journal.update(job)
+            pending = sum(1 for j in self._jobs if j.state == PENDING)
+            n = self.max_workers if self._producers else max(1, min(self.max_workers, pending))
+            self._workers = n
+            self._worker = worker
+        self._spawn(n)
+        return True
+
+    def _spawn(self, n):
+        # `_workers` ya cuenta los que se lanzan aquí
+        for _ in range(n):
+            threading.Thread(target=self._worker_loop, args=(self._worker,), daemon=True).start()
+
+    def wait(self, timeout=None):
+        """Bloquea hasta que no quede ningún worker ni post-procesado activo"""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._workers == 0 and self._processing == 0, timeout)
+
+    def _claim_next(self):
+        """
+        Llamar con el lock tomado. Devuelve (job, espera): el primer pendiente
+        cuyo grupo tenga hueco o, si no hay, cuántos segundos faltan para que
+        termine la pausa más corta de un grupo (None = esperar a un aviso).
+        """
+        wait = None
+        if self._closing:
+            return None, None
+        for job in self._jobs:
+            if job.state != PENDING:
+                continue
+            active = self._active_groups.get(job.group, 0)
+            if self.scheduler is not None:
+                pause = self.scheduler.wait_time(job.group)
+                if pause > 0:
+                    wait = pause if wait is None else min(wait, pause)
+                    continue
+                limit = self.scheduler.limit(job.group)
+            else:
+                limit = self.max_per_host
+            if limit and active >= limit:
+                continue
+            job.state = RUNNING
+            job.attempts += 1
+            job.error = job.error_kind = None
+            self._active_groups[job.group] = active + 1
+            if self.journal is not None:
+                self.journal.update(job)
+            self._schedule_prefetch()
+            return job, None
+        return None, wait
+
+    def _worker_loop(self, worker):
+        while True:
+            with self._cond:
+                job, wait = self._claim_next()
+                while job is None and not self._closing and (
+                        self._producers or any(j.state == PENDING for j in self._jobs)):
+                    self._cond.wait(wait)
+                    job, wait = self._claim_next()
+                if job is None:
+                    self._workers -= 1
+                    last = self._workers == 0 and self._processing == 0
+                    self._cond.notify_all()
+                    break
+            self._notify(job)
+
+            if job.prefetch is not None:
+                concurrent.futures.wait([job.prefetch])
+            try:
+                result = worker(job)
+            except Exception as e:
+                job.error = str(e)
+                result = False
+
+            handoff = isinstance(result, concurrent.futures.Future)
+            with self._cond:
+                if job.id in self._cut and not handoff and result is not True:
+                    # Cortado por shutdown(): el diario lo sigue dando por en
+                    # curso y se reanuda en la próxima sesión
+                    job.state = PENDING
+                    job.cancelled = False
+                    self._active_groups[job.group] -= 1
+                    self._cond.notify_all()
+                    continue
+                if handoff:
+                    job.state = PROCESSING
+                    self._processing += 1
+                elif result is RETRY:
+                    if job.cancelled:
+                        # Cancelado entre el 429 y la vuelta a la cola
+                        job.state = FAILED
+                        job.error, job.error_kind = "Cancelada", "cancelled"
+                    else:
+                        job.state = PENDING
+                        job.progress = 0.0
+                        job.speed = job.eta = None
+                else:
+                    job.state = DONE if result else FAILED
+                self._active_groups[job.group] -= 1
+                if self.journal is not None:
+                    self.journal.update(job)
+                self._cond.notify_all()
+            self._notify(job)
+            if handoff:
+                result.add_done_callback(lambda f, job=job: self._processed(job, f))
+
+        if last and self.on_finish:
+            self.on_finish()
+
+    def _processed(self, job, future):
+        # Callback del Future devuelto por el worker (hilo del post-procesado)
+        try:
+            ok = future.result()
+        except Exception as e:
+            job.error = str(e)
+            ok = False
+        with self._cond:
+            job.state = DONE if ok else FAILED
+            self._processing -= 1
+            last = self._workers == 0 and self._processing == 0
+            if self.journal is not None:
+                self.journal.update(job)
+            self._cond.notify_all()
+        self._notify(job)
+        if last and self.on_finish:
+            self.on_finish()
+
+    def _schedule_prefetch(self):
+        # Llamar con el lock tomado. Solo se adelantan los próximos pendientes:
+        # con una playlist de miles de videos no se extrae todo de golpe.
+        if self._prefetch_pool is None:
+            return
+        ahead = 0
+        for job in self._jobs:
+            if job.state != PENDING:
+                continue
+            if ahead >= self.prefetch_ahead:
+                break
+            ahead += 1
+            if job.prefetch is None:
+                self._start_prefetch(job)
+
+    def _start_prefetch(self, job):
+        def _run():
+            if job.removed:
+                return
+            try:
+                self.prefetch(job)
+            except Exception:
+                pass
+            if not job.removed:
+                self._notify(job)
+
+        try:
+            job.prefetch = self._prefetch_pool.submit(_run)
+        except RuntimeError:
+            pass                        # Cola cerrada
+
+    def _notify(self, job):
+        if self.on_change:
+            try:
+                self.on_change(job)
+            except Exception:
+                pass
@@ -0,0 +1,2236 @@
+"""
+Motor de descargas sin interfaz gráfica.
+
+La GUI (video_downloader.py), el modo --batch o cualquier otro servicio crean
+un DownloadEngine y se suscriben a sus eventos; el motor nunca toca Tk.
+"""
+import concurrent.futures
+import contextlib
+import csv
+import functools
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+
+
+HISTORY_DB = Path(__file__).parent / "download_history.db"
+HISTORY_FILE = Path(__file__).parent / "download_history.json"     # Formato antiguo
+
+INFO_CACHE_DIR = Path(__file__).parent / "cache" / "info"
+COOKIES_DIR = Path(__file__).parent / "cache" / "cookies"
+FORMATS_FILE = Path(__file__).parent / "cache" / "formats.json"
+# Una rama de formato pasa al final de la cadena tras FORMAT_FAILURE_LIMIT
+# fallos (uno basta si el error es del propio formato/protocolo); pasado
+# FORMAT_REPROBE vuelve a su sitio en la cadena, y sus fallos se olvidan a la semana
+FORMAT_FAILURE_LIMIT = 3
+FORMAT_REPROBE = 6 * 3600
+FORMAT_FAILURE_TTL = 7 * 24 * 3600
+# Errores de descarga que dependen de la rama elegida y no de la red o del disco
+FORMAT_ERRORS = ("drm", "unsupported protocol", "is not supported", "ffmpeg", "requested format",
+                 "codec")
+# Errores locales: no dicen nada del formato
+LOCAL_ERRORS = ("no space left", "errno 28", "permission denied", "read-only file system",
+                "disk quota")
+# Las URLs de los formatos que devuelve extract_info caducan (YouTube ~6 h),
+# así que la caché de metadatos es corta.
+INFO_CACHE_TTL = 20 * 60
+
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-us,en;q=0.5',
+    'Sec-Fetch-Mode': 'navigate',
+}
+
+QUALITIES = ["best", "720p", "480p", "360p"]
+
+# Fragmentos HLS/DASH que se descargan a la vez, por plataforma. Los CDN de
+# YouTube/Facebook/Twitter aguantan bien varios; TikTok e Instagram sirven
+# casi siempre un MP4 directo y se enfadan antes.
+PLATFORM_FRAGMENTS = {
+    'youtube': 8,
+    'facebook': 6,
+    'twitter': 6,
+    'tiktok': 2,
+    'instagram': 2,
+    'other': 4,
+}
+
+DOWNLOADERS = ["auto", "native", "aria2c"]
+
+# Con aria2c: varias conexiones por archivo para HTTP directo y DASH. HLS se
+# queda en el descargador nativo (descifra AES-128 y respeta byte ranges).
+ARIA2C_PROTOCOLS = {'default': 'native', 'http': 'aria2c', 'dash': 'aria2c'}
+ARIA2C_ARGS = ['--max-connection-per-server=8', '--split=8', '--min-split-size=1M',
+               '--console-log-level=warn', '--summary-interval=0']
+
+
+@functools.lru_cache(maxsize=None)
+def aria2c_disponible():
+    return shutil.which("aria2c") is not None
+
+
+class MyLogger:
+    """Logger personalizado para yt-dlp"""
+    def __init__(self, log_callback):
+        self.log_callback = log_callback
+
+    def debug(self, msg):
+        if msg.startswith('[debug] '):
+            pass
+        else:
+            self.info(msg)
+
+    def info(self, msg):
+        self.log_callback(msg)
+
+    def warning(self, msg):
+        self.log_callback(f"⚠️ {msg}")
+
+    def error(self, msg):
+        self.log_callback(f"✗ {msg}")
+
+
+# ─────────────────────────────────────────────
+#  Detección de plataforma y opciones de yt-dlp
+# ─────────────────────────────────────────────
+
+def detectar_plataforma(url):
+    url_lower = url.lower()
+    if 'facebook.com' in url_lower or 'fb.watch' in url_lower:
+        return 'facebook'
+    elif 'tiktok.com' in url_lower:
+        return 'tiktok'
+    elif 'youtube.com' in url_lower or 'youtu.be' in url_lower:
+        return 'youtube'
+    elif 'instagram.com' in url_lower:
+        return 'instagram'
+    elif 'twitter.com' in url_lower or 'x.com' in url_lower:
+        return 'twitter'
+    return 'other'
+
+
+def select_format(quality, plataforma):
+    """Devuelve (selector de formato, descripción para el log)"""
+    if quality == "best":
+        if plataforma == 'youtube':
+            return ('bestvideo[height<=2160][protocol^=https]+bestaudio[protocol^=https]/best[height<=2160]/bestvideo+bestaudio/best',
+                    "YouTube optimizado (hasta 4K)")
+        return 'bestvideo+bestaudio/best', "Mejor calidad disponible"
+    elif quality in ("720p", "480p", "360p"):
+        h = quality[:-1]
+        return f'bestvideo[height<={h}]+bestaudio/best[height<={h}]', quality
+    return None, None
+
+
+def build_ydl_opts(url, output_path, quality, use_cookies, log, progress_hook, cookiefile=None,
+                   fragments=None, downloader="auto"):
+    """
+    Opciones de yt-dlp para una descarga. Devuelve (ydl_opts, plataforma).
+    Con `cookiefile` (instantánea de BrowserCookies) no se lee el navegador.
+    `fragments` fija los fragmentos simultáneos (por defecto los de
+    PLATFORM_FRAGMENTS) y `downloader` es 'auto' (aria2c si está instalado),
+    'native' o 'aria2c'.
+    """
+    plataforma = detectar_plataforma(url)
+    log(f"→ Plataforma detectada: {plataforma.upper()}")
+
+    ydl_opts = {
+        'outtmpl': os.path.join(output_path, '%(title)s [%(uploader)s].%(ext)s'),
+        'logger': MyLogger(log),
+        'progress_hooks': [progress_hook],
+        'merge_output_format': 'mp4',
+        'http_headers': dict(HTTP_HEADERS),
+        'extractor_retries': 3,
+        'fragment_retries': 10,
+        'concurrent_fragment_downloads': fragments or PLATFORM_FRAGMENTS.get(plataforma, 4),
+        'continuedl': True,         # Reanuda los .part (cola recuperada tras un cierre)
+        'skip_unavailable_fragments': True,
+        'ignoreerrors': False,
+        'nocheckcertificate': False,
+    }
+
+    if use_cookies == "si":
+        log("→ Usando cookies de Brave...")
+        if cookiefile:
+            ydl_opts['cookiefile'] = cookiefile
+        else:
+            ydl_opts['cookiesfrombrowser'] = ('brave',)
+
+    if downloader == "aria2c" and not aria2c_disponible():
+        log("⚠️ aria2c no está instalado, se usa el descargador nativo")
+    elif downloader == "aria2c" or (downloader == "auto" and aria2c_disponible()):
+        ydl_opts['external_downloader'] = dict(ARIA2C_PROTOCOLS)
+        ydl_opts['external_downloader_args'] = {'aria2c': list(ARIA2C_ARGS)}
+        log("→ Descargador: aria2c (HTTP/DASH), nativo (HLS)")
+
+    fmt, desc = select_format(quality, plataforma)
+    if fmt:
+        ydl_opts['format'] = fmt
+        log(f"→ Formato: {desc}")
+
+    if plataforma == 'facebook':
+        log("→ Aplicando optimizaciones para Facebook...")
+        ydl_opts['extractor_args'] = {'facebook': {'logged_in_tab': False}}
+    elif plataforma == 'instagram':
+        log("→ Aplicando optimizaciones para Instagram...")
+        if use_cookies != "si":
+            log("  ⚠️ Consejo: Usa cookies para mejor compatibilidad")
+
+    return ydl_opts, plataforma
+
+
+# Extractores de yt-dlp que se prueban primero según detectar_plataforma
+PLATFORM_EXTRACTORS = {
+    'youtube':   ('Youtube', 'YoutubeTab'),
+    'tiktok':    ('TikTok', 'TikTokVM', 'TikTokUser'),
+    'instagram': ('Instagram', 'InstagramIOS'),
+    'twitter':   ('Twitter',),
+    'facebook':  ('Facebook', 'FacebookReel'),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _extractor_classes(plataforma):
+    """Clases de extractor para una plataforma ('other' = todas menos Generic)"""
+    from yt_dlp.extractor import gen_extractor_classes, get_info_extractor
+
+    if plataforma in PLATFORM_EXTRACTORS:
+        return tuple(get_info_extractor(key) for key in PLATFORM_EXTRACTORS[plataforma])
+    return tuple(ie for ie in gen_extractor_classes() if ie.ie_key() != 'Generic')
+
+
+@functools.lru_cache(maxsize=4096)
+def video_key(url):
+    """
+    (extractor, id del video) sin usar la red, con las mismas expresiones que
+    usa yt-dlp (`suitable` / `_match_id`). Así youtu.be/X y
+    youtube.com/watch?v=X&t=10 dan la misma clave. None si no se reconoce.
+    """
+    try:
+        plataforma = detectar_plataforma(url)
+        candidates = _extractor_classes(plataforma)
+        if plataforma != 'other':
+            candidates += _extractor_classes('other')
+        for ie in candidates:
+            if ie.suitable(url):
+                video_id = ie.get_temp_id(url)
+                return (ie.ie_key(), str(video_id)) if video_id else None
+    except Exception:
+        pass
+    return None
+
+
+# Extractores "any" que en la práctica siempre devuelven listas (canales, playlists)
+LIST_EXTRACTORS = {'YoutubeTab'}
+
+
+@functools.lru_cache(maxsize=1024)
+def es_lista(url):
+    """
+    True si la URL es de una playlist/canal según el extractor de yt-dlp que
+    la reconoce, sin usar la red. Las dudosas (p. ej. carruseles de
+    Instagram) se tratan como un solo video.
+    """
+    try:
+        plataforma = detectar_plataforma(url)
+        candidates = _extractor_classes(plataforma)
+        if plataforma != 'other':
+            candidates += _extractor_classes('other')
+        for ie in candidates:
+            if ie.suitable(url):
+                return ie.ie_key() in LIST_EXTRACTORS or ie._RETURN_TYPE == 'playlist'
+    except Exception:
+        pass
+    return False
+
+
+def dedup_key(url):
+    """Clave para detectar duplicados: (extractor, id) o la URL normalizada"""
+    return video_key(url) or ("url", normalize_url(url))
+
+
+def classify_error(error_msg):
+    """Tipo de error de yt-dlp: 'throttled', 'cookies', 'unavailable' u 'other'"""
+    lower = error_msg.lower()
+    # Va antes que 'cookies': yt-dlp suele añadir "use --cookies" a los 429/403
+    if any(s in lower for s in ("http error 429", "too many requests", "http error 403", "rate-limit")):
+        return "throttled"
+    if "cookie" in lower or "could not copy" in lower:
+        return "cookies"
+    elif "Cannot parse data" in error_msg or "Unsupported URL" in error_msg:
+        return "unavailable"
+    return "other"
+
+
+def format_duration(duration, sep=" "):
+    """'3m 07s' a partir de segundos ('' si no hay duración)"""
+    if not duration:
+        return ""
+    m, s = divmod(int(duration), 60)
+    return f"{m}m{sep}{s:02d}s"
+
+
+def format_bytes(size):
+    """'45.2 MB' ('' si no se conoce el tamaño)"""
+    if not size:
+        return ""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def info_summary(info, selected=None):
+    """
+    Resumen de un info dict para la cola: título, autor, duración, formato
+    elegido y tamaño (exacto o aproximado). `selected` es el formato que
+    elegiría la descarga (con 'requested_formats' si son video+audio).
+    """
+    selected = selected or info
+    parts = selected.get('requested_formats') or [selected]
+    size = 0
+    for f in parts:
+        n = f.get('filesize') or f.get('filesize_approx')
+        if not n and f.get('tbr') and info.get('duration'):
+            n = f['tbr'] * 1000 / 8 * info['duration']
+        if not n:
+            size = None
+            break
+        size += n
+
+    height = selected.get('height') or max((f.get('height') or 0 for f in parts), default=0)
+    ext = selected.get('ext')
+    if height:
+        fmt = f"{height}p {ext}" if ext else f"{height}p"
+    else:
+        fmt = ext or selected.get('format_id')
+
+    return {
+        'title': info.get('title'),
+        'uploader': info.get('uploader'),
+        'duration': info.get('duration'),
+        'format': fmt or None,
+        'size': int(size) if size else None,
+    }
+
+
+# ─────────────────────────────────────────────
+#  Historial
+# ─────────────────────────────────────────────
+
+def normalize_url(url):
+    """Forma canónica simple de una URL para comparar duplicados"""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port:
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    query = f"?{parts.query}" if parts.query else ""
+    return f"{host}{path}{query}"
+
+
+class DownloadHistory:
+    """
+    Historial de descargas en SQLite (thread-safe).
+
+    Solo se añaden filas, sin límite de entradas. La URL normalizada y el par
+    (extractor, id del video) están indexados y además se guardan en memoria,
+    así `is_duplicate` no depende del tamaño del historial. Esas claves se
+    leen en el primer uso (o con `preload()` desde otro hilo), no al abrir:
+    con un historial grande abrirlo no retrasa el arranque. El antiguo
+    download_history.json se importa automáticamente la primera vez.
+    """
+    def __init__(self, path=HISTORY_DB, legacy_json=HISTORY_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                id        INTEGER PRIMARY KEY,
+                url       TEXT NOT NULL,
+                url_key   TEXT NOT NULL,
+                extractor TEXT,
+                video_id  TEXT,
+                title     TEXT,
+                uploader  TEXT,
+                duration  REAL,
+                date      TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_downloads_url_key ON downloads (url_key);
+            CREATE INDEX IF NOT EXISTS idx_downloads_video ON downloads (extractor, video_id);
+            CREATE TABLE IF NOT EXISTS metrics (
+                id                INTEGER PRIMARY KEY,
+                url               TEXT NOT NULL,
+                platform          TEXT,
+                date              TEXT,
+                ok                INTEGER,
+                error_kind        TEXT,
+                t_cookies         REAL,
+                t_extract         REAL,
+                t_transfer        REAL,
+                t_postproc        REAL,
+                t_total           REAL,
+                bytes             INTEGER,
+                avg_speed         REAL,
+                peak_speed        REAL,
+                retries           INTEGER,
+                fragment_failures INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_metrics_platform ON metrics (platform);
+        """)
+        if legacy_json is not None:
+            self._migrate_json(Path(legacy_json))
+
+        self._url_keys = None
+        self._video_keys = None
+
+    def _migrate_json(self, json_path):
+        """Importa el historial JSON antiguo y lo renombra a .json.bak"""
+        if not json_path.exists():
+            return
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception:
+            return
+        rows = []
+        for h in reversed(entries):     # El JSON guardaba la más reciente primero
+            extractor, video_id = video_key(h["url"]) or (None, None)
+            rows.append((h["url"], normalize_url(h["url"]), extractor, video_id,
+                         h.get("title"), h.get("uploader"), h.get("duration"), h.get("date")))
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO downloads (url, url_key, extractor, video_id, title, uploader, duration, date) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+        json_path.replace(json_path.with_name(json_path.name + ".bak"))
+
+    def _keys(self):
+        """(claves de URL, claves de video) en memoria; se cargan una sola vez"""
+        with self._lock:
+            if self._url_keys is None:
+                url_keys, video_keys = set(), set()
+                for row in self._db.execute("SELECT url_key, extractor, video_id FROM downloads"):
+                    url_keys.add(row["url_key"])
+                    if row["video_id"]:
+                        video_keys.add((row["extractor"], row["video_id"]))
+                self._url_keys, self._video_keys = url_keys, video_keys
+            return self._url_keys, self._video_keys
+
+    def preload(self):
+        """Carga ya las claves de duplicados (p. ej. en un hilo tras abrir la ventana)"""
+        self._keys()
+
+    def add(self, url, title, uploader, duration, extractor=None, video_id=None):
+        entry = {
+            "url": url,
+            "title": title,
+            "uploader": uploader,
+            "duration": duration,
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M")
+        }
+        url_key = normalize_url(url)
+        if not video_id:
+            extractor, video_id = video_key(url) or (None, None)
+        self._keys()
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO downloads (url, url_key, extractor, video_id, title, uploader, duration, date) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (url, url_key, extractor, video_id, title, uploader, duration, entry["date"])
+                )
+            self._url_keys.add(url_key)
+            if video_id:
+                self._video_keys.add((extractor, video_id))
+        return entry
+
+    def is_duplicate(self, url, extractor=None, video_id=None):
+        """Comprueba si la URL (o el mismo video con otra URL) ya se descargó"""
+        if not video_id:
+            extractor, video_id = video_key(url) or (None, None)
+        url_keys, video_keys = self._keys()
+        if video_id and (extractor, video_id) in video_keys:
+            return True
+        return normalize_url(url) in url_keys
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM downloads").fetchone()[0]
+
+    def entries(self, limit=None):
+        """Entradas como dicts, la más reciente primero"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT url, title, uploader, duration, date FROM downloads "
+                "ORDER BY id DESC LIMIT ?", (-1 if limit is None else limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _search_where(query):
+        """WHERE de una búsqueda: cada palabra debe estar en el título, el autor o la URL"""
+        words = (query or "").split()
+        if not words:
+            return "", []
+        clauses, params = [], []
+        for word in words:
+            pattern = "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            clauses.append("(title LIKE ? ESCAPE '\\' OR uploader LIKE ? ESCAPE '\\' "
+                           "OR url LIKE ? ESCAPE '\\')")
+            params += [pattern] * 3
+        return "WHERE " + " AND ".join(clauses), params
+
+    def count(self, query=None):
+        """Número de entradas que coinciden con `query` (todas si es None)"""
+        where, params = self._search_where(query)
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM downloads {where}", params).fetchone()[0]
+
+    def search(self, query=None, offset=0, limit=100):
+        """Una página de entradas que coinciden con `query`, la más reciente primero"""
+        where, params = self._search_where(query)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT url, title, uploader, duration, date FROM downloads {where} "
+                "ORDER BY id DESC LIMIT ? OFFSET ?", params + [limit, offset]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def add_metrics(self, metrics):
+        """Guarda la telemetría de un intento (dict de DownloadMetrics.as_dict)"""
+        cols = ", ".join(METRICS_FIELDS)
+        marks = ", ".join("?" * len(METRICS_FIELDS))
+        with self._lock:
+            with self._db:
+                self._db.execute(f"INSERT INTO metrics ({cols}) VALUES ({marks})",
+                                 [metrics[f] for f in METRICS_FIELDS])
+
+    def metrics(self, limit=None):
+        """Telemetría como dicts, la más reciente primero"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(METRICS_FIELDS)} FROM metrics "
+                "ORDER BY id DESC LIMIT ?", (-1 if limit is None else limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def metrics_summary(self):
+        """Resumen por plataforma: intentos, medias por fase, bytes y velocidades"""
+        with self._lock:
+            rows = self._db.execute("""
+                SELECT platform,
+                       COUNT(*)                AS attempts,
+                       SUM(ok)                 AS ok,
+                       AVG(t_cookies)          AS t_cookies,
+                       AVG(t_extract)          AS t_extract,
+                       AVG(t_transfer)         AS t_transfer,
+                       AVG(t_postproc)         AS t_postproc,
+                       AVG(t_total)            AS t_total,
+                       SUM(bytes)              AS bytes,
+                       SUM(bytes) / NULLIF(SUM(t_transfer), 0) AS avg_speed,
+                       MAX(peak_speed)         AS peak_speed,
+                       SUM(retries)            AS retries,
+                       SUM(fragment_failures)  AS fragment_failures
+                FROM metrics GROUP BY platform ORDER BY SUM(t_total) DESC
+            """).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ─────────────────────────────────────────────
+#  Telemetría de descargas
+# ─────────────────────────────────────────────
+
+METRICS_FIELDS = (
+    "url", "platform", "date", "ok", "error_kind",
+    "t_cookies", "t_extract", "t_transfer", "t_postproc", "t_total",
+    "bytes", "avg_speed", "peak_speed", "retries", "fragment_failures",
+)
+
+
+class DownloadMetrics:
+    """
+    Telemetría de un intento de descarga, alimentada por los hooks y el
+    logger de yt-dlp: segundos en cada fase (cookies, extracción,
+    transferencia, post-procesado), bytes transferidos, velocidad media y
+    pico, reintentos y fragmentos fallidos.
+
+    extract_info hace extracción y transferencia de una vez: lo que pasa
+    antes del primer hook 'downloading' de cada formato cuenta como
+    extracción y lo que va de ahí a su 'finished', como transferencia.
+    """
+    def __init__(self, url, platform, retries=0):
+        self.url = url
+        self.platform = platform
+        self.date = datetime.now().strftime("%Y-%m-%d %H:%M")
+        self.ok = False
+        self.error_kind = None
+        self.t_cookies = self.t_extract = self.t_transfer = self.t_postproc = 0.0
+        self.t_total = 0.0
+        self.bytes = 0
+        self.peak_speed = 0.0
+        self.retries = retries              # Reintentos de la cola (429/403...)
+        self.fragment_failures = 0
+        self._start = time.monotonic()
+        self._mark = None                   # Inicio de la extracción en curso
+        self._transfer = None               # (inicio, bytes ya en disco)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """`with metrics.phase('t_cookies'):` suma la duración del bloque"""
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            setattr(self, name, getattr(self, name) + time.monotonic() - t0)
+
+    def start_extract(self):
+        self._mark = time.monotonic()
+
+    def stop_extract(self):
+        """Cierra la fase abierta al volver de extract_info (o al fallar)"""
+        now = time.monotonic()
+        if self._transfer is not None:
+            self.t_transfer += now - self._transfer[0]
+            self._transfer = None
+        elif self._mark is not None:
+            self.t_extract += now - self._mark
+        self._mark = None
+
+    def hook(self, d):
+        now = time.monotonic()
+        if d['status'] == 'downloading':
+            if self._transfer is None:
+                if self._mark is not None:
+                    self.t_extract += now - self._mark
+                    self._mark = None
+                # Lo que ya había en disco (.part reanudado) no se transfiere
+                self._transfer = (now, d.get('downloaded_bytes') or 0)
+            self.peak_speed = max(self.peak_speed, d.get('speed') or 0)
+        elif d['status'] == 'finished' and self._transfer is not None:
+            start, offset = self._transfer
+            self._transfer = None
+            self.t_transfer += now - start
+            size = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            self.bytes += max(size - offset, 0)
+            self._mark = now
+
+    def observe(self, msg):
+        """Cuenta reintentos y fragmentos fallidos en los mensajes de yt-dlp"""
+        if "Retrying fragment" in msg or "Skipping fragment" in msg:
+            self.fragment_failures += 1
+        elif "Retrying (" in msg:
+            self.retries += 1
+
+    def finish(self, ok, error_kind=None):
+        self.stop_extract()
+        self.ok = ok
+        self.error_kind = error_kind
+        self.t_total = time.monotonic() - self._start
+
+    def as_dict(self):
+        d = {f: getattr(self, f) for f in METRICS_FIELDS if hasattr(self, f)}
+        d["ok"] = int(self.ok)
+        d["avg_speed"] = self.bytes / self.t_transfer if self.t_transfer else None
+        for f in ("t_cookies", "t_extract", "t_transfer", "t_postproc", "t_total"):
+            d[f] = round(d[f], 3)
+        return d
+
+
+class ProgressAggregator:
+    """
+    Progreso de una descarga sumando todos sus streams. Con
+    'bestvideo+bestaudio' yt-dlp baja cada formato por separado y sus hooks
+    empiezan de 0 cada vez; aquí se cuentan los bytes de cada formato de
+    info_dict['requested_formats'] (total_bytes, o si no total_bytes_estimate
+    / filesize_approx) para dar una sola fracción que nunca retrocede, más la
+    velocidad suavizada (media exponencial) y el ETA. Solo usa los campos
+    numéricos del hook.
+
+    El info_dict de cada stream ya no trae 'requested_formats' (yt-dlp lo
+    quita antes de descargar cada uno), así que sin `expect` el audio solo
+    contaría al empezar; el motor le pasa antes los formatos elegidos.
+    """
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self.fraction = 0.0
+        self.speed = None           # bytes/s
+        self.eta = None             # segundos
+        self.downloaded = 0
+        self.total = 0
+        self._streams = {}          # format_id -> [bajado, total, fracción por fragmentos]
+        self._video = None
+
+    def expect(self, video_id, formats):
+        """Los streams que se van a descargar, con su tamaño si se conoce"""
+        if not formats:
+            return
+        self._video = video_id
+        self._streams = {
+            f.get('format_id'): [0, f.get('filesize') or f.get('filesize_approx') or 0, 0.0]
+            for f in formats
+        }
+        self.fraction = 0.0
+        self.downloaded = self.total = 0
+
+    def update(self, d):
+        """Procesa un dict del progress hook; devuelve la fracción agregada"""
+        info = d.get('info_dict') or {}
+        if info.get('id') != self._video:
+            # Siguiente video de una playlist descargada como un solo trabajo
+            self._video = info.get('id')
+            self._streams.clear()
+            self.fraction = 0.0
+        for f in info.get('requested_formats') or ():
+            if f.get('format_id') not in self._streams:
+                self._streams[f.get('format_id')] = [0, f.get('filesize') or f.get('filesize_approx') or 0, 0.0]
+        stream = self._streams.setdefault(info.get('format_id'), [0, 0, 0.0])
+
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        if total:
+            stream[1] = total
+        if d['status'] == 'finished':
+            stream[0] = max(d.get('downloaded_bytes') or 0, stream[1])
+            stream[1] = stream[0]
+            stream[2] = 1.0
+        else:
+            stream[0] = d.get('downloaded_bytes') or 0
+            if d.get('fragment_count'):
+                stream[2] = (d.get('fragment_index') or 0) / d['fragment_count']
+            speed = d.get('speed')
+            if speed:
+                self.speed = speed if self.speed is None else \
+                    self.smoothing * speed + (1 - self.smoothing) * self.speed
+
+        self.downloaded = sum(s[0] for s in self._streams.values())
+        self.total = sum(s[1] for s in self._streams.values())
+        if all(s[1] for s in self._streams.values()):
+            fraction = self.downloaded / self.total
+        else:
+            # Algún stream sin tamaño: cada uno pesa lo mismo
+            fraction = sum(s[0] / s[1] if s[1] else s[2] for s in self._streams.values()) \
+                / len(self._streams)
+        self.fraction = max(self.fraction, min(fraction, 1.0))
+
+        remaining = self.total - self.downloaded
+        self.eta = remaining / self.speed if self.speed and self.total and remaining > 0 else None
+        return self.fraction
+
+
+def export_metrics(rows, path):
+    """Escribe la telemetría en CSV o JSON según la extensión de `path`"""
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else METRICS_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    return len(rows)
+
+
+# ─────────────────────────────────────────────
+#  Almacén por contenido (deduplicar archivos)
+# ─────────────────────────────────────────────
+
+# Restos de descargas a medias que no se indexan
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.tmp', '.temp')
+HASH_CHUNK = 1024 * 1024
+FICLONE = 0x40049409        # ioctl de Linux para reflinks (btrfs, XFS...)
+
+
+def file_hash(path):
+    """SHA-256 del archivo leyendo por bloques"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def clone_file(src, dst):
+    """
+    Sustituye `dst` por una copia de `src` que no ocupa disco: reflink
+    (copy-on-write) si el sistema de archivos lo permite, si no un hardlink.
+    Devuelve 'reflink' o 'hardlink'; lanza OSError si están en discos distintos.
+    """
+    dst = Path(dst)
+    tmp = dst.with_name(f".{dst.name}.dedup")
+    kind = None
+    if sys.platform.startswith("linux"):
+        import fcntl
+        try:
+            with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            kind = "reflink"
+        except OSError:
+            tmp.unlink(missing_ok=True)
+    if kind is None:
+        os.link(src, tmp)
+        kind = "hardlink"
+    os.replace(tmp, dst)
+    return kind
+
+
+class ContentStore:
+    """
+    Índice por contenido de los archivos descargados, en la tabla `files`
+    de la base del historial (ruta, tamaño, mtime, inodo, hash y de cuál es
+    copia). Cuando llega un archivo idéntico a otro ya indexado en el mismo
+    disco se sustituye por un reflink o un hardlink y se apunta la relación.
+
+    Solo se calcula el hash cuando hay otro archivo del mismo tamaño, y un
+    archivo cuyo tamaño y mtime no han cambiado no se vuelve a leer, así que
+    `scan` de una carpeta grande solo lee lo nuevo o lo sospechoso.
+    """
+    def __init__(self, path=HISTORY_DB):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path      TEXT PRIMARY KEY,
+                size      INTEGER NOT NULL,
+                mtime     REAL,
+                dev       INTEGER,
+                inode     INTEGER,
+                hash      TEXT,
+                linked_to TEXT,
+                date      TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_files_size ON files (size);
+        """)
+
+    def _row(self, path):
+        with self._lock:
+            return self._db.execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone()
+
+    def _put(self, path, st, digest=None, linked_to=None):
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO files (path, size, mtime, dev, inode, hash, linked_to, date) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (path, st.st_size, st.st_mtime, st.st_dev, st.st_ino, digest, linked_to,
+                     datetime.now().strftime("%Y-%m-%d %H:%M"))
+                )
+
+    def _forget(self, path):
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _hash_of(self, row):
+        """Hash de un archivo ya indexado (lo calcula si falta); None si cambió o no existe"""
+        try:
+            st = os.stat(row["path"])
+        except OSError:
+            self._forget(row["path"])
+            return None
+        if st.st_size != row["size"] or st.st_mtime != row["mtime"]:
+            self._forget(row["path"])      # Se reindexará si vuelve a aparecer
+            return None
+        if row["hash"] is None:
+            digest = file_hash(row["path"])
+            self._put(row["path"], st, digest, row["linked_to"])
+            return digest
+        return row["hash"]
+
+    def add(self, path):
+        """
+        Indexa un archivo nuevo. Si ya hay otro idéntico en el mismo disco lo
+        sustituye por un enlace a él y devuelve (ruta original, tipo de
+        enlace, bytes ahorrados); si no, None.
+        """
+        path = str(Path(path).resolve())
+        st = os.stat(path)
+        row = self._row(path)
+        if row is not None and row["size"] == st.st_size and row["mtime"] == st.st_mtime:
+            return None                    # Ya indexado y sin cambios
+        with self._lock:
+            same_size = self._db.execute(
+                "SELECT * FROM files WHERE size = ? AND path != ? AND dev = ?",
+                (st.st_size, path, st.st_dev)
+            ).fetchall()
+        if not same_size or st.st_size == 0:
+            self._put(path, st)
+            return None
+
+        digest = file_hash(path)
+        for other in same_size:
+            if self._hash_of(other) != digest:
+                continue
+            if other["inode"] == st.st_ino:
+                self._put(path, st, digest, other["path"])
+                return None                # Ya eran el mismo archivo
+            kind = clone_file(other["path"], path)
+            self._put(path, os.stat(path), digest, other["path"])
+            return other["path"], kind, st.st_size
+        self._put(path, st, digest)
+        return None
+
+    def scan(self, folder, log=print):
+        """
+        Indexa una carpeta (recursivo) y enlaza los duplicados. Devuelve
+        (archivos vistos, duplicados enlazados, bytes ahorrados).
+        """
+        seen = linked = saved = 0
+        for root, _dirs, names in os.walk(folder):
+            for name in names:
+                if name.startswith('.') or name.endswith(PARTIAL_SUFFIXES):
+                    continue
+                seen += 1
+                path = os.path.join(root, name)
+                try:
+                    result = self.add(path)
+                except OSError as e:
+                    log(f"⚠️ {path}: {e}")
+                    continue
+                if result:
+                    original, kind, size = result
+                    linked += 1
+                    saved += size
+                    log(f"= {path} → {kind} a {original} ({format_bytes(size)})")
+        return seen, linked, saved
+
+    def stats(self):
+        """(archivos indexados, enlazados, bytes ahorrados)"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*), COUNT(linked_to), "
+                "COALESCE(SUM(CASE WHEN linked_to IS NOT NULL THEN size END), 0) FROM files"
+            ).fetchone()
+        return tuple(row)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ─────────────────────────────────────────────
+#  Índice de la carpeta de destino
+# ─────────────────────────────────────────────
+
+# Viven en la propia carpeta: si se comparte (otra máquina, historial
+# perdido) el índice va con ella. El archivo usa el formato de
+# `yt-dlp --download-archive` ("extractor id" por línea).
+FOLDER_ARCHIVE = ".descargas_archive.txt"
+FOLDER_INDEX = ".descargas_index.json"
+FOLDER_POLL_INTERVAL = 2.0      # Segundos entre comprobaciones del mtime de la carpeta
+# "[id]" en el nombre, como en la plantilla por defecto de yt-dlp
+ID_IN_NAME = re.compile(r"\[([0-9A-Za-z_-]{5,})\]")
+
+
+def archive_id(extractor, video_id):
+    """Clave de download_archive de yt-dlp: 'youtube dQw4w9WgXcQ'"""
+    return f"{extractor.lower()} {video_id}"
+
+
+class FolderIndex:
+    """
+    Qué videos hay ya en una carpeta de destino, sin tocar la red.
+
+    - `ids`: id de archivo -> nombre del fichero (None si solo consta en el
+      download_archive, p. ej. escrito por yt-dlp en otra máquina).
+    - `tokens`: ids sueltos que aparecen como "[id]" en los nombres.
+    - `urls`: URL -> id de archivo, para las URLs de las que no se puede
+      sacar el id sin red (extractor genérico).
+
+    Se construye con el download_archive y un escaneo de la carpeta, y se
+    actualiza solo cuando cambia el mtime de la carpeta (se comprueba como
+    mucho cada FOLDER_POLL_INTERVAL): un escaneo es un único os.scandir,
+    rápido aunque haya decenas de miles de archivos. Si se borra un archivo
+    su video deja de contar como descargado.
+    """
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self._lock = threading.Lock()
+        self.ids = {}
+        self.tokens = {}
+        self.urls = {}
+        self._mtime = None
+        self._checked = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.folder / FOLDER_INDEX, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.ids = data.get("ids", {})
+            self.urls = data.get("urls", {})
+            self._mtime = data.get("mtime")
+        except (OSError, ValueError):
+            pass
+        try:
+            with open(self.folder / FOLDER_ARCHIVE, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self.ids.setdefault(line, None)
+        except OSError:
+            pass
+        self._scan(force=True)
+
+    def _save(self):
+        # Llamar con el lock tomado. Se reescribe en el sitio (sin archivo
+        # temporal) para no cambiar el mtime de la carpeta; si queda a medias
+        # se reconstruye con el archivo y un escaneo.
+        try:
+            with open(self.folder / FOLDER_INDEX, "w", encoding="utf-8") as f:
+                json.dump({"mtime": self._mtime, "ids": self.ids, "urls": self.urls},
+                          f, ensure_ascii=False)
+        except OSError:
+            pass
+
+    def _dir_mtime(self):
+        try:
+            return os.stat(self.folder).st_mtime_ns
+        except OSError:
+            return None
+
+    def _scan(self, force=False):
+        """Relee la carpeta si cambió desde la última vez"""
+        now = time.monotonic()
+        if not force and now - self._checked < FOLDER_POLL_INTERVAL:
+            return
+        self._checked = now
+        mtime = self._dir_mtime()
+        if mtime is None:
+            return                          # La carpeta aún no existe
+        with self._lock:
+            if mtime == self._mtime and not force:
+                return
+            names = set()
+            tokens = {}
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    name = entry.name
+                    if name.startswith('.') or name.endswith(PARTIAL_SUFFIXES):
+                        continue
+                    names.add(name)
+                    for token in ID_IN_NAME.findall(name):
+                        tokens[token] = name
+            self.tokens = tokens
+            gone = [k for k, name in self.ids.items() if name is not None and name not in names]
+            for key in gone:
+                del self.ids[key]
+            if gone:
+                self.urls = {u: k for u, k in self.urls.items() if k in self.ids}
+                self._rewrite_archive()
+            self._mtime = mtime
+            self._save()
+
+    def _rewrite_archive(self):
+        try:
+            tmp = self.folder / (FOLDER_ARCHIVE + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(f"{key}\n" for key in self.ids)
+            tmp.replace(self.folder / FOLDER_ARCHIVE)
+        except OSError:
+            pass
+
+    def lookup(self, extractor, video_id):
+        """Nombre del archivo de ese video en la carpeta ('' si solo consta en el archivo), o None"""
+        self._scan()
+        with self._lock:
+            key = archive_id(extractor, video_id)
+            if key in self.ids:
+                return self.ids[key] or ""
+            return self.tokens.get(str(video_id))
+
+    def lookup_url(self, url):
+        key = video_key(url)
+        if key:
+            return self.lookup(*key)
+        self._scan()
+        with self._lock:
+            key = self.urls.get(url)
+            return (self.ids.get(key) or "") if key in self.ids else None
+
+    def add(self, extractor, video_id, path, url=None):
+        """Apunta un video recién descargado (en el índice y en el download_archive)"""
+        path = Path(path)
+        if path.parent.resolve() != self.folder.resolve():
+            return
+        key = archive_id(extractor, video_id)
+        with self._lock:
+            # Nuestros propios archivos no deben forzar un nuevo escaneo
+            current = self._dir_mtime() == self._mtime
+            new = key not in self.ids
+            self.ids[key] = path.name
+            if url and not video_key(url):
+                self.urls[url] = key
+            if new:
+                try:
+                    with open(self.folder / FOLDER_ARCHIVE, "a", encoding="utf-8") as f:
+                        f.write(f"{key}\n")
+                except OSError:
+                    pass
+            if current:
+                self._mtime = self._dir_mtime()
+            self._save()
+            if current:
+                self._mtime = self._dir_mtime()
+
+    def __len__(self):
+        with self._lock:
+            return len(self.ids) + len(self.tokens)
+
+
+# ─────────────────────────────────────────────
+#  Caché de metadatos (extract_info)
+# ─────────────────────────────────────────────
+
+class InfoCache:
+    """
+    Caché en disco de resultados de extract_info sin procesar (process=False,
+    sin formato elegido): un JSON gzip por clave, válido durante `ttl`
+    segundos desde que se guardó. Cuenta aciertos y fallos para mostrarlos
+    en la UI.
+    """
+    def __init__(self, directory=INFO_CACHE_DIR, ttl=INFO_CACHE_TTL):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.prune()
+
+    @staticmethod
+    def key(url, use_cookies="no"):
+        """Clave de caché: video (o URL normalizada) + si se usaron cookies"""
+        return "|".join(dedup_key(url)) + f"|cookies={use_cookies}"
+
+    def _path(self, key):
+        return self.directory / (hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json.gz")
+
+    def _fresh(self, path):
+        try:
+            return time.time() - path.stat().st_mtime < self.ttl
+        except OSError:
+            return False
+
+    def get(self, key):
+        """El info dict guardado, o None si no hay o caducó"""
+        path = self._path(key)
+        info = None
+        if self._fresh(path):
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    info = json.load(f)
+            except Exception:
+                info = None
+        with self._lock:
+            if info is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return info
+
+    def put(self, key, info):
+        """Guarda un info dict ya saneado (YoutubeDL.sanitize_info)"""
+        path = self._path(key)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".tmp{threading.get_ident()}")
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                json.dump(info, f, ensure_ascii=False)
+            tmp.replace(path)
+        except Exception:
+            pass
+
+    def invalidate(self, key):
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def prune(self):
+        """Borra las entradas caducadas"""
+        if not self.directory.is_dir():
+            return
+        for path in self.directory.glob("*.json.gz"):
+            if not self._fresh(path):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return self.hits, self.misses
+
+
+# ─────────────────────────────────────────────
+#  Decisiones de formato
+# ─────────────────────────────────────────────
+
+class FormatDecisions:
+    """
+    Recuerda, por plataforma + calidad y por autor, qué rama del selector de
+    select_format ('a/b/c') terminó bien, con qué protocolo y formato, y qué
+    ramas fallaron al descargar. Una rama que falla FORMAT_FAILURE_LIMIT
+    veces (o una sola con un error del formato, ver FORMAT_ERRORS) pasa al
+    final de la cadena, así la siguiente URL no repite el fallo y el
+    reintento. Solo se retrasan ramas: las demás conservan el orden de
+    select_format y la que funcionó no se adelanta. Pasado FORMAT_REPROBE
+    vuelve a su sitio: si funciona se olvidan sus fallos y si no, vuelve al
+    final.
+
+    Los fallos se apuntan solo para el autor (o para la plataforma si el
+    video no tiene): un canal con problemas no cambia el orden de los
+    demás. Que una rama no tenga formatos para un video no cuenta como
+    fallo, ni los errores del disco (LOCAL_ERRORS): yt-dlp pasa a la
+    siguiente sin hacer peticiones y reordenar solo haría perder calidad.
+    Se guarda en un JSON pequeño (`path`).
+    """
+    def __init__(self, path=FORMATS_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._data = json.load(f)
+        except (OSError, ValueError):
+            self._data = {}
+
+    @staticmethod
+    def key(plataforma, quality, uploader=None):
+        return f"{plataforma}|{quality}|{uploader or '*'}"
+
+    def _keys(self, plataforma, quality, uploader):
+        # Lo del autor manda; si no hay nada suyo, lo de la plataforma
+        keys = [self.key(plataforma, quality)]
+        if uploader:
+            keys.insert(0, self.key(plataforma, quality, uploader))
+        return keys
+
+    def lookup(self, plataforma, quality, uploader=None):
+        """La decisión recordada (dict) o None"""
+        with self._lock:
+            for key in self._keys(plataforma, quality, uploader):
+                if key in self._data:
+                    return dict(self._data[key])
+        return None
+
+    @staticmethod
+    def _failure(value):
+        # Antes cada fallo era solo su fecha
+        if isinstance(value, (int, float)):
+            return {"count": 1, "time": value}
+        return value
+
+    @classmethod
+    def demoted(cls, entry, now=None):
+        """Ramas de una decisión que ahora van al final de la cadena"""
+        now = time.time() if now is None else now
+        demoted = set()
+        for branch, value in (entry or {}).get("failed", {}).items():
+            failure = cls._failure(value)
+            if failure["count"] >= FORMAT_FAILURE_LIMIT and now - failure["time"] < FORMAT_REPROBE:
+                demoted.add(branch)
+        return demoted
+
+    def order(self, plataforma, quality, uploader=None):
+        """Ramas de select_format con las que fallan una y otra vez al final"""
+        fmt, _ = select_format(quality, plataforma)
+        if not fmt:
+            return []
+        branches = fmt.split('/')
+        demoted = self.demoted(self.lookup(plataforma, quality, uploader))
+        return [b for b in branches if b not in demoted] + [b for b in branches if b in demoted]
+
+    def record(self, plataforma, quality, uploader, branch, protocol, format_id):
+        """Apunta la rama que terminó bien (no se olvidan los fallos de otras)"""
+        with self._lock:
+            changed = False
+            for key in self._keys(plataforma, quality, uploader):
+                entry = self._data.setdefault(key, {"failed": {}})
+                new = {"branch": branch, "protocol": protocol, "format": format_id}
+                if any(entry.get(k) != v for k, v in new.items()) or branch in entry["failed"]:
+                    entry.update(new)
+                    entry["failed"].pop(branch, None)
+                    changed = True
+            if changed:
+                self._save()
+
+    def record_failure(self, plataforma, quality, uploader, branch, error=""):
+        """Apunta un fallo de `branch` (`error` es el mensaje de yt-dlp)"""
+        lower = error.lower()
+        if any(s in lower for s in LOCAL_ERRORS):
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._data.setdefault(self.key(plataforma, quality, uploader), {"failed": {}})
+            previous = entry["failed"].get(branch)
+            count = 1
+            if previous is not None:
+                previous = self._failure(previous)
+                if now - previous["time"] < FORMAT_FAILURE_TTL:
+                    count = previous["count"] + 1
+            if any(s in lower for s in FORMAT_ERRORS):
+                count = max(count, FORMAT_FAILURE_LIMIT)
+            entry["failed"][branch] = {"count": count, "time": now}
+            self._save()
+
+    def entries(self):
+        """[(clave, decisión)] para mostrarlas en la UI"""
+        with self._lock:
+            return sorted((k, dict(v)) for k, v in self._data.items() if v.get("branch"))
+
+    def _save(self):
+        # Llamar con el lock tomado
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=1)
+            tmp.replace(self.path)
+        except OSError:
+            pass
+
+
+def _selectable(formats):
+    """Formatos listos para _select_formats"""
+    import yt_dlp
+
+    # El resultado sin procesar aún no trae 'protocol' en todos los formatos
+    return [f if f.get('protocol') or not f.get('url')
+            else {**f, 'protocol': yt_dlp.utils.determine_protocol(f)} for f in formats]
+
+
+def selected_formats(ydl, info, selector):
+    """Los formatos (uno, o video y audio) que `selector` elige para `info`; [] si no se sabe"""
+    if not info.get('formats'):
+        return []
+    try:
+        # _select_formats da por hecho que el mejor va el último: el resultado
+        # sin procesar trae los formatos en el orden del extractor
+        formats = _selectable(info['formats'])
+        ydl.sort_formats({'formats': formats,
+                          '_format_sort_fields': info.get('_format_sort_fields')})
+        chosen = ydl._select_formats(formats, selector)
+    except Exception:
+        return []
+    if not chosen:
+        return []
+    return list(chosen[0].get('requested_formats') or [chosen[0]])
+
+
+def first_branch(ydl, info, branches):
+    """La primera rama que elige algún formato de `info` (None si no se sabe)"""
+    formats = info.get('formats')
+    if not formats:
+        return None
+    formats = _selectable(formats)
+    for branch in branches:
+        try:
+            if ydl._select_formats(formats, ydl.build_format_selector(branch)):
+                return branch
+        except Exception:
+            return None
+    return None
+
+
+# ─────────────────────────────────────────────
+#  Cookies del navegador
+# ─────────────────────────────────────────────
+
+class BrowserCookies:
+    """
+    Instantánea de las cookies del navegador en un cookiefile Netscape,
+    compartida por todas las descargas.
+
+    Se lee el navegador una sola vez y solo se vuelve a leer si cambia el
+    mtime de su base de datos de cookies (comprobado como mucho cada
+    `min_interval` s) o con `refresh()`. Si releer falla (Brave abierto en
+    Windows: "could not copy") se sigue usando la instantánea anterior.
+    """
+    def __init__(self, browser="brave", directory=COOKIES_DIR, min_interval=300):
+        self.browser = browser
+        self.directory = Path(directory)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._db_path = None
+        self._file = None
+        self._source_mtime = None
+        self._checked = None
+        self._load_meta()
+
+    def _meta_path(self):
+        return self.directory / f"{self.browser}.json"
+
+    def _load_meta(self):
+        """Recupera la instantánea de una sesión anterior y borra las viejas"""
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if Path(meta["file"]).exists():
+                self._file = meta["file"]
+                self._source_mtime = meta.get("source_mtime")
+        except Exception:
+            return
+        for old in self.directory.glob(f"{self.browser}-*.txt"):
+            if str(old) != self._file:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+
+    def _find_db(self):
+        # Mismos helpers que usa yt-dlp para elegir la base de datos
+        try:
+            from yt_dlp.cookies import (
+                YDLLogger, _find_files, _get_chromium_based_browser_settings, _newest,
+            )
+            root = _get_chromium_based_browser_settings(self.browser)['browser_dir']
+            return _newest(_find_files(root, 'Cookies', YDLLogger()))
+        except Exception:
+            return None
+
+    def source_mtime(self):
+        """mtime de la base de datos de cookies del navegador (None si no se encuentra)"""
+        if self._db_path is None:
+            self._db_path = self._find_db()
+        try:
+            return os.stat(self._db_path).st_mtime
+        except (OSError, TypeError):
+            return None
+
+    def cookiefile(self, log=None, force=False):
+        """Ruta del cookiefile actual, regenerándolo si el navegador cambió"""
+        log = log or (lambda msg: None)
+        with self._lock:
+            if self._file and not force:
+                now = time.monotonic()
+                if self._checked is not None and now - self._checked < self.min_interval:
+                    return self._file
+                self._checked = now
+                mtime = self.source_mtime()
+                if mtime is None or mtime == self._source_mtime:
+                    return self._file
+            try:
+                self._snapshot(log)
+            except Exception as e:
+                if not self._file:
+                    raise
+                log(f"⚠️ No se pudieron releer las cookies de {self.browser} ({e}); "
+                    "se usan las ya cargadas")
+            return self._file
+
+    def refresh(self, log=None):
+        """Vuelve a leer las cookies del navegador ahora"""
+        return self.cookiefile(log, force=True)
+
+    def _snapshot(self, log):
+        from yt_dlp.cookies import extract_cookies_from_browser
+
+        mtime = self.source_mtime()
+        log(f"→ Leyendo cookies de {self.browser}...")
+        jar = extract_cookies_from_browser(self.browser)
+
+        # Nombre nuevo en cada instantánea: los YoutubeDL del pool que aún
+        # usan la anterior la guardan al cerrarse sin pisar esta.
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix=f"{self.browser}-", suffix=".txt", dir=self.directory)
+        os.close(fd)        # mkstemp lo crea con permisos 0600
+        jar.save(path)
+
+        self._file = path
+        self._source_mtime = mtime
+        self._checked = time.monotonic()
+        with open(self._meta_path(), "w", encoding="utf-8") as f:
+            json.dump({"file": self._file, "source_mtime": mtime}, f)
+        log(f"→ {len(jar)} cookies de {self.browser} cargadas")
+
+
+# ─────────────────────────────────────────────
+#  Pool de YoutubeDL
+# ─────────────────────────────────────────────
+
+@functools.lru_cache(maxsize=None)
+def _ydl_class():
+    """YoutubeDL que puede aplazar el post-procesado (importa yt_dlp al usarse)"""
+    import yt_dlp
+
+    class DeferredYDL(yt_dlp.YoutubeDL):
+        # Con una lista, post_process solo anota (archivo, info, files_to_move)
+        # y la fusión/correcciones se hacen después en otro hilo.
+        deferred = None
+
+        def post_process(self, filename, info, files_to_move=None):
+            if self.deferred is None:
+                return super().post_process(filename, info, files_to_move)
+            info['filepath'] = filename
+            self.deferred.append((filename, info, files_to_move))
+            return info
+
+    return DeferredYDL
+
+
+class _PooledYDL:
+    """Un YoutubeDL cuyo logger y progress hook se cambian en cada uso"""
+    def __init__(self, ydl_opts):
+        self.log = None
+        self.hook = None
+        opts = dict(ydl_opts)
+        opts['logger'] = MyLogger(self._log)
+        opts['progress_hooks'] = [self._hook]
+        self.ydl = _ydl_class()(opts)
+
+    def _log(self, msg):
+        if self.log:
+            self.log(msg)
+
+    def _hook(self, d):
+        if self.hook:
+            self.hook(d)
+
+
+class YDLPool:
+    """
+    YoutubeDL de larga vida agrupados por perfil de opciones (calidad,
+    cookies, plataforma, carpeta...). Reutilizar la instancia conserva la
+    sesión HTTP, los extractores ya inicializados y el cookie jar cargado;
+    con cookies de Brave eso evita descifrar la base de datos en cada URL.
+
+    Cada instancia la usa un solo hilo a la vez; `max_idle` limita cuántas
+    libres se guardan por perfil (0 = no reutilizar nunca).
+    """
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self.created = 0
+        self.reused = 0
+        self._idle = {}         # perfil -> [_PooledYDL]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def profile(ydl_opts):
+        """Clave del perfil: todas las opciones menos logger y hooks"""
+        return repr(sorted(
+            (k, repr(v)) for k, v in ydl_opts.items()
+            if k not in ('logger', 'progress_hooks')
+        ))
+
+    @contextlib.contextmanager
+    def use(self, ydl_opts, log=None, progress_hook=None):
+        """`with pool.use(opts, log, hook) as ydl:` con un YoutubeDL del perfil"""
+        import yt_dlp
+
+        key = self.profile(ydl_opts)
+        with self._lock:
+            idle = self._idle.get(key)
+            entry = idle.pop() if idle else None
+            if entry is None:
+                self.created += 1
+            else:
+                self.reused += 1
+        if entry is None:
+            entry = _PooledYDL(ydl_opts)
+
+        entry.log, entry.hook = log, progress_hook
+        reusable = False
+        try:
+            yield entry.ydl
+            reusable = True
+        except yt_dlp.utils.DownloadError:
+            reusable = True     # Error del video, la instancia sigue sana
+            raise
+        finally:
+            entry.log = entry.hook = None
+            if reusable:
+                with self._lock:
+                    idle = self._idle.setdefault(key, [])
+                    if len(idle) < self.max_idle:
+                        idle.append(entry)
+                        entry = None
+            if entry is not None:
+                entry.ydl.close()
+
+    def stats(self):
+        with self._lock:
+            return self.created, self.reused
+
+    def close(self):
+        with self._lock:
+            entries = [e for idle in self._idle.values() for e in idle]
+            self._idle.clear()
+        for entry in entries:
+            try:
+                entry.ydl.close()
+            except Exception:
+                pass
+
+
+# ─────────────────────────────────────────────
+#  Post-procesado
+# ─────────────────────────────────────────────
+
+def audio_es_aac(info):
+    """True si todo el audio de los formatos elegidos ya es AAC"""
+    for f in info.get('requested_formats') or [info]:
+        acodec = f.get('acodec')
+        if acodec == 'none':
+            continue        # Stream solo de vídeo
+        if not acodec or not acodec.startswith(('mp4a', 'aac')):
+            return False    # Otro códec (opus, vorbis...) o desconocido
+    return True
+
+
+def postproc_opts(ydl_opts, info):
+    """
+    Opciones para post-procesar un archivo descargado con `ydl_opts`. El
+    audio solo se recodifica a AAC si no lo es ya; si lo es, ffmpeg copia
+    los streams tal cual (mucho más rápido).
+    """
+    opts = dict(ydl_opts)
+    if not audio_es_aac(info):
+        opts['postprocessor_args'] = {'ffmpeg': ['-c:a', 'aac']}
+    return opts
+
+
+# ─────────────────────────────────────────────
+#  Planificador de ancho de banda
+# ─────────────────────────────────────────────
+
+# Descargas simultáneas por plataforma (None = solo cuenta el total de la cola).
+# TikTok e Instagram bloquean enseguida las ráfagas de peticiones.
+PLATFORM_SLOTS = {
+    'tiktok': 2,
+    'instagram': 2,
+    'facebook': 3,
+    'twitter': 3,
+    'youtube': 4,
+    'other': None,
+}
+
+
+class BandwidthScheduler:
+    """
+    Reparte el ancho de banda y limita la concurrencia por plataforma.
+
+    - `budget`: bytes/s para todas las descargas juntas (None = sin límite).
+      Se divide a partes iguales entre las transferencias activas y se
+      recalcula cada vez que una empieza o termina; yt-dlp lee 'ratelimit'
+      de sus params en cada bloque, así que el cambio es inmediato. (Las
+      descargas por fragmentos y aria2c copian el límite al empezar y lo
+      aplican por fragmento/conexión: ahí el reparto es aproximado.)
+    - `slots`: máximo de descargas simultáneas por plataforma
+      (detectar_plataforma). DownloadQueue lo consulta al elegir trabajo.
+    - Un 429/403 de una plataforma reduce su límite a la mitad y la pausa
+      `backoff` segundos (el doble en cada error seguido, hasta
+      `max_backoff`); cada descarga correcta devuelve un hueco.
+    """
+    def __init__(self, budget=None, slots=None, backoff=30, max_backoff=600):
+        self.budget = budget
+        self.slots = dict(PLATFORM_SLOTS if slots is None else slots)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._limits = dict(self.slots)     # Límite actual (baja con los 429/403)
+        self._paused_until = {}             # plataforma -> time.monotonic()
+        self._strikes = {}                  # plataforma -> errores seguidos
+        self._active = {}                   # plataforma -> transferencias en curso
+        self._params = []                   # params de los YoutubeDL transfiriendo
+        self._lock = threading.Lock()
+
+    # Para DownloadQueue
+
+    def group(self, url):
+        return detectar_plataforma(url)
+
+    def limit(self, platform):
+        with self._lock:
+            return self._limits.get(platform)
+
+    def wait_time(self, platform):
+        with self._lock:
+            return max(0.0, self._paused_until.get(platform, 0) - time.monotonic())
+
+    # Para DownloadEngine
+
+    def set_budget(self, budget):
+        """Cambia el presupuesto global (bytes/s o None) en caliente"""
+        with self._lock:
+            self.budget = budget
+            self._rebalance()
+
+    def _rebalance(self):
+        # Llamar con el lock tomado
+        share = int(self.budget / len(self._params)) if self.budget and self._params else None
+        for params in self._params:
+            if share:
+                params['ratelimit'] = share
+            else:
+                params.pop('ratelimit', None)
+
+    @contextlib.contextmanager
+    def transfer(self, ydl, platform):
+        """`with scheduler.transfer(ydl, plataforma):` alrededor de la descarga"""
+        with self._lock:
+            self._params.append(ydl.params)
+            self._active[platform] = self._active.get(platform, 0) + 1
+            self._rebalance()
+        try:
+            yield
+        finally:
+            with self._lock:
+                # Por identidad: los YoutubeDL de un mismo perfil tienen params iguales
+                self._params = [p for p in self._params if p is not ydl.params]
+                ydl.params.pop('ratelimit', None)   # La instancia vuelve al pool
+                self._active[platform] -= 1
+                self._rebalance()
+
+    def report(self, platform, kind=None):
+        """
+        Resultado de una descarga (`kind` de classify_error o None si fue
+        bien). Tras un bloqueo devuelve (nuevo límite, segundos de pausa);
+        si no, None.
+        """
+        with self._lock:
+            current = self._limits.get(platform)
+            if kind != "throttled":
+                self._strikes[platform] = 0
+                ceiling = self.slots.get(platform)
+                if current is not None and (ceiling is None or current < ceiling):
+                    self._limits[platform] = current + 1
+                return None
+
+            now = time.monotonic()
+            if now < self._paused_until.get(platform, 0):
+                # Empezó antes de la pausa en curso: es el mismo bloqueo
+                return current, self._paused_until[platform] - now
+
+            strikes = self._strikes.get(platform, 0) + 1
+            self._strikes[platform] = strikes
+            running = current or max(1, self._active.get(platform, 0) + 1)
+            limit = max(1, running // 2)
+            delay = min(self.max_backoff, self.backoff * 2 ** (strikes - 1))
+            self._limits[platform] = limit
+            self._paused_until[platform] = now + delay
+            return limit, delay
+
+
+# ─────────────────────────────────────────────
+#  Motor
+# ─────────────────────────────────────────────
+
+class DownloadEngine:
+    """
+    Descarga URLs con yt-dlp y publica lo que pasa como eventos.
+
+    Eventos (los callbacks se llaman desde el hilo que descarga; una GUI
+    debe pasarlos a su hilo principal):
+
+    - ``log(job, message)``
+    - ``status(job, text)``                línea de estado que sustituye a la anterior
+                                           ("Descargando: 45% - Velocidad: ...")
+    - ``progress(job, fraction)``          fracción 0..1 de la descarga
+    - ``finished(job, url, info)``         descarga correcta, ya en el historial
+    - ``error(job, url, kind, message)``   kind: 'cookies', 'unavailable', 'other', 'unexpected',
+                                           'cancelled' (Job.cancelled)
+
+    `job` es el Job de la cola (download_queue) o None para descargas sueltas.
+    Con `yt_dlp_progress=False` yt-dlp no escribe sus líneas "[download] x%" en
+    el log (para frontends que ya pintan el evento `status`).
+
+    Los metadatos de `fetch_info` se guardan en `info_cache`; una descarga
+    posterior de la misma URL los reutiliza con process_ie_result en vez de
+    volver a extraer. Los YoutubeDL salen de `ydl_pool` y se reutilizan entre
+    URLs con las mismas opciones. Las cookies de Brave se leen una vez en
+    `cookies` (BrowserCookies) y todas las descargas comparten la instantánea.
+    `scheduler` (BandwidthScheduler) reparte el ancho de banda entre las
+    descargas activas y recibe los 429/403 de cada plataforma; una cola que
+    lo comparta respeta además sus límites por plataforma. `fragments` y
+    `downloader` se pasan a build_ydl_opts (fragmentos HLS/DASH simultáneos y
+    aria2c). La fusión con ffmpeg y las correcciones se hacen en un pool
+    aparte de `postproc_workers` hilos (por defecto uno por núcleo).
+    `formats` (FormatDecisions) ordena las ramas del selector de formato
+    según lo que funcionó antes con cada plataforma y autor. `store`
+    (ContentStore, por defecto en la base del historial) enlaza los archivos
+    repetidos en vez de guardarlos dos veces. Cada carpeta de destino lleva
+    su FolderIndex (`in_folder`) para saltarse sin red lo que ya contiene.
+    """
+    EVENTS = ("log", "status", "progress", "finished", "error")
+
+    def __init__(self, history=None, yt_dlp_progress=True, info_cache=None, ydl_pool=None,
+                 cookies=None, scheduler=None, fragments=None, downloader="auto",
+                 postproc_workers=None, formats=None, store=None):
+        self.history = history if history is not None else DownloadHistory()
+        self.yt_dlp_progress = yt_dlp_progress
+        self.info_cache = info_cache if info_cache is not None else InfoCache()
+        self.ydl_pool = ydl_pool if ydl_pool is not None else YDLPool()
+        self.cookies = cookies if cookies is not None else BrowserCookies("brave")
+        self.scheduler = scheduler if scheduler is not None else BandwidthScheduler()
+        self.fragments = fragments          # None = PLATFORM_FRAGMENTS
+        self.downloader = downloader
+        self.formats = formats if formats is not None else FormatDecisions()
+        self.store = store if store is not None else ContentStore(self.history.path)
+        self.postproc = concurrent.futures.ThreadPoolExecutor(
+            max_workers=postproc_workers or os.cpu_count() or 2,
+            thread_name_prefix="postproc")
+        self._folders = {}
+        self._folders_lock = threading.Lock()
+        self._listeners = {event: [] for event in self.EVENTS}
+
+    def subscribe(self, event, callback):
+        self._listeners[event].append(callback)
+
+    def unsubscribe(self, event, callback):
+        self._listeners[event].remove(callback)
+
+    def emit(self, event, *args):
+        for callback in list(self._listeners[event]):
+            try:
+                callback(*args)
+            except Exception:
+                pass
+
+    def close(self):
+        """Espera al post-procesado pendiente y cierra los YoutubeDL del pool"""
+        self.postproc.shutdown(wait=True)
+        self.ydl_pool.close()
+        self.store.close()
+
+    def folder_index(self, output_path):
+        """FolderIndex de una carpeta de destino (uno por carpeta y motor)"""
+        key = os.path.abspath(output_path)
+        with self._folders_lock:
+            if key not in self._folders:
+                self._folders[key] = FolderIndex(key)
+            return self._folders[key]
+
+    def in_folder(self, url, output_path):
+        """Nombre del archivo si el video de `url` ya está en la carpeta ('' si solo consta en su archivo)"""
+        if not output_path:
+            return None
+        return self.folder_index(output_path).lookup_url(url)
+
+    def _cookiefile(self, use_cookies, log):
+        """Instantánea de cookies para las opciones, o None si no se usan"""
+        import yt_dlp
+
+        if use_cookies != "si":
+            return None
+        try:
+            return self.cookies.cookiefile(log)
+        except Exception as e:
+            # Se trata como cualquier otro error de cookies de yt-dlp
+            raise yt_dlp.utils.DownloadError(f"Could not copy cookie database: {e}")
+
+    # ─────────────────────────────────────────────
+    #  Info del video
+    # ─────────────────────────────────────────────
+
+    def fetch_info(self, url, use_cookies="no"):
+        """
+        Metadatos del video sin descargarlo (lanza excepción si falla).
+
+        La caché guarda la extracción sin procesar: el resultado procesado ya
+        lleva el formato que eligió este selector ('requested_formats', 'url'
+        arriba...) y la descarga, con otra calidad, bajaría esos streams en
+        vez de los suyos. Lo que se devuelve es una copia procesada.
+        """
+        cache_key = InfoCache.key(url, use_cookies)
+        raw = self.info_cache.get(cache_key)
+
+        # Mismas cabeceras/cookies que la descarga, para que el resultado
+        # cacheado le sirva tal cual
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'skip_download': True,
+            'http_headers': dict(HTTP_HEADERS),
+        }
+        if use_cookies == "si":
+            ydl_opts['cookiefile'] = self._cookiefile(use_cookies, lambda msg: None)
+        if detectar_plataforma(url) == 'facebook':
+            ydl_opts['extractor_args'] = {'facebook': {'logged_in_tab': False}}
+
+        with self.ydl_pool.use(ydl_opts) as ydl:
+            if raw is None:
+                raw = ydl.extract_info(url, download=False, process=False)
+                self.info_cache.put(cache_key, ydl.sanitize_info(raw))
+            return ydl.sanitize_info(ydl.process_ie_result(raw, download=False))
+
+    def iter_playlist(self, url, use_cookies="no"):
+        """
+        Entradas de una playlist/canal a medida que yt-dlp las pagina
+        (extract_flat, sin procesar): no se guarda la lista entera, así que la
+        memoria no crece con canales de miles de videos. Cada entrada es un
+        dict con url, title, duration, extractor e id. Si la URL resulta ser
+        un solo video se devuelve ella misma.
+        """
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True,
+            'http_headers': dict(HTTP_HEADERS),
+        }
+        if use_cookies == "si":
+            ydl_opts['cookiefile'] = self._cookiefile(use_cookies, lambda msg: None)
+
+        with self.ydl_pool.use(ydl_opts) as ydl:
+            result = ydl.extract_info(url, download=False, process=False)
+            yield from self._flat_entries(ydl, result, url)
+
+    def _flat_entries(self, ydl, result, url, depth=0):
+        from yt_dlp.utils import unsmuggle_url
+
+        # Redirecciones (canal -> pestaña de videos, etc.)
+        while result and result.get('_type') in ('url', 'url_transparent') and depth < 5:
+            url = result['url']
+            result = ydl.extract_info(url, ie_key=result.get('ie_key'),
+                                      download=False, process=False)
+            depth += 1
+        if not result:
+            return
+        if result.get('_type') not in ('playlist', 'multi_video'):
+            yield {'url': result.get('webpage_url') or url, 'title': result.get('title'),
+                   'duration': result.get('duration'),
+                   'extractor': result.get('extractor_key'), 'id': result.get('id')}
+            return
+
+        for entry in result.get('entries') or ():
+            if not entry:
+                continue
+            if entry.get('_type') in ('playlist', 'multi_video') and depth < 5:
+                yield from self._flat_entries(ydl, entry, url, depth + 1)
+                continue
+            entry_url = entry.get('webpage_url') or entry.get('url')
+            if not entry_url or not entry_url.startswith(('http://', 'https://')):
+                continue
+            entry_url, _ = unsmuggle_url(entry_url)     # Datos internos del extractor
+            yield {'url': entry_url, 'title': entry.get('title'),
+                   'duration': entry.get('duration'),
+                   'extractor': entry.get('ie_key'), 'id': entry.get('id')}
+
+    def prefetch(self, url, use_cookies="no", quality="best"):
+        """
+        fetch_info (queda en la caché para la descarga) + el formato que
+        elegiría la descarga con `quality`. Devuelve info_summary.
+        """
+        info = self.fetch_info(url, use_cookies)
+        branches = self.formats.order(detectar_plataforma(url), quality,
+                                      info.get('uploader_id') or info.get('uploader'))
+        fmt = '/'.join(branches)
+        selected = None
+        if fmt and info.get('formats'):
+            with self.ydl_pool.use({'quiet': True, 'no_warnings': True}) as ydl:
+                try:
+                    # Mismo selector que usa process_ie_result al descargar
+                    chosen = ydl._select_formats(info['formats'], ydl.build_format_selector(fmt))
+                    selected = chosen[0] if chosen else None
+                except Exception:
+                    selected = None
+        return info_summary(info, selected)
+
+    # ─────────────────────────────────────────────
+    #  Descarga
+    # ─────────────────────────────────────────────
+
+    def progress_hook(self, d, job=None, progress=None):
+        """Hook de yt-dlp; `progress` (ProgressAggregator) junta los streams"""
+        if d['status'] not in ('downloading', 'finished'):
+            return
+        if progress is None:
+            progress = ProgressAggregator()
+        fraction = progress.update(d)
+        if job is not None:
+            job.progress, job.speed, job.eta = fraction, progress.speed, progress.eta
+        self.emit("progress", job, fraction)
+
+        if d['status'] == 'downloading':
+            status = f"Descargando: {fraction * 100:.1f}%"
+            if progress.speed:
+                status += f" - Velocidad: {format_bytes(progress.speed)}/s"
+            if progress.eta:
+                status += f" - Quedan {format_duration(progress.eta)}"
+            self.emit("status", job, status)
+        elif fraction >= 1:
+            self.emit("log", job, "Descarga completada, procesando...")
+
+    def download(self, url, output_path, quality="best", use_cookies="no", job=None,
+                 pipeline=False):
+        """
+        Descarga una URL. Devuelve True si terminó bien.
+
+        Con `pipeline=True` la fusión y las correcciones de ffmpeg se encolan
+        en el pool de post-procesado y se devuelve un Future con el resultado:
+        el hilo (y la conexión) queda libre para la siguiente URL.
+
+        La telemetría del intento (DownloadMetrics) queda en `job.metrics` y
+        se guarda en el historial tanto si termina bien como si falla.
+        """
+        import yt_dlp
+
+        log = lambda msg: self.emit("log", job, msg)  # noqa: E731
+        metrics = DownloadMetrics(url, detectar_plataforma(url),
+                                  retries=max(job.attempts - 1, 0) if job is not None else 0)
+        if job is not None:
+            job.metrics = metrics
+
+        def ydl_log(msg):
+            metrics.observe(msg)
+            log(msg)
+
+        progress = ProgressAggregator()
+
+        def hook(d):
+            if job is not None and job.cancelled:
+                raise yt_dlp.utils.DownloadCancelled("Cancelada")
+            metrics.hook(d)
+            self.progress_hook(d, job, progress)
+
+        try:
+            log(f"Iniciando descarga desde: {url}")
+            with metrics.phase('t_cookies'):
+                cookiefile = self._cookiefile(use_cookies, log)
+            ydl_opts, plataforma = build_ydl_opts(url, output_path, quality, use_cookies, log, hook,
+                                                  cookiefile=cookiefile,
+                                                  fragments=self.fragments,
+                                                  downloader=self.downloader)
+            if not self.yt_dlp_progress:
+                ydl_opts['noprogress'] = True
+
+            cache_key = InfoCache.key(url, use_cookies)
+            cached = self.info_cache.get(cache_key)
+            with self.ydl_pool.use(ydl_opts, ydl_log, hook) as ydl, \
+                    self.scheduler.transfer(ydl, plataforma):
+                info = None
+                ydl.deferred = deferred = []
+                metrics.start_extract()
+                try:
+                    if cached is not None:
+                        log("→ Usando información en caché (sin volver a extraer)")
+                        try:
+                            info = self._process(ydl, cached, plataforma, quality, log, deferred,
+                                                 progress=progress)
+                        except yt_dlp.utils.DownloadError:
+                            # Lo más probable: las URLs de los formatos caducaron
+                            log("→ La información en caché ya no sirve, extrayendo de nuevo...")
+                            self.info_cache.invalidate(cache_key)
+                            deferred.clear()
+                    if info is None:
+                        log("→ Extrayendo información del video...")
+                        raw = ydl.extract_info(url, download=False, process=False)
+                        info = self._process(ydl, raw, plataforma, quality, log, deferred,
+                                             retry=True, progress=progress)
+                finally:
+                    ydl.deferred = None
+                    metrics.stop_extract()
+
+            if not info:
+                raise Exception("No se pudo extraer información del video")
+            self.scheduler.report(plataforma)
+            if job is not None:
+                job.title = info.get('title', 'Video sin título')
+
+        except Exception as e:
+            self._report_failure(e, url, job, log, metrics)
+            return False
+
+        if pipeline and deferred:
+            log("→ Transferencia terminada, post-procesado en cola")
+            return self.postproc.submit(self._finish, url, output_path, info,
+                                        deferred, ydl_opts, job, log, metrics)
+        return self._finish(url, output_path, info, deferred, ydl_opts, job, log, metrics)
+
+    def _process(self, ydl, source, plataforma, quality, log, deferred, retry=False,
+                 progress=None):
+        """
+        process_ie_result(download=True) con las ramas de formato en el orden
+        de `formats` (FormatDecisions). Con `retry`, si la descarga falla con
+        la rama elegida se apunta el fallo y se prueba la siguiente que tenga
+        formatos, en vez de perder el trabajo entero. `progress`
+        (ProgressAggregator) recibe antes los streams que se van a bajar.
+        """
+        import yt_dlp
+
+        def expect(selector):
+            if progress is not None:
+                progress.expect(source.get('id'), selected_formats(ydl, source, selector))
+
+        uploader = source.get('uploader_id') or source.get('uploader')
+        branches = self.formats.order(plataforma, quality, uploader)
+        if not branches or not source.get('formats'):
+            expect(ydl.format_selector)
+            return ydl.process_ie_result(source, download=True)
+
+        default = ydl.format_selector
+        if branches != ydl.params['format'].split('/'):
+            log(f"→ Formato recordado para {plataforma.upper()}: {branches[0]}")
+        try:
+            while True:
+                branch = first_branch(ydl, source, branches)
+                ydl.format_selector = ydl.build_format_selector('/'.join(branches))
+                expect(ydl.format_selector)
+                try:
+                    info = ydl.process_ie_result(source, download=True)
+                    break
+                except yt_dlp.utils.DownloadError as e:
+                    rest = [b for b in branches if b != branch]
+                    if not (retry and branch and classify_error(str(e)) == "other"
+                            and first_branch(ydl, source, rest)):
+                        raise
+                    self.formats.record_failure(plataforma, quality, uploader, branch, str(e))
+                    log(f"→ Falló el formato '{branch}', probando el siguiente...")
+                    branches = rest
+                    deferred.clear()
+        finally:
+            ydl.format_selector = default
+
+        if branch and info:
+            self.formats.record(plataforma, quality, uploader, branch,
+                                info.get('protocol'), info.get('format_id'))
+        return info
+
+    def _postprocess(self, deferred, ydl_opts, log):
+        """Fusión, correcciones y movimiento de los archivos aplazados; devuelve sus info finales"""
+        import yt_dlp
+
+        done = []
+        for filename, info, files_to_move in deferred:
+            opts = postproc_opts(ydl_opts, info)
+            if info.get('requested_formats'):
+                if 'postprocessor_args' in opts:
+                    log("→ Fusionando y recodificando el audio a AAC...")
+                else:
+                    log("→ El audio ya es AAC: fusión sin recodificar")
+            with self.ydl_pool.use(opts, log) as ydl:
+                # Los post-procesadores se crearon con el YoutubeDL de la
+                # descarga; se pasan a este para usar sus opciones y su log
+                for pp in info.get('__postprocessors') or []:
+                    pp.set_downloader(ydl)
+                try:
+                    info = ydl.post_process(filename, info, files_to_move)
+                except yt_dlp.utils.PostProcessingError as e:
+                    ydl.report_error(f'Postprocessing: {e}')
+            if info.get('filepath'):
+                done.append(info)
+        return done
+
+    def _dedup(self, paths, log):
+        """Enlaza los archivos nuevos que ya estaban en disco con otro nombre o carpeta"""
+        for path in paths:
+            try:
+                result = self.store.add(path)
+            except OSError as e:
+                log(f"⚠️ No se pudo comprobar si {Path(path).name} está repetido: {e}")
+                continue
+            if result:
+                original, kind, size = result
+                log(f"→ Contenido idéntico a {original}: {kind}, {format_bytes(size)} ahorrados")
+
+    def _finish(self, url, output_path, info, deferred, ydl_opts, job, log, metrics):
+        """Post-procesa, registra en el historial y emite `finished`"""
+        try:
+            with metrics.phase('t_postproc'):
+                done = self._postprocess(deferred, ydl_opts, log)
+                self._dedup([i['filepath'] for i in done], log)
+            folder = self.folder_index(output_path)
+            for item in done:
+                # Con un solo formato yt-dlp pasa al post-procesado solo el formato
+                meta = item if item.get('id') else info
+                if meta.get('extractor_key') and meta.get('id'):
+                    folder.add(meta['extractor_key'], meta['id'], item['filepath'],
+                               meta.get('webpage_url') if len(done) > 1 else url)
+
+            title    = info.get('title', 'Video sin título')
+            duration = info.get('duration', 0)
+            uploader = info.get('uploader', 'Desconocido')
+
+            log("")
+            log("✓ ¡Descarga completada!")
+            log(f"  Título: {title}")
+            log(f"  Autor:  {uploader}")
+            if duration:
+                log(f"  Duración: {format_duration(duration)}")
+            log(f"  Guardado en: {output_path}")
+
+            self.history.add(url, title, uploader, duration,
+                             info.get('extractor_key'), info.get('id'))
+            self._record_metrics(metrics, True)
+            self.emit("finished", job, url, info)
+            return True
+
+        except Exception as e:
+            self._report_failure(e, url, job, log, metrics)
+        return False
+
+    def _record_metrics(self, metrics, ok, error_kind=None):
+        metrics.finish(ok, error_kind)
+        try:
+            self.history.add_metrics(metrics.as_dict())
+        except sqlite3.Error:
+            pass        # La telemetría nunca debe tumbar una descarga
+
+    def _report_failure(self, e, url, job, log, metrics):
+        """Clasifica el error, avisa al planificador y emite `error`"""
+        import yt_dlp
+
+        if isinstance(e, yt_dlp.utils.DownloadCancelled):
+            log("✗ Descarga cancelada")
+            self._record_metrics(metrics, False, "cancelled")
+            if job is not None:
+                job.error, job.error_kind = "Cancelada", "cancelled"
+            self.emit("error", job, url, "cancelled", str(e))
+            return
+        if not isinstance(e, yt_dlp.utils.DownloadError):
+            log(f"✗ Error inesperado: {e}")
+            self._record_metrics(metrics, False, "unexpected")
+            self.emit("error", job, url, "unexpected", str(e))
+            return
+
+        error_msg = str(e)
+        kind = classify_error(error_msg)
+        self._record_metrics(metrics, False, kind)
+        if job is not None:
+            job.error, job.error_kind = error_msg, kind
+        log("")
+        log(f"✗ Error de descarga: {error_msg}")
+
+        if kind == "throttled":
+            plataforma = detectar_plataforma(url)
+            blocked = self.scheduler.report(plataforma, kind)
+            if blocked:
+                limit, delay = blocked
+                log(f"⚠️  {plataforma.upper()} está limitando las peticiones: "
+                    f"máx. {limit} a la vez, pausa de {delay:.0f} s")
+        elif kind == "cookies":
+            log("")
+            log("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
+            log("⚠️  ERROR DE COOKIES")
+            log("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
+            log("1. CIERRA completamente Brave")
+            log("2. Intenta descargar de nuevo")
+        elif kind == "unavailable":
+            log("")
+            log("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
+            log("⚠️  NO SE PUEDE ACCEDER AL VIDEO")
+            log("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
+            log("• Video privado, URL inválida, o necesitas autenticación")
+        self.emit("error", job, url, kind, error_msg)
@@ -0,0 +1,40 @@
+"""
+Fixtures comunes. Los medios salen del servidor local de los benchmarks
+(benchmarks/fixture_server.py): el extractor genérico de yt-dlp los
+descarga sin red.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+
+@pytest.fixture(scope="session")
+def media_server():
+    from fixture_server import FixtureServer
+
+    with FixtureServer(videos=8, size=128 * 1024, segments=4) as srv:
+        yield srv
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """DownloadEngine con historial, cachés y decisiones de formato temporales"""
+    from downloader_core import (
+        BrowserCookies, DownloadEngine, DownloadHistory, FormatDecisions, InfoCache,
+    )
+
+    engine = DownloadEngine(
+        history=DownloadHistory(tmp_path / "history.db", legacy_json=None),
+        info_cache=InfoCache(tmp_path / "cache" / "info"),
+        cookies=BrowserCookies("brave", directory=tmp_path / "cache" / "cookies"),
+        formats=FormatDecisions(tmp_path / "cache" / "formats.json"),
+        yt_dlp_progress=False,
+    )
+    yield engine
+    engine.close()
+    engine.history.close()
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from downloader_core import ContentStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ContentStore(tmp_path / "history.db")
+    yield store
+    store.close()
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def same_data(a, b):
+    # Un reflink comparte los bloques pero no el inodo; un hardlink, ambos
+    return os.path.samefile(a, b) or a.read_bytes() == b.read_bytes()
+
+
+def test_identical_file_is_linked(store, tmp_path):
+    data = os.urandom(64 * 1024)
+    first = write(tmp_path / "a" / "video.mp4", data)
+    second = write(tmp_path / "b" / "copia.mp4", data)
+
+    assert store.add(first) is None
+    original, kind, saved = store.add(second)
+    assert original == str(first.resolve())
+    assert kind in ("reflink", "hardlink")
+    assert saved == len(data)
+    assert same_data(first, second)
+    if kind == "hardlink":
+        assert os.path.samefile(first, second)
+    assert store.stats() == (2, 1, len(data))
+
+
+def test_same_size_different_content_is_kept(store, tmp_path):
+    first = write(tmp_path / "a.mp4", b"a" * 1000)
+    second = write(tmp_path / "b.mp4", b"b" * 1000)
+    store.add(first)
+    assert store.add(second) is None
+    assert not os.path.samefile(first, second)
+    assert store.stats() == (2, 0, 0)
+
+
+def test_unchanged_file_is_not_reindexed(store, tmp_path):
+    path = write(tmp_path / "a.mp4", b"x" * 1000)
+    store.add(path)
+    assert store.add(path) is None
+    assert store.stats() == (1, 0, 0)
+
+
+def test_changed_original_is_not_linked(store, tmp_path):
+    first = write(tmp_path / "a.mp4", b"x" * 1000)
+    store.add(first)
+    write(first, b"y" * 1000)                   # Mismo tamaño, otro contenido
+    os.utime(first, (1, 1))
+    second = write(tmp_path / "b.mp4", b"x" * 1000)
+    assert store.add(second) is None
+    assert not os.path.samefile(first, second)
+
+
+def test_scan_links_duplicates_and_skips_partials(store, tmp_path):
+    data = os.urandom(32 * 1024)
+    write(tmp_path / "uno" / "v.mp4", data)
+    write(tmp_path / "dos" / "v.mp4", data)
+    write(tmp_path / "dos" / "otro.mp4", os.urandom(1024))
+    write(tmp_path / "dos" / "v.mp4.part", data)
+    write(tmp_path / "dos" / ".oculto", data)
+    log = []
+
+    assert store.scan(tmp_path / "uno", log.append) == (1, 0, 0)
+    assert store.scan(tmp_path / "dos", log.append) == (2, 1, len(data))
+    assert len(log) == 1
+    # Una segunda pasada no lee ni enlaza nada nuevo
+    assert store.scan(tmp_path / "dos", log.append) == (2, 0, 0)
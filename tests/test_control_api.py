@@ -0,0 +1,136 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from control_api import ControlAPI
+from download_queue import DownloadQueue, DONE, FAILED, PENDING
+
+
+class FakeHistory:
+    def __init__(self, urls=()):
+        self.urls = set(urls)
+
+    def is_duplicate(self, url, extractor=None, video_id=None):
+        return url in self.urls
+
+
+class FakeEngine:
+    def __init__(self, history=(), folder=()):
+        self.history = FakeHistory(history)
+        self.folder = set(folder)
+
+    def in_folder(self, url, output_path):
+        return "archivo" if url in self.folder else None
+
+
+@pytest.fixture
+def api():
+    queue = DownloadQueue(max_workers=1)
+    engine = FakeEngine(history={"https://a/old"}, folder={"https://a/there"})
+    enqueued = []
+    api = ControlAPI(queue, engine, port=0,
+                     defaults=lambda: {"output_path": "/tmp/out", "quality": "best",
+                                       "use_cookies": "no"},
+                     on_enqueue=lambda: enqueued.append(True))
+    api.enqueued = enqueued
+    api.start()
+    yield api
+    api.stop()
+    queue.close()
+
+
+def request(api, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection(*api.address, timeout=5)
+    headers = dict(headers or {})
+    data = None
+    if body is not None:
+        data = json.dumps(body)
+        headers.setdefault("Content-Type", "application/json")
+    conn.request(method, path, body=data, headers=headers)
+    resp = conn.getresponse()
+    payload = resp.read()
+    conn.close()
+    return resp.status, json.loads(payload) if payload else None
+
+
+def test_enqueue_one(api):
+    status, data = request(api, "POST", "/jobs", {"url": "https://a/1", "options": {"quality": "720p"}})
+    assert status == 201
+    assert data["job"]["state"] == PENDING
+    job = api.queue.get(data["job"]["id"])
+    assert job.options == {"output_path": "/tmp/out", "quality": "720p", "use_cookies": "no"}
+    assert api.enqueued
+
+
+def test_enqueue_bulk_skips_known_urls(api):
+    urls = ["https://a/1", "https://a/2", "https://a/1", "https://a/old", "https://a/there"]
+    status, data = request(api, "POST", "/jobs/bulk", {"urls": urls})
+    assert status == 200
+    assert [r.get("skipped") for r in data["results"]] == [
+        None, None, "ya en cola", "ya descargado", "ya está en la carpeta"]
+    status, data = request(api, "POST", "/jobs/bulk", {"urls": ["https://a/old"], "force": True})
+    assert "job" in data["results"][0]
+
+
+def test_bad_requests(api):
+    assert request(api, "POST", "/jobs", {"url": "ftp://x"})[0] == 400
+    assert request(api, "POST", "/jobs", {"url": "https://a/1", "options": {"x": "y"}})[0] == 400
+    assert request(api, "POST", "/jobs", {"url": "https://a/1",
+                                          "options": {"quality": "8k"}})[0] == 400
+    assert request(api, "GET", "/jobs/99")[0] == 404
+    assert request(api, "GET", "/nada")[0] == 404
+
+
+def test_only_localhost_and_json(api):
+    assert request(api, "GET", "/status", headers={"Host": "evil.example"})[0] == 403
+    conn = http.client.HTTPConnection(*api.address, timeout=5)
+    conn.request("POST", "/jobs", body="url=https://a/1",
+                 headers={"Content-Type": "application/x-www-form-urlencoded"})
+    assert conn.getresponse().status == 415
+    conn.close()
+
+
+def test_status_and_listing(api):
+    request(api, "POST", "/jobs/bulk", {"urls": ["https://a/1", "https://a/2"]})
+    api.queue.cancel(1)
+    status, data = request(api, "GET", "/status")
+    assert status == 200
+    assert data["total"] == 2
+    assert data["jobs"][PENDING] == 1 and data["jobs"][FAILED] == 1
+    _, data = request(api, "GET", "/jobs?state=pending")
+    assert [j["url"] for j in data["jobs"]] == ["https://a/2"]
+
+
+def test_cancel(api):
+    _, data = request(api, "POST", "/jobs", {"url": "https://a/1"})
+    job_id = data["job"]["id"]
+    status, data = request(api, "DELETE", f"/jobs/{job_id}")
+    assert status == 200
+    assert data["job"]["error_kind"] == "cancelled"
+    assert request(api, "POST", f"/jobs/{job_id}/cancel", {})[0] == 409
+
+
+def test_events_stream_job_changes(api):
+    conn = http.client.HTTPConnection(*api.address, timeout=5)
+    conn.request("GET", "/events")
+    resp = conn.getresponse()
+    assert resp.getheader("Content-Type").startswith("text/event-stream")
+
+    seen = []
+
+    def read():
+        for line in resp:
+            if line.startswith(b"data: "):
+                seen.append(json.loads(line[6:]))
+                if seen[-1].get("state") == DONE:
+                    return
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    request(api, "POST", "/jobs", {"url": "https://a/1"})
+    api.queue.start(lambda job: True)
+    reader.join(5)
+    conn.close()
+    assert seen and seen[-1]["url"] == "https://a/1" and seen[-1]["state"] == DONE
@@ -0,0 +1,96 @@
+import http.cookiejar
+import os
+
+import pytest
+import yt_dlp.cookies
+from yt_dlp.cookies import YoutubeDLCookieJar
+
+from downloader_core import BrowserCookies
+
+
+@pytest.fixture
+def browser(tmp_path, monkeypatch):
+    """Navegador falso: una base de datos vacía y un contador de lecturas"""
+    db = tmp_path / "Cookies"
+    db.write_bytes(b"")
+    reads = []
+
+    def extract(browser_name, *args, **kwargs):
+        if reads and reads[-1] == "fail":
+            raise RuntimeError("could not copy")
+        reads.append(browser_name)
+        jar = YoutubeDLCookieJar()
+        jar.set_cookie(_cookie(f"n{len(reads)}"))
+        return jar
+
+    monkeypatch.setattr(yt_dlp.cookies, "extract_cookies_from_browser", extract)
+    monkeypatch.setattr(BrowserCookies, "_find_db", lambda self: str(db))
+    return db, reads
+
+
+def _cookie(value):
+    return http.cookiejar.Cookie(
+        0, "SID", value, None, False, ".example.com", True, True, "/", True,
+        False, 2**31, False, None, None, {})
+
+
+def _touch(path, delta):
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + delta))
+
+
+def test_snapshot_is_read_once(tmp_path, browser):
+    _, reads = browser
+    cookies = BrowserCookies("brave", directory=tmp_path / "c", min_interval=0)
+    path = cookies.cookiefile()
+    assert cookies.cookiefile() == path
+    assert reads == ["brave"]
+    assert "SID" in open(path, encoding="utf-8").read()
+
+
+def test_rereads_when_source_mtime_changes(tmp_path, browser):
+    db, reads = browser
+    cookies = BrowserCookies("brave", directory=tmp_path / "c", min_interval=0)
+    first = cookies.cookiefile()
+    _touch(db, 10)
+    second = cookies.cookiefile()
+    assert len(reads) == 2
+    assert second != first
+    assert "n2" in open(second, encoding="utf-8").read()
+
+
+def test_mtime_checked_at_most_every_min_interval(tmp_path, browser):
+    db, reads = browser
+    cookies = BrowserCookies("brave", directory=tmp_path / "c", min_interval=3600)
+    cookies.cookiefile()
+    _touch(db, 10)
+    cookies.cookiefile()
+    assert len(reads) == 1
+    cookies.refresh()
+    assert len(reads) == 2
+
+
+def test_failed_reread_keeps_previous_snapshot(tmp_path, browser):
+    db, reads = browser
+    cookies = BrowserCookies("brave", directory=tmp_path / "c", min_interval=0)
+    first = cookies.cookiefile()
+    reads.append("fail")
+    _touch(db, 10)
+    log = []
+    assert cookies.cookiefile(log.append) == first
+    assert any("se usan las ya cargadas" in line for line in log)
+
+
+def test_first_read_failure_raises(tmp_path, browser):
+    _, reads = browser
+    reads.append("fail")
+    with pytest.raises(RuntimeError):
+        BrowserCookies("brave", directory=tmp_path / "c").cookiefile()
+
+
+def test_snapshot_survives_restart(tmp_path, browser):
+    _, reads = browser
+    path = BrowserCookies("brave", directory=tmp_path / "c", min_interval=0).cookiefile()
+    again = BrowserCookies("brave", directory=tmp_path / "c", min_interval=0)
+    assert again.cookiefile() == path
+    assert reads == ["brave"]
@@ -0,0 +1,109 @@
+import concurrent.futures
+
+import pytest
+
+
+@pytest.mark.parametrize("kind", ["mp4", "hls", "dash"])
+def test_download_end_to_end(engine, media_server, tmp_path, kind):
+    out = tmp_path / "out"
+    url = media_server.url(kind, 0)
+    finished = []
+    engine.subscribe("finished", lambda job, url, info: finished.append(url))
+
+    assert engine.download(url, str(out)) is True
+
+    files = [p for p in out.iterdir() if not p.name.startswith(".")]
+    assert len(files) == 1
+    assert files[0].stat().st_size == len(media_server.payload)
+    assert finished == [url]
+    assert engine.history.is_duplicate(url)
+
+
+def test_download_pipeline_returns_future(engine, media_server, tmp_path):
+    from download_queue import Job
+
+    job = Job(1, media_server.url("mp4", 1))
+    result = engine.download(job.url, str(tmp_path), job=job, pipeline=True)
+    assert isinstance(result, concurrent.futures.Future)
+    assert result.result(timeout=30) is True
+    assert job.progress == 1.0
+    assert job.metrics is not None and job.metrics.ok
+    assert engine.history.is_duplicate(job.url)
+
+
+def test_download_cancelled_job(engine, media_server, tmp_path):
+    from download_queue import Job
+
+    job = Job(1, media_server.url("mp4", 2))
+    job.cancelled = True
+    errors = []
+    engine.subscribe("error", lambda job, url, kind, msg: errors.append(kind))
+
+    assert engine.download(job.url, str(tmp_path), job=job) is False
+    assert errors == ["cancelled"]
+    assert job.error_kind == "cancelled"
+    assert not engine.history.is_duplicate(job.url)
+
+
+def test_download_failure_reports_error(engine, media_server, tmp_path):
+    errors = []
+    engine.subscribe("error", lambda job, url, kind, msg: errors.append(kind))
+    assert engine.download(f"{media_server.base_url}/nope/0.mp4", str(tmp_path)) is False
+    assert len(errors) == 1
+
+
+def test_events_reach_subscribers(engine, media_server, tmp_path):
+    logs, progress = [], []
+    engine.subscribe("log", lambda job, msg: logs.append(msg))
+    engine.subscribe("progress", lambda job, fraction: progress.append(fraction))
+
+    assert engine.download(media_server.url("mp4", 1), str(tmp_path)) is True
+    assert progress and progress[-1] == 1.0
+    assert progress == sorted(progress)
+    assert "✓ ¡Descarga completada!" in logs
+
+
+def test_run_job_without_output_path_fails(engine, media_server):
+    from download_queue import Job
+    from video_downloader import run_job
+
+    job = Job(1, media_server.url("mp4", 2), options={"quality": "best"})
+    assert run_job(engine, job) is False
+    assert job.error == "Sin carpeta de destino"
+
+
+def test_run_job_skips_resumed_job_already_in_history(engine, media_server, tmp_path):
+    from download_queue import Job
+    from video_downloader import run_job
+
+    url = media_server.url("mp4", 3)
+    engine.history.add(url, "Título", "Autor", 1)
+    job = Job(1, url, options={"output_path": str(tmp_path / "out")})
+    job.resumed = True
+    assert run_job(engine, job) is True
+    assert not (tmp_path / "out").exists()
+
+
+def test_folder_index_survives_restart(engine, media_server, tmp_path):
+    from downloader_core import FolderIndex
+
+    out = tmp_path / "out"
+    url = media_server.url("mp4", 4)
+    assert engine.download(url, str(out)) is True
+    assert engine.in_folder(url, str(out))
+    # Otro proceso (índice nuevo) lo encuentra sin historial ni red
+    assert FolderIndex(str(out)).lookup_url(url) is not None
+
+
+def test_run_job_skips_video_already_in_folder(engine, media_server, tmp_path):
+    from download_queue import Job
+    from video_downloader import run_job
+
+    out = tmp_path / "out"
+    url = media_server.url("mp4", 5)
+    assert engine.download(url, str(out)) is True
+    logs = []
+    engine.subscribe("log", lambda job, msg: logs.append(msg))
+    assert run_job(engine, Job(1, url, options={"output_path": str(out)})) is True
+    assert any(msg.startswith("= Ya está en la carpeta") for msg in logs)
+    assert not any("Extrayendo" in msg for msg in logs)
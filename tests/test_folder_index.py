@@ -0,0 +1,54 @@
+import pytest
+
+import downloader_core
+from downloader_core import FOLDER_ARCHIVE, FolderIndex
+
+YT = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+@pytest.fixture(autouse=True)
+def no_poll_interval(monkeypatch):
+    monkeypatch.setattr(downloader_core, "FOLDER_POLL_INTERVAL", 0)
+
+
+def test_ids_from_archive_and_names(tmp_path):
+    (tmp_path / FOLDER_ARCHIVE).write_text("youtube aaaaaaaaaaa\n")
+    (tmp_path / "Otro video [bbbbbbbbbbb].mp4").write_bytes(b"x")
+    (tmp_path / "A medias [ccccccccccc].mp4.part").write_bytes(b"x")
+    index = FolderIndex(tmp_path)
+    assert index.lookup("Youtube", "aaaaaaaaaaa") == ""
+    assert index.lookup("Youtube", "bbbbbbbbbbb") == "Otro video [bbbbbbbbbbb].mp4"
+    assert index.lookup("Youtube", "ccccccccccc") is None
+    assert index.lookup_url(YT) is None
+
+
+def test_add_survives_restart(tmp_path):
+    (tmp_path / "Rick.mp4").write_bytes(b"x")
+    (tmp_path / "Generico.mp4").write_bytes(b"x")
+    index = FolderIndex(tmp_path)
+    index.add("Youtube", "dQw4w9WgXcQ", tmp_path / "Rick.mp4", YT)
+    index.add("Generic", "v1", tmp_path / "Generico.mp4", "https://example.com/v1.mp4")
+    index.add("Generic", "fuera", tmp_path.parent / "fuera.mp4")     # Otra carpeta: no cuenta
+
+    again = FolderIndex(tmp_path)
+    assert again.lookup_url(YT) == "Rick.mp4"
+    assert again.lookup_url("https://example.com/v1.mp4") == "Generico.mp4"
+    assert again.lookup("Generic", "fuera") is None
+    assert (tmp_path / FOLDER_ARCHIVE).read_text().split("\n")[:2] == \
+        ["youtube dQw4w9WgXcQ", "generic v1"]
+
+
+def test_deleted_file_is_forgotten(tmp_path):
+    (tmp_path / "Rick.mp4").write_bytes(b"x")
+    index = FolderIndex(tmp_path)
+    index.add("Youtube", "dQw4w9WgXcQ", tmp_path / "Rick.mp4", YT)
+    (tmp_path / "Rick.mp4").unlink()
+    assert index.lookup_url(YT) is None
+    assert "dQw4w9WgXcQ" not in (tmp_path / FOLDER_ARCHIVE).read_text()
+    assert FolderIndex(tmp_path).lookup_url(YT) is None
+
+
+def test_missing_folder(tmp_path):
+    index = FolderIndex(tmp_path / "aun-no")
+    assert index.lookup_url(YT) is None
+    assert len(index) == 0
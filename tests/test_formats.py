@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import downloader_core
+from downloader_core import FORMAT_FAILURE_LIMIT, FORMAT_REPROBE, FormatDecisions, select_format
+
+BRANCHES = select_format("best", "youtube")[0].split("/")
+FIRST = BRANCHES[0]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(downloader_core.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def decisions(tmp_path, clock):
+    return FormatDecisions(tmp_path / "formats.json")
+
+
+def fail(decisions, times=1, uploader="canal", error="HTTP Error 500", branch=FIRST):
+    for _ in range(times):
+        decisions.record_failure("youtube", "best", uploader, branch, error)
+
+
+def test_default_order_is_select_format(decisions):
+    assert decisions.order("youtube", "best", "canal") == BRANCHES
+    assert decisions.order("youtube", "raro") == []
+
+
+def test_demoted_after_repeated_failures(decisions):
+    fail(decisions, FORMAT_FAILURE_LIMIT - 1)
+    assert decisions.order("youtube", "best", "canal") == BRANCHES
+    fail(decisions)
+    assert decisions.order("youtube", "best", "canal") == BRANCHES[1:] + [FIRST]
+
+
+def test_format_error_demotes_at_once(decisions):
+    fail(decisions, error="ERROR: This video is DRM protected")
+    assert decisions.order("youtube", "best", "canal")[-1] == FIRST
+
+
+def test_disk_errors_are_ignored(decisions):
+    fail(decisions, FORMAT_FAILURE_LIMIT, error="[Errno 28] No space left on device")
+    assert decisions.order("youtube", "best", "canal") == BRANCHES
+    assert decisions.lookup("youtube", "best", "canal") is None
+
+
+def test_failures_only_affect_their_uploader(decisions):
+    fail(decisions, FORMAT_FAILURE_LIMIT)
+    assert decisions.order("youtube", "best", "otro") == BRANCHES
+    assert decisions.order("youtube", "best") == BRANCHES
+
+
+def test_success_does_not_move_the_branch_forward(decisions):
+    decisions.record("youtube", "best", "canal", BRANCHES[2], "https", "22")
+    assert decisions.order("youtube", "best", "canal") == BRANCHES
+    assert decisions.lookup("youtube", "best", "canal")["branch"] == BRANCHES[2]
+    assert decisions.lookup("youtube", "best", "otro")["branch"] == BRANCHES[2]
+
+
+def test_reprobe_after_format_reprobe(decisions, clock):
+    fail(decisions, FORMAT_FAILURE_LIMIT)
+    clock[0] += FORMAT_REPROBE - 1
+    assert decisions.order("youtube", "best", "canal")[-1] == FIRST
+    clock[0] += 1
+    assert decisions.order("youtube", "best", "canal") == BRANCHES
+    # Falla otra vez al volver a probarla: al final sin esperar a otros dos fallos
+    fail(decisions)
+    assert decisions.order("youtube", "best", "canal")[-1] == FIRST
+
+
+def test_success_clears_failures(decisions):
+    fail(decisions, FORMAT_FAILURE_LIMIT)
+    decisions.record("youtube", "best", "canal", FIRST, "https", "137+140")
+    assert decisions.order("youtube", "best", "canal") == BRANCHES
+    assert FIRST not in decisions.lookup("youtube", "best", "canal")["failed"]
+
+
+def test_saved_and_legacy_entries(tmp_path, clock):
+    path = tmp_path / "formats.json"
+    key = FormatDecisions.key("youtube", "best", "canal")
+    # Formato antiguo: cada fallo era solo su fecha
+    path.write_text(json.dumps({key: {"failed": {FIRST: clock[0]}}}))
+    decisions = FormatDecisions(path)
+    assert decisions.order("youtube", "best", "canal") == BRANCHES
+    fail(decisions, FORMAT_FAILURE_LIMIT - 1)
+    assert FormatDecisions(path).order("youtube", "best", "canal")[-1] == FIRST
@@ -0,0 +1,74 @@
+import json
+
+from downloader_core import DownloadHistory
+
+
+def history_at(tmp_path, legacy_json=None):
+    return DownloadHistory(tmp_path / "history.db", legacy_json=legacy_json)
+
+
+def test_add_and_duplicate_lookup(tmp_path):
+    history = history_at(tmp_path)
+    assert not history.is_duplicate("https://example.com/video/1")
+    history.add("https://www.example.com/video/1/", "Uno", "canal", 60)
+    # Misma URL normalizada: sin www ni barra final
+    assert history.is_duplicate("https://example.com/video/1")
+    assert not history.is_duplicate("https://example.com/video/2")
+    assert len(history) == 1
+    history.close()
+
+
+def test_duplicate_by_video_id(tmp_path):
+    history = history_at(tmp_path)
+    history.add("https://example.com/a", "Uno", "canal", 60, extractor="Fake", video_id="42")
+    assert history.is_duplicate("https://example.com/otra-url", extractor="Fake", video_id="42")
+    assert not history.is_duplicate("https://example.com/b", extractor="Fake", video_id="43")
+    history.close()
+
+
+def test_keys_survive_reopen(tmp_path):
+    history = history_at(tmp_path)
+    history.add("https://example.com/a", "Uno", "canal", 60)
+    history.close()
+    history = history_at(tmp_path)
+    history.preload()
+    assert history.is_duplicate("https://example.com/a")
+    history.close()
+
+
+def test_migrates_legacy_json(tmp_path):
+    legacy = tmp_path / "download_history.json"
+    # El JSON guardaba la más reciente primero
+    legacy.write_text(json.dumps([
+        {"url": "https://example.com/2", "title": "Dos", "uploader": "b", "duration": 2,
+         "date": "2024-01-02 10:00"},
+        {"url": "https://example.com/1", "title": "Uno", "uploader": "a", "duration": 1,
+         "date": "2024-01-01 10:00"},
+    ]), encoding="utf-8")
+
+    history = history_at(tmp_path, legacy)
+    assert [e["title"] for e in history.entries()] == ["Dos", "Uno"]
+    assert history.is_duplicate("https://example.com/1")
+    assert not legacy.exists()
+    assert (tmp_path / "download_history.json.bak").exists()
+    history.close()
+
+    # Solo la primera vez
+    assert len(history_at(tmp_path, legacy)) == 2
+
+
+def test_broken_legacy_json_is_ignored(tmp_path):
+    legacy = tmp_path / "download_history.json"
+    legacy.write_text("{no es json", encoding="utf-8")
+    history = history_at(tmp_path, legacy)
+    assert len(history) == 0
+    assert legacy.exists()
+    history.close()
+
+
+def test_entries_most_recent_first(tmp_path):
+    history = history_at(tmp_path)
+    for i in range(5):
+        history.add(f"https://example.com/{i}", f"Video {i}", "canal", i)
+    assert [e["title"] for e in history.entries(limit=2)] == ["Video 4", "Video 3"]
+    history.close()
@@ -0,0 +1,107 @@
+import copy
+import time
+
+import pytest
+import yt_dlp
+from yt_dlp.postprocessor import FFmpegMergerPP
+
+from downloader_core import InfoCache
+
+
+def test_put_get_and_counters(tmp_path):
+    cache = InfoCache(tmp_path)
+    key = InfoCache.key("https://example.com/v")
+    assert cache.get(key) is None
+    cache.put(key, {"id": "v", "title": "Vídeo"})
+    assert cache.get(key) == {"id": "v", "title": "Vídeo"}
+    assert cache.stats() == (1, 1)
+
+
+def test_entries_expire(tmp_path):
+    cache = InfoCache(tmp_path, ttl=0.05)
+    key = InfoCache.key("https://example.com/v")
+    cache.put(key, {"id": "v"})
+    time.sleep(0.1)
+    assert cache.get(key) is None
+    InfoCache(tmp_path, ttl=0.05)               # prune al abrir
+    assert not list(tmp_path.glob("*.json.gz"))
+
+
+def test_key_uses_video_id_and_cookies():
+    assert InfoCache.key("https://youtu.be/dQw4w9WgXcQ") == \
+        InfoCache.key("https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=1")
+    assert InfoCache.key("https://youtu.be/dQw4w9WgXcQ", "si") != \
+        InfoCache.key("https://youtu.be/dQw4w9WgXcQ")
+
+
+@pytest.fixture
+def counted_extractions(monkeypatch):
+    calls = []
+    original = yt_dlp.YoutubeDL.extract_info
+
+    def extract_info(self, url, *args, **kwargs):
+        calls.append(url)
+        return original(self, url, *args, **kwargs)
+
+    monkeypatch.setattr(yt_dlp.YoutubeDL, "extract_info", extract_info)
+    return calls
+
+
+def test_download_reuses_fetch_info(engine, media_server, tmp_path, counted_extractions):
+    url = media_server.url("mp4", 4)
+    info = engine.fetch_info(url)
+    assert info["formats"]
+    assert engine.fetch_info(url)["id"] == info["id"]      # Segunda vez, de la caché
+    assert engine.download(url, str(tmp_path)) is True
+    assert counted_extractions == [url]
+
+
+@pytest.fixture
+def multi_format(media_server, monkeypatch):
+    """
+    Extracción falsa con video y audio por separado (1080p) y un archivo
+    progresivo de 360p. Con el merger "disponible" el selector por defecto
+    de fetch_info elige video+audio.
+    """
+    url = f"{media_server.base_url}/multi"
+    extractions = []
+    raw = {
+        "id": "multi", "title": "Multi", "extractor": "fake", "extractor_key": "Fake",
+        "webpage_url": url,
+        "formats": [
+            {"format_id": "v", "url": media_server.url("mp4", 5), "ext": "mp4",
+             "vcodec": "avc1", "acodec": "none", "height": 1080},
+            {"format_id": "a", "url": media_server.url("mp4", 6), "ext": "m4a",
+             "vcodec": "none", "acodec": "mp4a"},
+            {"format_id": "p", "url": media_server.url("mp4", 7), "ext": "mp4",
+             "vcodec": "avc1", "acodec": "mp4a", "height": 360},
+        ],
+    }
+
+    def extract_info(self, u, download=True, process=True, **kwargs):
+        assert u == url
+        extractions.append(u)
+        info = copy.deepcopy(raw)
+        return self.process_ie_result(info, download=download) if process else info
+
+    monkeypatch.setattr(yt_dlp.YoutubeDL, "extract_info", extract_info)
+    monkeypatch.setattr(FFmpegMergerPP, "available", property(lambda self: True))
+    return url, extractions
+
+
+def test_fetch_info_then_download_other_quality(engine, multi_format, tmp_path):
+    url, extractions = multi_format
+    out = tmp_path / "out"
+    info = engine.fetch_info(url)
+    assert [f["format_id"] for f in info["requested_formats"]] == ["v", "a"]
+
+    finished = []
+    engine.subscribe("finished", lambda job, url, info: finished.append(info))
+    # La descarga usa la extracción de fetch_info con su propio selector,
+    # sin arrastrar los formatos que eligió aquella
+    assert engine.download(url, str(out), quality="360p") is True
+    assert extractions == [url]
+    assert finished[0]["format_id"] == "p"
+    assert "requested_formats" not in finished[0]
+    files = [p.name for p in out.iterdir() if not p.name.startswith(".")]
+    assert files == ["Multi [NA].mp4"]
@@ -0,0 +1,60 @@
+import pytest
+
+from video_downloader import LogBuffer
+
+
+def test_messages_are_appended():
+    log = LogBuffer()
+    assert log.apply([(None, "a", False), (None, "b\nc", False)]) == ([], ["a", "b", "c"], 0)
+    assert log.lines() == ["a", "b", "c"]
+
+
+def test_status_line_is_rewritten_in_place():
+    log = LogBuffer()
+    log.apply([(1, "inicio", False), (1, "10%", True)])
+    updates, new, trim = log.apply([(1, "20%", True), (2, "otro", False)])
+    assert updates == [(2, "20%")]
+    assert new == ["otro"]
+    assert log.lines() == ["inicio", "20%", "otro"]
+
+
+def test_status_in_same_batch_is_only_added_once():
+    log = LogBuffer()
+    assert log.apply([(1, "10%", True), (1, "20%", True)]) == ([], ["20%"], 0)
+
+
+def test_message_freezes_status_line():
+    log = LogBuffer()
+    log.apply([(1, "50%", True), (1, "hecho", False)])
+    _, new, _ = log.apply([(1, "otra vez", True)])
+    assert new == ["otra vez"]
+    assert log.lines() == ["50%", "hecho", "otra vez"]
+
+
+def test_capacity_trims_oldest_lines():
+    log = LogBuffer(capacity=3)
+    log.apply([(None, str(i), False) for i in range(2)])
+    updates, new, trim = log.apply([(None, str(i), False) for i in range(2, 5)])
+    assert (new, trim) == (["2", "3", "4"], 2)
+    assert log.lines() == ["2", "3", "4"]
+
+
+def test_status_line_trimmed_away_starts_a_new_one():
+    log = LogBuffer(capacity=2)
+    log.apply([(1, "10%", True), (None, "a", False), (None, "b", False)])
+    updates, new, _ = log.apply([(1, "20%", True)])
+    assert updates == [] and new == ["20%"]
+
+
+def test_log_file(tmp_path):
+    path = tmp_path / "app.log"
+    log = LogBuffer(log_file=path)
+    log.apply([(None, "al fichero", False)])
+    assert "al fichero" in path.read_text(encoding="utf-8")
+
+
+@pytest.mark.parametrize("lines", [1, 2500])
+def test_lines_never_exceed_capacity(lines):
+    log = LogBuffer(capacity=2000)
+    log.apply([(None, str(i), False) for i in range(lines)])
+    assert len(log) == min(lines, 2000)
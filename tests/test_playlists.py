@@ -0,0 +1,53 @@
+import pytest
+
+from download_queue import DownloadQueue
+from downloader_core import dedup_key, es_lista
+from video_downloader import feed_playlist
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://www.youtube.com/playlist?list=PL123", True),
+    ("https://www.youtube.com/@canal", True),
+    ("https://www.tiktok.com/@usuario", True),
+    ("https://www.youtube.com/watch?v=dQw4w9WgXcQ", False),
+    ("https://youtu.be/dQw4w9WgXcQ", False),
+    ("https://www.tiktok.com/@usuario/video/123", False),
+    ("https://www.instagram.com/p/abc/", False),      # Carrusel dudoso: un video
+    ("https://example.com/v.mp4", False),
+    ("no es una url", False),
+])
+def test_es_lista(url, expected):
+    assert es_lista(url) is expected
+
+
+def entry(i):
+    return {"url": f"https://www.youtube.com/watch?v=video{i:05d}", "title": f"Video {i}",
+            "duration": 10, "extractor": "Youtube", "id": f"video{i:05d}"}
+
+
+def test_feed_playlist_skips_downloaded_and_queued(engine, monkeypatch, tmp_path):
+    monkeypatch.setattr(engine, "iter_playlist",
+                        lambda url, use_cookies="no": (entry(i) for i in range(5)))
+    engine.history.add(entry(1)["url"], "Video 1", "Autor", 10, "Youtube", "video00001")
+    queue = DownloadQueue(key_func=dedup_key)
+    queue.add(entry(2)["url"])
+
+    added, skipped = feed_playlist(engine, queue, "https://www.youtube.com/@canal",
+                                   options={"output_path": str(tmp_path)}, log=lambda msg: None)
+    assert (added, skipped) == (3, 2)
+    jobs = queue.jobs()
+    assert [job.url for job in jobs] == [entry(i)["url"] for i in (2, 0, 3, 4)]
+    assert jobs[1].title == "Video 0"
+    assert not queue.feeding
+
+
+def test_feed_playlist_reports_expansion_errors(engine, monkeypatch):
+    def broken(url, use_cookies="no"):
+        yield entry(0)
+        raise RuntimeError("página 2 no disponible")
+
+    monkeypatch.setattr(engine, "iter_playlist", broken)
+    queue = DownloadQueue()
+    log = []
+    assert feed_playlist(engine, queue, "https://www.youtube.com/@canal", log=log.append) == (1, 0)
+    assert any("página 2" in line for line in log)
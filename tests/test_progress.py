@@ -0,0 +1,75 @@
+import yt_dlp
+
+from downloader_core import ProgressAggregator, selected_formats
+
+
+def hook(fmt, downloaded, total, status="downloading", video="x", **extra):
+    return {"status": status, "downloaded_bytes": downloaded, "total_bytes": total,
+            "info_dict": {"id": video, "format_id": fmt}, **extra}
+
+
+def test_expected_streams_count_before_they_start():
+    # Los info_dict de cada stream no traen requested_formats
+    progress = ProgressAggregator()
+    progress.expect("x", [{"format_id": "v", "filesize": 300}, {"format_id": "a", "filesize": 100}])
+
+    assert progress.update(hook("v", 150, 300)) == 150 / 400
+    assert progress.update(hook("v", 300, 300, status="finished")) == 0.75
+    assert progress.update(hook("a", 50, 100)) == 350 / 400
+    assert progress.update(hook("a", 100, 100, status="finished")) == 1.0
+
+
+def test_streams_without_size_weigh_the_same():
+    progress = ProgressAggregator()
+    progress.expect("x", [{"format_id": "v"}, {"format_id": "a"}])
+    assert progress.update(hook("v", 0, None, status="finished")) == 0.5
+
+
+def test_fraction_never_goes_back():
+    progress = ProgressAggregator()
+    assert progress.update(hook("v", 500, 1000)) == 0.5
+    # El tamaño estimado crece: la fracción real baja pero no se muestra
+    assert progress.update(hook("v", 510, 2000)) == 0.5
+
+
+def test_fragments_and_speed():
+    progress = ProgressAggregator(smoothing=0.5)
+    progress.update(hook("v", 100, None, fragment_index=1, fragment_count=4, speed=100))
+    fraction = progress.update(hook("v", 200, None, fragment_index=2, fragment_count=4, speed=300))
+    assert fraction == 0.5
+    assert progress.speed == 200
+
+
+def test_next_playlist_video_starts_from_zero():
+    progress = ProgressAggregator()
+    progress.update(hook("v", 100, 100, status="finished", video="a"))
+    assert progress.update(hook("v", 10, 100, video="b")) == 0.1
+
+
+def test_eta():
+    progress = ProgressAggregator(smoothing=1)
+    progress.update(hook("v", 100, 1000, speed=100))
+    assert progress.eta == 9
+
+
+def test_selected_formats_sorts_raw_formats():
+    # Sin procesar los formatos vienen en el orden del extractor (aquí el
+    # mejor primero); _select_formats espera el mejor al final
+    raw = {"id": "x", "formats": [
+        {"format_id": "v1080", "url": "https://cdn/v1080", "ext": "mp4",
+         "vcodec": "avc1", "acodec": "none", "height": 1080, "filesize": 3000},
+        {"format_id": "a128", "url": "https://cdn/a128", "ext": "m4a",
+         "vcodec": "none", "acodec": "mp4a", "abr": 128, "filesize": 200},
+        {"format_id": "v360", "url": "https://cdn/v360", "ext": "mp4",
+         "vcodec": "avc1", "acodec": "none", "height": 360, "filesize": 500},
+        {"format_id": "a48", "url": "https://cdn/a48", "ext": "m4a",
+         "vcodec": "none", "acodec": "mp4a", "abr": 48, "filesize": 80},
+    ]}
+    with yt_dlp.YoutubeDL({"quiet": True}) as ydl:
+        chosen = selected_formats(ydl, raw, ydl.build_format_selector("bestvideo*+bestaudio/best"))
+    assert [f["format_id"] for f in chosen] == ["v1080", "a128"]
+    assert [f["format_id"] for f in raw["formats"]] == ["v1080", "a128", "v360", "a48"]
+
+    progress = ProgressAggregator()
+    progress.expect("x", chosen)
+    assert progress.update(hook("v1080", 3000, 3000, status="finished")) == 3000 / 3200
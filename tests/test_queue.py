@@ -0,0 +1,269 @@
+import concurrent.futures
+import threading
+import time
+
+from download_queue import (
+    DownloadQueue, QueueJournal, PENDING, RUNNING, PROCESSING, DONE, FAILED, RETRY,
+)
+
+OPTIONS = {"output_path": "/tmp/out", "quality": "best", "use_cookies": "no"}
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.01)
+
+
+class Concurrency:
+    """Worker que tarda `delay` y cuenta cuántos corren a la vez"""
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.active = self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, job):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return True
+
+
+def states(queue):
+    return [job.state for job in queue.jobs()]
+
+
+def test_duplicates_are_rejected():
+    queue = DownloadQueue()
+    assert queue.add("https://a/1") is not None
+    assert queue.add("https://a/1") is None
+    assert len(queue.jobs()) == 1
+
+
+def test_runs_all_jobs_with_bounded_workers():
+    queue = DownloadQueue(max_workers=3)
+    for i in range(6):
+        queue.add(f"https://a/{i}")
+    worker = Concurrency(0.05)
+    assert queue.start(worker)
+    assert not queue.start(worker)          # Ya en marcha
+    assert queue.wait(5)
+    assert states(queue) == [DONE] * 6
+    assert worker.peak == 3
+
+
+def test_max_per_host():
+    queue = DownloadQueue(max_workers=4, max_per_host=1)
+    for i in range(4):
+        queue.add(f"https://{'a' if i % 2 else 'b'}.com/{i}")
+    worker = Concurrency(0.05)
+    queue.start(worker)
+    queue.wait(5)
+    assert worker.peak == 2
+
+
+def test_add_while_running_spawns_workers():
+    queue = DownloadQueue(max_workers=4)
+    queue.add("https://a/0")
+    worker = Concurrency(0.2)
+    queue.start(worker)
+    for i in range(1, 8):
+        queue.add(f"https://a/{i}")
+    assert queue.wait(5)
+    assert states(queue) == [DONE] * 8
+    assert worker.peak == 4
+
+
+def test_added_while_running_get_the_start_options():
+    queue = DownloadQueue(max_workers=2)
+    queue.add("https://a/0")
+    queue.start(Concurrency(0.2), options=OPTIONS)
+    queue.add("https://a/1", {"quality": "720p"})
+    queue.add("https://a/2")
+    assert queue.wait(5)
+    jobs = queue.jobs()
+    assert [job.options for job in jobs] == [
+        OPTIONS, {**OPTIONS, "quality": "720p"}, OPTIONS,
+    ]
+
+
+def test_options_of_the_job_win():
+    queue = DownloadQueue()
+    queue.add("https://a/0", {"quality": "720p"})
+    queue.start(lambda job: True, options=OPTIONS)
+    queue.wait(5)
+    assert queue.jobs()[0].options == {**OPTIONS, "quality": "720p"}
+
+
+def test_journal_resume(tmp_path):
+    path = tmp_path / "queue.db"
+    journal = QueueJournal(path)
+    queue = DownloadQueue(journal=journal)
+    done = queue.add("https://a/done", OPTIONS)
+    failed = queue.add("https://a/failed", OPTIONS)
+    queue.add("https://a/pending", OPTIONS)
+    running = queue.add("https://a/running", OPTIONS)
+    removed = queue.add("https://a/removed", OPTIONS)
+    done.state, failed.state, running.state = DONE, FAILED, RUNNING
+    for job in (done, failed, running):
+        journal.update(job)
+    queue.remove(removed.id)
+    journal.close()
+
+    queue = DownloadQueue(journal=QueueJournal(path))
+    restored = queue.restored
+    assert [(j.url, j.state, j.resumed) for j in restored] == [
+        ("https://a/pending", PENDING, False),
+        ("https://a/running", PENDING, True),
+    ]
+    assert restored[0].options == OPTIONS
+    # Los ids nuevos siguen a los del diario
+    assert queue.add("https://a/new").id == running.id + 1
+    # Los recuperados siguen contando como repetidos
+    assert queue.add("https://a/pending") is None
+    queue.journal.close()
+
+
+def test_worker_exception_fails_job():
+    queue = DownloadQueue()
+    job = queue.add("https://a/0")
+    queue.start(lambda job: 1 / 0)
+    queue.wait(5)
+    assert job.state == FAILED
+    assert "division" in job.error
+
+
+def test_on_finish_is_called_once():
+    finished = []
+    queue = DownloadQueue(max_workers=2, on_finish=lambda: finished.append(True))
+    for i in range(3):
+        queue.add(f"https://a/{i}")
+    queue.start(lambda job: True)
+    queue.wait(5)
+    wait_for(lambda: finished)
+    assert finished == [True]
+
+
+def test_producer_keeps_workers_waiting():
+    queue = DownloadQueue(max_workers=2)
+    with queue.producer():
+        assert queue.start(lambda job: True)
+        time.sleep(0.05)
+        assert queue.running                # Sin trabajos, pero aún llegan
+        queue.add("https://a/0")
+        wait_for(lambda: states(queue) == [DONE])
+        assert queue.running
+    assert queue.wait(5)
+    assert not queue.running
+
+
+def test_future_result_goes_through_processing():
+    pool = concurrent.futures.ThreadPoolExecutor(1)
+    gate = threading.Event()
+    finished = []
+    queue = DownloadQueue(on_finish=lambda: finished.append(True))
+    job = queue.add("https://a/0")
+    queue.start(lambda job: pool.submit(gate.wait, 5))
+    wait_for(lambda: job.state == PROCESSING)
+    wait_for(lambda: not queue.running)     # El worker ya quedó libre
+    assert not finished
+    gate.set()
+    assert queue.wait(5)
+    assert job.state == DONE
+    wait_for(lambda: finished)
+    pool.shutdown()
+
+
+def test_shutdown_keeps_cut_jobs_for_next_session(tmp_path):
+    path = tmp_path / "queue.db"
+    journal = QueueJournal(path)
+    queue = DownloadQueue(max_workers=2, journal=journal)
+    for i in range(4):
+        queue.add(f"https://a/{i}", OPTIONS)
+
+    def worker(job):
+        wait_for(lambda: job.cancelled)
+        return False
+
+    queue.start(worker)
+    wait_for(lambda: queue.count(RUNNING) == 2)
+    assert queue.shutdown(5)
+    assert not queue.running
+    journal.close()
+
+    restored = DownloadQueue(journal=QueueJournal(path)).restored
+    assert [j.resumed for j in restored] == [True, True, False, False]
+
+
+def test_removed_job_is_not_notified_by_its_prefetch():
+    started, release = threading.Event(), threading.Event()
+    prefetched = []
+
+    def prefetch(job):
+        prefetched.append(job.id)
+        started.set()
+        release.wait(5)
+
+    changes = []
+    queue = DownloadQueue(prefetch=prefetch, prefetch_workers=1,
+                          on_change=lambda job: changes.append(job.id))
+    first = queue.add("https://a/0")
+    second = queue.add("https://a/1")               # Su prefetch espera al del primero
+    started.wait(5)
+    changes.clear()
+    assert queue.remove(first.id) is first
+    assert queue.remove(second.id) is second
+    release.set()
+    queue.close()
+    wait_for(lambda: first.prefetch.done())
+    assert queue.get(first.id) is None
+    assert changes == []
+    assert prefetched == [first.id]                 # El segundo ni empezó
+
+
+def test_cancel_pending():
+    queue = DownloadQueue()
+    job = queue.add("https://a/0")
+    assert queue.cancel(job.id) is job
+    assert (job.state, job.error_kind) == (FAILED, "cancelled")
+    assert queue.cancel(job.id) is None             # Ya terminado
+    ran = []
+    queue.start(lambda job: ran.append(job) or True)
+    queue.wait(5)
+    assert ran == []
+
+
+def test_cancel_running_is_left_to_the_worker():
+    queue = DownloadQueue()
+    job = queue.add("https://a/0")
+    started = threading.Event()
+
+    def worker(job):
+        started.set()
+        wait_for(lambda: job.cancelled)
+        return False
+
+    queue.start(worker)
+    started.wait(5)
+    assert queue.cancel(job.id) is job
+    assert job.state == RUNNING
+    queue.wait(5)
+    assert job.state == FAILED
+
+
+def test_cancel_after_throttle_is_not_retried():
+    queue = DownloadQueue()
+    job = queue.add("https://a/0")
+
+    def worker(job):
+        job.cancelled = True        # Cancelado entre el 429 y la vuelta a la cola
+        return RETRY
+
+    queue.start(worker)
+    queue.wait(5)
+    assert (job.state, job.error_kind) == (FAILED, "cancelled")
+    assert job.attempts == 1
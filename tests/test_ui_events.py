@@ -0,0 +1,52 @@
+import threading
+
+from video_downloader import UIEventBuffer
+
+
+def test_drain_merges_events():
+    events = UIEventBuffer()
+    fn = lambda: None  # noqa: E731
+    events.log("a")
+    events.status(1, "10%")
+    events.status(1, "20%")
+    events.progress(1, 0.1)
+    events.progress(1, 0.2)
+    events.progress(None, 0.5)
+    events.call(fn)
+    events.call(fn)
+    logs, progress, changed, calls = events.drain()
+    assert logs == [(None, "a", False), (1, "20%", True)]
+    assert progress == {1: 0.2, None: 0.5}
+    assert changed == {}
+    assert calls == [fn]
+    assert events.drain() == ([], {}, {}, [])
+
+
+def test_status_lines_merge_per_key():
+    events = UIEventBuffer()
+    events.status(1, "10%")
+    events.status(2, "50%")
+    events.status(1, "20%")
+    logs, _, _, _ = events.drain()
+    assert logs == [(1, "20%", True), (2, "50%", True)]
+
+
+def test_message_between_status_lines_keeps_order():
+    events = UIEventBuffer()
+    events.status(1, "10%")
+    events.log("hecho", key=1)
+    events.status(1, "20%")
+    logs, _, _, _ = events.drain()
+    assert logs == [(1, "10%", True), (1, "hecho", False), (1, "20%", True)]
+
+
+def test_puts_from_many_threads():
+    events = UIEventBuffer()
+    threads = [threading.Thread(target=lambda i=i: [events.log(f"{i}-{n}") for n in range(100)])
+               for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    logs, _, _, _ = events.drain()
+    assert len(logs) == 800
@@ -0,0 +1,54 @@
+import pytest
+
+from download_queue import DownloadQueue
+from downloader_core import dedup_key, normalize_url, video_key
+
+VIDEO = "dQw4w9WgXcQ"
+
+
+@pytest.mark.parametrize("url", [
+    f"https://youtu.be/{VIDEO}",
+    f"https://www.youtube.com/watch?v={VIDEO}",
+    f"https://www.youtube.com/watch?v={VIDEO}&t=10",
+    f"https://m.youtube.com/watch?v={VIDEO}&feature=share",
+    f"https://www.youtube.com/shorts/{VIDEO}",
+])
+def test_youtube_variants_share_a_key(url):
+    assert video_key(url) == ("Youtube", VIDEO)
+    assert dedup_key(url) == ("Youtube", VIDEO)
+
+
+@pytest.mark.parametrize("url, key", [
+    ("https://vimeo.com/76979871", ("Vimeo", "76979871")),
+    ("https://www.tiktok.com/@user/video/7106594312292453675",
+     ("TikTok", "7106594312292453675")),
+    ("https://www.instagram.com/reel/Cabc123/", ("Instagram", "Cabc123")),
+])
+def test_other_platforms(url, key):
+    assert video_key(url) == key
+
+
+@pytest.mark.parametrize("url", ["https://example.com/a.mp4", "no es una url", ""])
+def test_unknown_urls_fall_back_to_normalized_url(url):
+    assert video_key(url) is None
+    assert dedup_key(url) == ("url", normalize_url(url))
+
+
+@pytest.mark.parametrize("a, b", [
+    ("https://www.Example.com/video/", "http://example.com/video"),
+    ("  https://example.com/v?id=1 ", "https://example.com/v?id=1"),
+    ("https://example.com", "https://example.com/"),
+])
+def test_normalize_url_equivalents(a, b):
+    assert normalize_url(a) == normalize_url(b)
+
+
+def test_normalize_url_keeps_port_and_query():
+    assert normalize_url("http://127.0.0.1:8000/v/0.mp4?x=1") == "127.0.0.1:8000/v/0.mp4?x=1"
+    assert normalize_url("https://example.com/v?id=1") != normalize_url("https://example.com/v?id=2")
+
+
+def test_queue_dedups_by_video():
+    queue = DownloadQueue(key_func=dedup_key)
+    assert queue.add(f"https://youtu.be/{VIDEO}") is not None
+    assert queue.add(f"https://www.youtube.com/watch?v={VIDEO}&t=42") is None
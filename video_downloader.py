@@ -1,68 +1,330 @@
 # ── Imports ligeros primero ────────────────────────────────────────────────
-import tkinter as tk
+import argparse
+import bisect
+import logging
+import logging.handlers
+import queue
 import threading
+from collections import deque
 import os
 import sys
-import json
 import subprocess
+import time
 from pathlib import Path
-from datetime import datetime
-import tkinter.messagebox as messagebox
-import tkinter.filedialog as filedialog
 
+from download_queue import (
+    DownloadQueue, QueueJournal, PENDING, RUNNING, PROCESSING, DONE, FAILED, RETRY,
+)
+from downloader_core import (
+    BandwidthScheduler, ContentStore, DownloadEngine, DownloadHistory, DOWNLOADERS, FormatDecisions,
+    QUALITIES, dedup_key, detectar_plataforma, es_lista, export_metrics, format_bytes,
+    format_duration,
+)
+
+# Los módulos de la GUI solo se cargan en modo ventana (ver _load_gui), así el
+# modo --batch arranca rápido y funciona en máquinas sin display ni Tk.
+tk = ctk = messagebox = filedialog = None
+
+
+def _load_gui():
+    """
+    Carga solo lo que necesita la ventana. yt-dlp (el import más pesado) se
+    importa en un hilo cuando la ventana ya se ve (VideoDownloaderApp._preload).
+    """
+    global tk, ctk, messagebox, filedialog
+    import tkinter as tk
+    import tkinter.messagebox as messagebox
+    import tkinter.filedialog as filedialog
+    import customtkinter as ctk
+
+
+# Cada cuánto el hilo de Tk vacía los eventos de los hilos de descarga
+PUMP_INTERVAL_MS = 75
+
+# Margen para que la ventana se pinte antes de la segunda fase del arranque
+STARTUP_DEFER_MS = 30
+
+# Segundos que se espera al cerrar a que los workers suelten sus descargas
+SHUTDOWN_TIMEOUT = 10
+
+# Estilo oscuro de los Listbox clásicos (cola e historial)
+DARK_LISTBOX = {
+    "bg": "#2b2b2b",
+    "fg": "#dcdcdc",
+    "selectbackground": "#1f538d",
+    "selectforeground": "white",
+    "borderwidth": 0,
+    "highlightthickness": 0,
+    "font": ("Consolas", 10),
+}
+
+
+class UIEventBuffer:
+    """
+    Buffer entre los hilos de descarga y el hilo de Tk.
+
+    Los hilos solo hacen `put` en una SimpleQueue; el bucle principal llama a
+    `drain()` cada PUMP_INTERVAL_MS y aplica de golpe lo acumulado: todas las
+    líneas de log en un solo insert, solo el último progreso de cada trabajo
+    y cada refresco pendiente una sola vez.
+    """
+    LOG, STATUS, PROGRESS, CHANGED, CALL = range(5)
 
-# ── Splash inmediata (aparece antes de cargar los módulos pesados) ─────────
-def _show_splash():
-    s = tk.Tk()
-    s.overrideredirect(True)
-    s.configure(bg="#1c1c1c")
-    w, h = 380, 130
-    sw, sh = s.winfo_screenwidth(), s.winfo_screenheight()
-    s.geometry(f"{w}x{h}+{(sw - w) // 2}+{(sh - h) // 2}")
-    s.attributes("-topmost", True)
-    tk.Label(s, text="🎬  Descargador de Videos",
-             bg="#1c1c1c", fg="white",
-             font=("Arial", 17, "bold")).pack(pady=(26, 6))
-    tk.Label(s, text="Iniciando, un momento...",
-             bg="#1c1c1c", fg="#888888",
-             font=("Arial", 10)).pack()
-    s.update()
-    return s
-
-
-_splash_win = _show_splash()
-
-# ── Imports pesados (se cargan mientras la splash está visible) ────────────
-import customtkinter as ctk  # noqa: E402
-import yt_dlp                # noqa: E402
-
-
-HISTORY_FILE = Path(__file__).parent / "download_history.json"
+    def __init__(self):
+        self._events = queue.SimpleQueue()
+
+    def log(self, message, key=None):
+        """`key` identifica el trabajo (None = mensajes generales)"""
+        self._events.put((self.LOG, message, key))
+
+    def status(self, key, text):
+        """Línea de estado de un trabajo: sustituye a la anterior del mismo key"""
+        self._events.put((self.STATUS, text, key))
+
+    def progress(self, key, fraction):
+        """`key` es el id del trabajo, o None para la barra de progreso"""
+        self._events.put((self.PROGRESS, key, fraction))
+
+    def changed(self, key, item):
+        """`item` (p. ej. un Job) cambió: su fila se repinta una vez por drenado"""
+        self._events.put((self.CHANGED, key, item))
+
+    def call(self, fn):
+        """Pide ejecutar `fn()` en el hilo de Tk (se agrupan repetidos)"""
+        self._events.put((self.CALL, fn))
+
+    def drain(self):
+        """
+        Devuelve (log, {key: último progreso}, {key: item cambiado}, llamadas únicas).
+        `log` es una lista de (key, texto, es_estado) en orden de llegada,
+        con los estados seguidos de un mismo key ya fundidos en uno.
+        """
+        logs, progress, changed, calls = [], {}, {}, []
+        pending_status = {}     # key -> posición en `logs` de su último estado
+        # Solo lo que ya había: si los hilos siguen empujando no bloqueamos Tk
+        for _ in range(self._events.qsize()):
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event[0]
+            if kind == self.LOG:
+                pending_status.pop(event[2], None)
+                logs.append((event[2], event[1], False))
+            elif kind == self.STATUS:
+                pos = pending_status.get(event[2])
+                if pos is None:
+                    pending_status[event[2]] = len(logs)
+                    logs.append((event[2], event[1], True))
+                else:
+                    logs[pos] = (event[2], event[1], True)
+            elif kind == self.PROGRESS:
+                progress[event[1]] = event[2]
+            elif kind == self.CHANGED:
+                changed[event[1]] = event[2]
+            elif event[1] not in calls:
+                calls.append(event[1])
+        return logs, progress, changed, calls
+
+
+# Líneas que se conservan en el cuadro de "Estado"
+LOG_MAX_LINES = 2000
+
+
+class LogBuffer:
+    """
+    Modelo del log de la UI: solo las últimas `capacity` líneas.
+
+    Cada key (trabajo) tiene como mucho una línea de estado "viva" que se
+    reescribe en su sitio; un mensaje normal del mismo key la congela.
+    `apply()` devuelve los cambios mínimos para el widget. Si se indica
+    `log_file`, todas las líneas se copian además a un fichero rotativo.
+    """
+    def __init__(self, capacity=LOG_MAX_LINES, log_file=None):
+        self.capacity = capacity
+        self._lines = deque()
+        self._first = 0         # Índice absoluto de self._lines[0]
+        self._live = {}         # key -> índice absoluto de su línea de estado
+        self._file_log = None
+        if log_file:
+            handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s  %(message)s"))
+            self._file_log = logging.getLogger("video_downloader.log")
+            self._file_log.setLevel(logging.INFO)
+            self._file_log.propagate = False
+            self._file_log.addHandler(handler)
+
+    def __len__(self):
+        return len(self._lines)
+
+    def lines(self):
+        return list(self._lines)
+
+    def apply(self, entries):
+        """
+        Aplica (key, texto, es_estado) y devuelve (updates, nuevas, recorte):
+        - updates: [(nº de línea del widget, texto)] para líneas ya pintadas
+        - nuevas:  líneas a añadir al final
+        - recorte: cuántas líneas borrar del principio (después de añadir)
+        """
+        base = self._first + len(self._lines)
+        updates = {}
+        for key, text, is_status in entries:
+            if self._file_log:
+                self._file_log.info(text)
+            if is_status:
+                idx = self._live.get(key)
+                if idx is not None and idx >= self._first:
+                    self._lines[idx - self._first] = text
+                    if idx < base:
+                        updates[idx] = text
+                    continue
+                self._live[key] = self._first + len(self._lines)
+                self._lines.append(text)
+            else:
+                self._live.pop(key, None)
+                self._lines.extend(text.split("\n"))
+
+        new_lines = [self._lines[i] for i in range(base - self._first, len(self._lines))]
+        trim = max(0, len(self._lines) - self.capacity)
+        for _ in range(trim):
+            self._lines.popleft()
+        old_first = self._first
+        self._first += trim
+        return ([(idx - old_first + 1, text) for idx, text in sorted(updates.items())],
+                new_lines, trim)
+
+
+class VirtualList:
+    """
+    Listbox que solo pinta las filas visibles.
+
+    La vista solo sabe cuántas filas hay (`set_count`) y desde cuál se ve;
+    el texto lo pide a `render(start, stop)` para la ventana visible. Cambiar
+    una fila fuera de la ventana no cuesta nada y `update_rows()` repinta
+    solo las que se ven, así el trabajo de Tk no crece con la lista.
+    """
+    def __init__(self, parent, render, height=4, empty_text="", **listbox_opts):
+        self.render = render
+        self.height = height
+        self.empty_text = empty_text
+        self.count = 0
+        self.top = 0                # Primera fila visible
+        self.selected = None        # Fila seleccionada (índice absoluto)
+
+        self.frame = tk.Frame(parent, bg=listbox_opts.get("bg"))
+        self.listbox = tk.Listbox(self.frame, height=height, activestyle="none",
+                                  exportselection=False, **listbox_opts)
+        self.scrollbar = tk.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.listbox.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        self.listbox.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        self.listbox.bind("<Button-4>", lambda e: self.scroll(-1))   # Rueda en X11
+        self.listbox.bind("<Button-5>", lambda e: self.scroll(1))
+        # Las flechas mueven la selección por toda la lista, no solo la ventana
+        self.listbox.bind("<Up>", lambda e: self._move_selection(-1))
+        self.listbox.bind("<Down>", lambda e: self._move_selection(1))
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def set_count(self, count):
+        """Nuevo número de filas; repinta la ventana visible"""
+        self.count = count
+        if self.selected is not None and self.selected >= count:
+            self.selected = None
+        self.top = max(0, min(self.top, count - self.height))
+        self.redraw()
+
+    def redraw(self):
+        self.listbox.delete(0, "end")
+        if not self.count:
+            if self.empty_text:
+                self.listbox.insert("end", self.empty_text)
+        else:
+            stop = min(self.top + self.height, self.count)
+            for line in self.render(self.top, stop):
+                self.listbox.insert("end", line)
+            self._show_selection()
+        self._update_scrollbar()
+
+    def update_rows(self, rows):
+        """Repinta las filas indicadas que estén a la vista"""
+        stop = min(self.top + self.height, self.count)
+        for row in sorted(set(rows)):
+            if self.top <= row < stop:
+                pos = row - self.top
+                self.listbox.delete(pos)
+                self.listbox.insert(pos, self.render(row, row + 1)[0])
+        self._show_selection()
+
+    def scroll(self, rows):
+        top = max(0, min(self.top + rows, self.count - self.height))
+        if top != self.top:
+            self.top = top
+            self.redraw()
+        return "break"
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            top = int(float(value) * self.count)
+            self.scroll(top - self.top)
+        elif unit == "pages":
+            self.scroll(int(value) * self.height)
+        else:
+            self.scroll(int(value))
 
+    def _update_scrollbar(self):
+        if self.count <= self.height:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.top / self.count, (self.top + self.height) / self.count)
 
-class MyLogger:
-    """Logger personalizado para yt-dlp"""
-    def __init__(self, log_callback):
-        self.log_callback = log_callback
+    def _on_select(self, _event):
+        sel = self.listbox.curselection()
+        if sel and self.count:
+            self.selected = self.top + sel[0]
 
-    def debug(self, msg):
-        if msg.startswith('[debug] '):
-            pass
-        else:
-            self.info(msg)
+    def _move_selection(self, delta):
+        if not self.count:
+            return "break"
+        row = 0 if self.selected is None else max(0, min(self.selected + delta, self.count - 1))
+        self.selected = row
+        if row < self.top:
+            self.scroll(row - self.top)
+        elif row >= self.top + self.height:
+            self.scroll(row - self.top - self.height + 1)
+        self._show_selection()
+        return "break"
 
-    def info(self, msg):
-        self.log_callback(msg)
+    def _show_selection(self):
+        self.listbox.selection_clear(0, "end")
+        if self.selected is not None and self.top <= self.selected < self.top + self.height:
+            self.listbox.selection_set(self.selected - self.top)
 
-    def warning(self, msg):
-        self.log_callback(f"⚠️ {msg}")
 
-    def error(self, msg):
-        self.log_callback(f"✗ {msg}")
+# Filas del historial que se leen de SQLite de una vez (y se guardan en caché)
+HISTORY_BLOCK = 100
+# Espera tras la última tecla antes de buscar en el historial
+SEARCH_DELAY_MS = 200
 
 
 class VideoDownloaderApp:
-    def __init__(self):
+    """
+    Ventana principal. Arranca en dos fases: primero la ventana con la URL,
+    las opciones y la cola (lo necesario para empezar a usarla); cuando ya
+    se ve, `_finish_startup` crea el log, el historial y el rendimiento y un
+    hilo importa yt-dlp y carga las claves del historial. `startup` guarda
+    los segundos de cada fase y `ready` se activa al terminar la precarga.
+    Con `api_port` abre además la API local (control_api) sobre la misma cola.
+    """
+    def __init__(self, log_file=None, api_port=None):
+        self._t0 = time.perf_counter()
+        self.startup = {}
+        self.ready = threading.Event()
         self.window = ctk.CTk()
         self.window.title("Descargador de Videos - Redes Sociales")
         self.window.geometry("750x850")
@@ -73,16 +335,64 @@ class VideoDownloaderApp:
         self.download_path = str(Path.home() / "Downloads" / "MisVideos")
         self.create_download_folder()
 
-        self.is_downloading = False
-        self.download_queue = []        # Lista de URLs en cola
-        self.queue_running = False      # Si la cola está corriendo
-
-        self.history = self.load_history()
+        self.is_downloading = False     # Solo para el botón de descarga directa
+        self.ui_events = UIEventBuffer()
+        self._prefetch_settings = ("best", "no")    # (calidad, cookies) del último "Agregar"
+
+        # El estado "Descargando: x%" ya se pinta en su propia línea
+        self.engine = DownloadEngine(yt_dlp_progress=False)
+        self.engine.subscribe("log", self._on_engine_log)
+        self.engine.subscribe("status", self._on_engine_status)
+        self.engine.subscribe("progress", self._on_engine_progress)
+        self.engine.subscribe("finished", self._on_engine_finished)
+        self.engine.subscribe("error", self._on_engine_error)
+
+        self.download_queue = DownloadQueue(
+            max_workers=3,
+            key_func=dedup_key,
+            on_change=lambda job: self.ui_events.changed(job.id, job),
+            on_finish=self._on_queue_finished,
+            journal=QueueJournal(),
+            scheduler=self.engine.scheduler,
+            prefetch=self._prefetch_job,
+        )
 
+        self.log_buffer = LogBuffer(log_file=log_file)
+        # Filas de la cola tal como se pintan: ids en orden (= orden de llegada)
+        self._queue_ids = []
+        self._queue_jobs = {}
+        self._history_query = ""
+        self._history_blocks = {}       # nº de bloque -> filas (caché de la búsqueda actual)
+        self._search_after = None
+        self._queue_options = None      # Opciones del último "Iniciar Cola" (para la API)
+        self.api_port = api_port
+        self.api = None
         self.create_widgets()
-
-        # Cerrar splash cuando la ventana principal está lista
-        _splash_win.destroy()
+        self._mark("ventana")
+        self.window.after(STARTUP_DEFER_MS, self._finish_startup)
+
+    def _mark(self, phase):
+        self.startup[phase] = time.perf_counter() - self._t0
+
+    def _finish_startup(self):
+        """Segunda fase: paneles de abajo, eventos de la UI y precargas"""
+        self.create_lower_panels()
+        self._pump_ui_events()
+        self._report_restored_queue()
+        if self.api_port is not None:
+            self._start_api()
+        self._mark("paneles")
+        threading.Thread(target=self._preload, daemon=True).start()
+
+    def _preload(self):
+        """Hilo: importa yt-dlp y lee las claves del historial antes de que hagan falta"""
+        try:
+            import yt_dlp  # noqa: F401  (la primera descarga o "Ver Info" no espera)
+            self._mark("yt_dlp")
+            self.engine.history.preload()
+            self._mark("historial")
+        finally:
+            self.ready.set()
 
     # ─────────────────────────────────────────────
     #  Carpeta & paths
@@ -118,58 +428,74 @@ class VideoDownloaderApp:
     #  Historial
     # ─────────────────────────────────────────────
 
-    def load_history(self):
-        if HISTORY_FILE.exists():
-            try:
-                with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception:
-                return []
-        return []
-
-    def save_history(self):
-        try:
-            with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.history, f, ensure_ascii=False, indent=2)
-        except Exception:
-            pass
-
-    def add_to_history(self, url, title, uploader, duration):
-        entry = {
-            "url": url,
-            "title": title,
-            "uploader": uploader,
-            "duration": duration,
-            "date": datetime.now().strftime("%Y-%m-%d %H:%M")
-        }
-        # Evitar duplicados exactos en el historial
-        self.history = [h for h in self.history if h["url"] != url]
-        self.history.insert(0, entry)
-        self.history = self.history[:100]   # Máximo 100 entradas
-        self.save_history()
-        self.refresh_history_list()
-
-    def is_duplicate(self, url):
-        """Comprueba si la URL ya fue descargada antes"""
-        return any(h["url"] == url for h in self.history)
-
     def refresh_history_list(self):
-        """Actualizar la lista de historial en la UI"""
-        self.history_text.configure(state="normal")
-        self.history_text.delete("1.0", "end")
-        if not self.history:
-            self.history_text.insert("end", "  Sin descargas aún\n")
+        """Vuelve a contar el historial (con la búsqueda actual) y repinta lo visible"""
+        self._history_blocks.clear()
+        query = self._history_query
+        count = self.engine.history.count(query)
+        self.history_view.set_count(count)
+        if query:
+            self.history_count_label.configure(text=f"{count} de {len(self.engine.history)}")
         else:
-            for h in self.history[:20]:
-                dur = ""
-                if h.get("duration"):
-                    m, s = divmod(int(h["duration"]), 60)
-                    dur = f"  [{m}m{s:02d}s]"
-                self.history_text.insert(
-                    "end",
-                    f"• {h['date']}  —  {h['title'][:45]}{dur}\n"
-                )
-        self.history_text.configure(state="disabled")
+            self.history_count_label.configure(text=f"{count} descarga(s)")
+
+    def _history_rows(self, start, stop):
+        """Filas [start, stop) del historial filtrado, leídas por bloques"""
+        lines = []
+        for row in range(start, stop):
+            block = row // HISTORY_BLOCK
+            if block not in self._history_blocks:
+                self._history_blocks[block] = self.engine.history.search(
+                    self._history_query, block * HISTORY_BLOCK, HISTORY_BLOCK)
+            entries = self._history_blocks[block]
+            h = entries[row % HISTORY_BLOCK] if row % HISTORY_BLOCK < len(entries) else None
+            lines.append(history_line(h) if h else "")
+        return lines
+
+    def _on_history_search(self, _event=None):
+        """Busca al dejar de teclear (SEARCH_DELAY_MS), no en cada tecla"""
+        if self._search_after is not None:
+            self.window.after_cancel(self._search_after)
+        self._search_after = self.window.after(SEARCH_DELAY_MS, self._apply_history_search)
+
+    def _apply_history_search(self):
+        self._search_after = None
+        query = self.history_search.get().strip()
+        if query != self._history_query:
+            self._history_query = query
+            self.history_view.top = 0
+            self.history_view.selected = None
+            self.refresh_history_list()
+
+    def refresh_metrics_panel(self):
+        """Resumen de telemetría por plataforma (de todo el historial)"""
+        lines = [metrics_line(row) for row in self.engine.history.metrics_summary()]
+        lines += [format_decision_line(key, entry) for key, entry in self.engine.formats.entries()
+                  if key.endswith("|*")]
+        _, linked, saved = self.engine.store.stats()
+        if linked:
+            lines.append(f"Duplicados enlazados: {linked} archivo(s), {format_bytes(saved)} ahorrados")
+        self.metrics_text.configure(state="normal")
+        self.metrics_text.delete("1.0", "end")
+        self.metrics_text.insert("end", "\n".join(lines) + "\n" if lines else "  Sin datos aún\n")
+        self.metrics_text.configure(state="disabled")
+
+    def export_metrics(self):
+        """Guarda la telemetría de todos los intentos en CSV o JSON"""
+        path = filedialog.asksaveasfilename(
+            title="Exportar telemetría",
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON", "*.json")],
+            initialfile="telemetria_descargas.csv"
+        )
+        if not path:
+            return
+        try:
+            n = export_metrics(self.engine.history.metrics(), path)
+        except OSError as e:
+            messagebox.showerror("Error", f"No se pudo exportar:\n{e}")
+            return
+        self.add_log(f"✓ Telemetría exportada: {n} intento(s) → {path}")
 
     # ─────────────────────────────────────────────
     #  Cola de descargas
@@ -181,40 +507,157 @@ class VideoDownloaderApp:
             messagebox.showwarning("URL vacía", "Por favor ingresa una URL válida")
             return
 
-        if url in self.download_queue:
+        # Para el prefetch de metadatos (los StringVar solo se leen aquí)
+        self._prefetch_settings = (self.quality_var.get(), self.use_cookies_var.get())
+
+        if es_lista(url):
+            self.url_entry.delete(0, "end")
+            self.add_log(f"+ Expandiendo lista: {url[:60]}")
+            threading.Thread(target=self._expand_playlist,
+                             args=(url, self._prefetch_settings[1]), daemon=True).start()
+            return
+
+        options = None
+        if self.engine.history.is_duplicate(url) or self._in_folder(url):
+            if not messagebox.askyesno(
+                "Video ya descargado",
+                "Este video ya fue descargado anteriormente.\n\n¿Agregarlo a la cola de nuevo?"
+            ):
+                return
+            options = {"force": True}
+
+        if self.download_queue.add(url, options) is None:
             messagebox.showwarning("Ya en cola", "Esa URL ya está en la cola de descargas")
             return
 
-        self.download_queue.append(url)
         self.url_entry.delete(0, "end")
-        self.refresh_queue_list()
-        self.add_log(f"+ URL agregada a la cola ({len(self.download_queue)} en total)")
+        pending = self.download_queue.count(PENDING, RUNNING, PROCESSING)
+        self.add_log(f"+ URL agregada a la cola ({pending} en total)")
+
+    def _in_folder(self, url):
+        """¿El video ya está en la carpeta de destino elegida? (sin red)"""
+        output_path = self.path_entry.get().strip()
+        try:
+            return bool(output_path) and self.engine.in_folder(url, output_path) is not None
+        except OSError:
+            return False
+
+    def _expand_playlist(self, url, use_cookies, options=None, force=False):
+        """Hilo: mete en la cola las entradas de la lista según van llegando"""
+        added, skipped = feed_playlist(self.engine, self.download_queue, url,
+                                       use_cookies, options, force, log=self.add_log)
+        self.add_log(f"✓ Lista expandida: {added} video(s) añadido(s)"
+                     + (f", {skipped} ya descargado(s) o en cola" if skipped else ""))
 
     def remove_from_queue(self):
         """Eliminar la URL seleccionada de la cola"""
-        selected = self.queue_listbox.curselection()
-        if not selected:
+        idx = self.queue_view.selected
+        if idx is None or idx >= len(self._queue_ids):
+            return
+        job_id = self._queue_ids[idx]
+        removed = self.download_queue.remove(job_id)
+        if removed is None and self.download_queue.get(job_id) is None:
+            self.refresh_queue_list()       # La fila era de un trabajo ya quitado
             return
-        idx = selected[0]
-        if idx < len(self.download_queue):
-            removed = self.download_queue.pop(idx)
-            self.add_log(f"- Eliminado de la cola: {removed[:60]}...")
-            self.refresh_queue_list()
+        if removed is None:
+            messagebox.showwarning("En curso", "No se puede quitar una descarga en curso")
+            return
+        self.add_log(f"- Eliminado de la cola: {removed.url[:60]}...")
+        self.refresh_queue_list()
+
+    QUEUE_STATE_LABELS = {
+        PENDING: "en espera",
+        RUNNING: "descargando",
+        PROCESSING: "procesando",
+        DONE:    "✓ listo",
+        FAILED:  "✗ error",
+    }
 
     def refresh_queue_list(self):
-        self.queue_listbox.delete(0, "end")
-        for i, url in enumerate(self.download_queue, 1):
-            short = url if len(url) <= 70 else url[:67] + "..."
-            self.queue_listbox.insert("end", f"{i}. {short}")
-        self.queue_count_label.configure(
-            text=f"Cola: {len(self.download_queue)} video(s)"
-        )
+        """Recarga la cola entera (tras quitar o limpiar trabajos)"""
+        jobs = self.download_queue.jobs()
+        self._queue_ids = [job.id for job in jobs]
+        self._queue_jobs = {job.id: job for job in jobs}
+        self.queue_view.set_count(len(jobs))
+        self._refresh_queue_header(jobs)
+
+    def _update_queue_rows(self, changed):
+        """
+        Aplica los cambios de la cola sin recargarla: los trabajos nuevos se
+        insertan en su sitio y del resto solo se repintan las filas visibles.
+        Un aviso atrasado de un trabajo ya quitado no lo vuelve a poner.
+        """
+        rows = []
+        added = False
+        for job_id, job in changed.items():
+            if job_id not in self._queue_jobs:
+                if job is None or self.download_queue.get(job_id) is None:
+                    continue            # Cambio de un trabajo que ya no está
+                pos = bisect.bisect_left(self._queue_ids, job_id)
+                self._queue_ids.insert(pos, job_id)
+                self._queue_jobs[job_id] = job
+                added = True
+            else:
+                rows.append(bisect.bisect_left(self._queue_ids, job_id))
+        if added:
+            self.queue_view.set_count(len(self._queue_ids))
+        else:
+            self.queue_view.update_rows(rows)
+        self._refresh_queue_header(self._queue_jobs.values())
+
+    def _queue_rows(self, start, stop):
+        return [self._queue_line(i + 1, self._queue_jobs[self._queue_ids[i]])
+                for i in range(start, stop)]
+
+    def _queue_line(self, n, job):
+        state = self.QUEUE_STATE_LABELS[job.state]
+        if job.state == FAILED and job.cancelled:
+            state = "✗ cancelada"
+        elif job.state == RUNNING and job.progress:
+            state = f"{job.progress * 100:.0f}%"
+            if job.speed:
+                state += f" · {format_bytes(job.speed)}/s"
+        text = job.title or job.url
+        short = text if len(text) <= 50 else text[:47] + "..."
+        line = f"{n}. [{state}] {short}"
+        if job.info:
+            line += "  ·  " + info_line(job.info)
+        return line
+
+    def _refresh_queue_header(self, jobs):
+        """Total de la cola, tamaño y progreso global en la cabecera"""
+        active = [j for j in jobs if j.state in (PENDING, RUNNING, PROCESSING)]
+        total = sum(j.info["size"] or 0 for j in active if j.info)
+        text = f"Cola: {len(active)} video(s)" + (f" · {format_bytes(total)}" if total else "")
+        if any(j.state == RUNNING for j in active):
+            fraction, speed, eta = self.download_queue.progress()
+            text += f" · {fraction * 100:.0f}%"
+            if speed:
+                text += f" · {format_bytes(speed)}/s"
+            if eta:
+                text += f" · quedan {format_duration(eta)}"
+            self.progress_bar.set(fraction)
+        self.queue_count_label.configure(text=text)
+
+    def _prefetch_job(self, job):
+        """Prefetch de la cola (hilo aparte): título, duración, formato y tamaño"""
+        quality, use_cookies = self._prefetch_settings
+        opts = job.options or {}
+        try:
+            job.info = self.engine.prefetch(job.url, opts.get("use_cookies", use_cookies),
+                                            opts.get("quality", quality))
+        except Exception as e:
+            self.add_log(f"⚠️ [Cola #{job.id}] Sin metadatos: {str(e)[:80]}")
+            return
+        job.title = job.info["title"] or job.title
 
     def start_queue(self):
-        if self.queue_running:
+        if self.download_queue.running:
             messagebox.showwarning("Cola activa", "Ya hay una cola en ejecución")
             return
-        if not self.download_queue:
+        self.download_queue.clear_finished()
+        self.refresh_queue_list()
+        if not self.download_queue.count(PENDING) and not self.download_queue.feeding:
             messagebox.showwarning("Cola vacía", "Agrega URLs a la cola primero")
             return
 
@@ -231,30 +674,95 @@ class VideoDownloaderApp:
         # Leer StringVars en el hilo principal antes de pasarlos al hilo de cola
         quality     = self.quality_var.get()
         use_cookies = self.use_cookies_var.get()
+        workers     = int(self.workers_var.get())
 
-        self.queue_running = True
         self.start_queue_btn.configure(state="disabled", text="Ejecutando cola...")
-        thread = threading.Thread(target=self._run_queue, args=(output_path, quality, use_cookies), daemon=True)
-        thread.start()
+        total = self.download_queue.count(PENDING)
+        self.add_log(f"\n▶ Iniciando cola: {total} video(s), {workers} en paralelo\n")
+        self._queue_options = {"output_path": output_path, "quality": quality,
+                               "use_cookies": use_cookies}
+        self.download_queue.start(
+            self._run_queue_job,
+            max_workers=workers,
+            options=self._queue_options,
+        )
+
+    def _start_api(self):
+        """API local (control_api): las URLs que llegan por ella arrancan la cola"""
+        from control_api import ControlAPI
+
+        self.api = ControlAPI(
+            self.download_queue, self.engine, port=self.api_port,
+            defaults=lambda: self._queue_options,
+            expand=lambda url, options, force: self._expand_playlist(
+                url, (options or {}).get("use_cookies", self._prefetch_settings[1]), options, force),
+            on_enqueue=lambda: self.ui_events.call(self._start_queue_from_api),
+            log=self.add_log,
+        )
+        try:
+            host, port = self.api.start()
+        except OSError as e:
+            self.api = None
+            self.add_log(f"✗ No se pudo abrir la API local en el puerto {self.api_port}: {e}")
+            return
+        self.add_log(f"→ API local en http://{host}:{port}")
+
+    def _start_queue_from_api(self):
+        if not self.download_queue.running:
+            self.start_queue()
+
+    def _run_queue_job(self, job):
+        """Worker de la cola: se ejecuta en un hilo del pool"""
+        self.add_log(f"\n[Cola #{job.id}] {job.url[:60]}")
+        return run_job(self.engine, job)
 
-    def _run_queue(self, output_path, quality, use_cookies):
-        total = len(self.download_queue)
-        self.add_log(f"\n▶ Iniciando cola: {total} video(s)\n")
-
-        while self.download_queue:
-            url = self.download_queue[0]
-            self.add_log(f"\n[Cola] {len(self.download_queue)} restante(s) — {url[:60]}")
-            self.download_video(url, output_path, quality, use_cookies, silent=True)
-            # Quitar de la cola solo si descargó (o falló)
-            if self.download_queue and self.download_queue[0] == url:
-                self.download_queue.pop(0)
-            self.window.after(0, self.refresh_queue_list)
-
-        self.queue_running = False
-        self.window.after(0, lambda: self.start_queue_btn.configure(
+    def _report_restored_queue(self):
+        """Avisa de la cola recuperada y la reanuda si se cortó a medias"""
+        restored = self.download_queue.restored
+        if not restored:
+            return
+        self.refresh_queue_list()
+        self.add_log(f"↺ {len(restored)} video(s) recuperado(s) de la cola anterior")
+        if any(job.resumed for job in restored):
+            self.add_log("↺ La cola se interrumpió a medias: reanudando...")
+            self.window.after(500, self.start_queue)
+
+    RATE_LIMITS = {
+        "Sin límite": None,
+        "1 MB/s":  1 * 1024 * 1024,
+        "2 MB/s":  2 * 1024 * 1024,
+        "5 MB/s":  5 * 1024 * 1024,
+        "10 MB/s": 10 * 1024 * 1024,
+    }
+
+    def set_rate_limit(self, choice):
+        """Presupuesto global de bytes/s, repartido entre las descargas activas"""
+        self.engine.scheduler.set_budget(self.RATE_LIMITS[choice])
+        self.add_log(f"→ Límite de ancho de banda: {choice}")
+
+    def _on_queue_finished(self):
+        done   = self.download_queue.count(DONE)
+        failed = self.download_queue.count(FAILED)
+        self.ui_events.call(lambda: self.start_queue_btn.configure(
             state="normal", text="▶ Iniciar Cola"
         ))
-        self.add_log("\n✓ Cola finalizada")
+        self.ui_events.call(self.refresh_queue_list)
+        self.add_log(f"\n✓ Cola finalizada ({done} completada(s), {failed} con error)")
+
+    def refresh_cookies(self):
+        """Volver a leer las cookies de Brave (p. ej. tras iniciar sesión)"""
+        self.cookies_btn.configure(state="disabled")
+
+        def _refresh():
+            try:
+                self.engine.cookies.refresh(self.add_log)
+            except Exception as e:
+                self.add_log(f"✗ No se pudieron leer las cookies de Brave: {e}")
+                self.add_log("  Cierra Brave completamente e inténtalo de nuevo")
+            finally:
+                self.ui_events.call(lambda: self.cookies_btn.configure(state="normal"))
+
+        threading.Thread(target=_refresh, daemon=True).start()
 
     # ─────────────────────────────────────────────
     #  Info del video antes de descargar
@@ -267,32 +775,22 @@ class VideoDownloaderApp:
             return
         self.info_btn.configure(state="disabled", text="Consultando...")
         self.add_log(f"\nConsultando info de: {url[:60]}...")
-        thread = threading.Thread(target=self._fetch_info_thread, args=(url,), daemon=True)
+        # Leer la StringVar aquí: Tk no es seguro desde otros hilos
+        use_cookies = self.use_cookies_var.get()
+        thread = threading.Thread(target=self._fetch_info_thread, args=(url, use_cookies), daemon=True)
         thread.start()
 
-    def _fetch_info_thread(self, url):
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'skip_download': True,
-        }
-        if self.use_cookies_var.get() == "si":
-            ydl_opts['cookiesfrombrowser'] = ('brave',)
-
+    def _fetch_info_thread(self, url, use_cookies):
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
+            info = self.engine.fetch_info(url, use_cookies)
 
             title    = info.get('title', 'Sin título')
             uploader = info.get('uploader', 'Desconocido')
             duration = info.get('duration', 0)
             views    = info.get('view_count')
-            platform = self.detectar_plataforma(url).upper()
+            platform = detectar_plataforma(url).upper()
 
-            dur_str = ""
-            if duration:
-                m, s = divmod(int(duration), 60)
-                dur_str = f"{m}m {s:02d}s"
+            dur_str = format_duration(duration)
 
             lines = [
                 "",
@@ -313,7 +811,7 @@ class VideoDownloaderApp:
         except Exception as e:
             self.add_log(f"✗ No se pudo obtener info: {e}")
         finally:
-            self.window.after(0, lambda: self.info_btn.configure(
+            self.ui_events.call(lambda: self.info_btn.configure(
                 state="normal", text="Ver Info"
             ))
 
@@ -367,7 +865,7 @@ class VideoDownloaderApp:
         self.quality_var = ctk.StringVar(value="best")
         ctk.CTkOptionMenu(
             opts_frame,
-            values=["best", "720p", "480p", "360p"],
+            values=QUALITIES,
             variable=self.quality_var,
             width=110
         ).pack(side="left", padx=(0, 20))
@@ -382,6 +880,14 @@ class VideoDownloaderApp:
             width=80
         ).pack(side="left")
 
+        self.cookies_btn = ctk.CTkButton(
+            opts_frame,
+            text="↻",
+            width=30,
+            command=self.refresh_cookies
+        )
+        self.cookies_btn.pack(side="left", padx=(4, 0))
+
         ctk.CTkLabel(
             opts_frame,
             text="(cierra Brave si hay error)",
@@ -461,6 +967,29 @@ class VideoDownloaderApp:
         )
         self.start_queue_btn.pack(side="right", padx=(0, 4))
 
+        # Descargas simultáneas de la cola
+        self.workers_var = ctk.StringVar(value="3")
+        ctk.CTkOptionMenu(
+            queue_header,
+            values=["1", "2", "3", "4", "6", "8"],
+            variable=self.workers_var,
+            width=60,
+            height=30
+        ).pack(side="right", padx=(0, 4))
+        ctk.CTkLabel(queue_header, text="Simultáneas:").pack(side="right", padx=(0, 4))
+
+        # Ancho de banda total para todas las descargas
+        self.rate_var = ctk.StringVar(value="Sin límite")
+        ctk.CTkOptionMenu(
+            queue_header,
+            values=list(self.RATE_LIMITS),
+            variable=self.rate_var,
+            command=self.set_rate_limit,
+            width=100,
+            height=30
+        ).pack(side="right", padx=(0, 4))
+        ctk.CTkLabel(queue_header, text="Límite:").pack(side="right", padx=(0, 4))
+
         ctk.CTkButton(
             queue_header,
             text="✕ Quitar",
@@ -471,28 +1000,34 @@ class VideoDownloaderApp:
             hover_color="#444"
         ).pack(side="right", padx=(0, 4))
 
-        # Listbox de la cola (usando Tkinter clásico con estilo oscuro)
-        import tkinter as tk
-        self.queue_listbox = tk.Listbox(
+        # Lista de la cola (Listbox clásico con estilo oscuro, solo filas visibles)
+        self.queue_view = VirtualList(
             queue_outer,
+            self._queue_rows,
             height=4,
-            bg="#2b2b2b",
-            fg="#dcdcdc",
-            selectbackground="#1f538d",
-            selectforeground="white",
-            borderwidth=0,
-            highlightthickness=0,
-            font=("Consolas", 10)
+            **DARK_LISTBOX
         )
-        self.queue_listbox.pack(fill="x", padx=8, pady=(0, 8))
+        self.queue_view.pack(fill="x", padx=8, pady=(0, 8))
 
         # ── Barra de progreso ──
         self.progress_bar = ctk.CTkProgressBar(self.window, width=680)
         self.progress_bar.pack(pady=(8, 0))
         self.progress_bar.set(0)
 
+    def create_lower_panels(self):
+        """Log, historial y rendimiento (segunda fase del arranque)"""
         # ── Log ──
-        ctk.CTkLabel(self.window, text="Estado:").pack(pady=(6, 0))
+        log_header = ctk.CTkFrame(self.window, fg_color="transparent")
+        log_header.pack(pady=(6, 0), padx=20, fill="x")
+        ctk.CTkLabel(log_header, text="Estado:").pack(side="left", expand=True)
+        self._cache_stats = None
+        self.cache_label = ctk.CTkLabel(
+            log_header,
+            text="",
+            font=ctk.CTkFont(size=10),
+            text_color="gray"
+        )
+        self.cache_label.pack(side="right")
         self.log_text = ctk.CTkTextbox(self.window, width=700, height=120)
         self.log_text.pack(pady=(4, 0), padx=20)
 
@@ -500,16 +1035,63 @@ class VideoDownloaderApp:
         hist_frame = ctk.CTkFrame(self.window)
         hist_frame.pack(pady=8, padx=20, fill="x")
 
+        hist_header = ctk.CTkFrame(hist_frame, fg_color="transparent")
+        hist_header.pack(fill="x", padx=8, pady=(6, 2))
         ctk.CTkLabel(
-            hist_frame,
+            hist_header,
             text="Historial de descargas:",
             font=ctk.CTkFont(weight="bold")
-        ).pack(anchor="w", padx=10, pady=(6, 2))
+        ).pack(side="left", padx=2)
+        self.history_count_label = ctk.CTkLabel(
+            hist_header,
+            text="",
+            font=ctk.CTkFont(size=10),
+            text_color="gray"
+        )
+        self.history_count_label.pack(side="right")
+        self.history_search = ctk.CTkEntry(
+            hist_header,
+            placeholder_text="Buscar (título, autor o URL)...",
+            width=240,
+            height=26
+        )
+        self.history_search.pack(side="right", padx=(0, 8))
+        self.history_search.bind("<KeyRelease>", self._on_history_search)
 
-        self.history_text = ctk.CTkTextbox(hist_frame, width=700, height=100, state="disabled")
-        self.history_text.pack(padx=8, pady=(0, 8))
+        self.history_view = VirtualList(
+            hist_frame,
+            self._history_rows,
+            height=5,
+            empty_text="  Sin descargas aún",
+            **DARK_LISTBOX
+        )
+        self.history_view.pack(fill="x", padx=8, pady=(0, 8))
+
+        # ── Rendimiento ──
+        metrics_frame = ctk.CTkFrame(self.window)
+        metrics_frame.pack(pady=(0, 8), padx=20, fill="x")
+
+        metrics_header = ctk.CTkFrame(metrics_frame, fg_color="transparent")
+        metrics_header.pack(fill="x", padx=8, pady=(6, 2))
+        ctk.CTkLabel(
+            metrics_header,
+            text="Rendimiento por plataforma (media por intento):",
+            font=ctk.CTkFont(weight="bold")
+        ).pack(side="left", padx=2)
+        ctk.CTkButton(
+            metrics_header,
+            text="Exportar CSV/JSON",
+            command=self.export_metrics,
+            width=140,
+            height=26
+        ).pack(side="right")
+
+        self.metrics_text = ctk.CTkTextbox(metrics_frame, width=700, height=70, state="disabled",
+                                           font=ctk.CTkFont(family="Consolas", size=11))
+        self.metrics_text.pack(padx=8, pady=(0, 8))
 
         self.refresh_history_list()
+        self.refresh_metrics_panel()
         self.add_log("Listo para descargar videos")
 
     # ─────────────────────────────────────────────
@@ -517,190 +1099,123 @@ class VideoDownloaderApp:
     # ─────────────────────────────────────────────
 
     def add_log(self, message):
-        def _update():
-            self.log_text.insert("end", f"{message}\n")
-            self.log_text.see("end")
-        self.window.after(0, _update)
+        """Seguro desde cualquier hilo: la línea se pinta en el próximo pump"""
+        self.ui_events.log(message)
+
+    def _pump_ui_events(self):
+        """Aplica en el hilo de Tk todo lo acumulado desde el último pump"""
+        # Se reprograma antes de aplicar nada: si una llamada abre un diálogo
+        # modal (messagebox), su bucle sigue ejecutando los pumps siguientes
+        self.window.after(PUMP_INTERVAL_MS, self._pump_ui_events)
+        logs, progress, changed, calls = self.ui_events.drain()
+        if logs:
+            self._apply_log(logs)
+        if None in progress:
+            self.progress_bar.set(progress.pop(None))
+        for job_id in progress:
+            changed.setdefault(job_id, None)        # job.progress ya está al día
+        if changed:
+            self._update_queue_rows(changed)
+        self._refresh_cache_label()
+        for fn in calls:
+            fn()
+
+    def _refresh_cache_label(self):
+        stats = self.engine.info_cache.stats()
+        if stats != self._cache_stats:
+            self._cache_stats = stats
+            self.cache_label.configure(
+                text=f"Caché de info: {stats[0]} acierto(s) · {stats[1]} fallo(s)"
+            )
+
+    def _apply_log(self, entries):
+        """Pasa al widget solo lo que cambió según el LogBuffer"""
+        updates, new_lines, trim = self.log_buffer.apply(entries)
+        for line_no, text in updates:
+            self.log_text.delete(f"{line_no}.0", f"{line_no}.end")
+            self.log_text.insert(f"{line_no}.0", text)
+        if new_lines:
+            self.log_text.insert("end", "\n".join(new_lines) + "\n")
+        if trim:
+            self.log_text.delete("1.0", f"{trim + 1}.0")
+        self.log_text.see("end")
 
     # ─────────────────────────────────────────────
-    #  Detección de plataforma
+    #  Eventos del motor (llegan desde los hilos de descarga)
     # ─────────────────────────────────────────────
 
-    def detectar_plataforma(self, url):
-        url_lower = url.lower()
-        if 'facebook.com' in url_lower or 'fb.watch' in url_lower:
-            return 'facebook'
-        elif 'tiktok.com' in url_lower:
-            return 'tiktok'
-        elif 'youtube.com' in url_lower or 'youtu.be' in url_lower:
-            return 'youtube'
-        elif 'instagram.com' in url_lower:
-            return 'instagram'
-        elif 'twitter.com' in url_lower or 'x.com' in url_lower:
-            return 'twitter'
-        return 'other'
+    def _on_engine_log(self, job, message):
+        if job is not None and message:
+            message = f"[#{job.id}] {message}"
+        self.ui_events.log(message, job.id if job is not None else None)
 
-    # ─────────────────────────────────────────────
-    #  Progress hook
-    # ─────────────────────────────────────────────
+    def _on_engine_status(self, job, text):
+        if job is not None:
+            self.ui_events.status(job.id, f"[#{job.id}] {text}")
+        else:
+            self.ui_events.status(None, text)
+
+    def _on_engine_progress(self, job, fraction):
+        # En modo cola el progreso va a la fila del trabajo (job.progress)
+        self.ui_events.progress(job.id if job is not None else None, fraction)
+
+    def _on_engine_finished(self, job, url, info):
+        self.ui_events.call(self.refresh_history_list)
+        self.ui_events.call(self.refresh_metrics_panel)
+        if job is None:
+            title = info.get('title', 'Video sin título')
+            self.ui_events.call(lambda: messagebox.showinfo(
+                "¡Éxito!",
+                f"Video descargado correctamente:\n\n{title}\n\nGuardado en:\n{self.path_entry.get().strip()}"
+            ))
 
-    def progress_hook(self, d):
-        if d['status'] == 'downloading':
-            if 'downloaded_bytes' in d and 'total_bytes' in d:
-                pct = d['downloaded_bytes'] / d['total_bytes']
-                self.window.after(0, lambda p=pct: self.progress_bar.set(p))
-            elif '_percent_str' in d:
-                try:
-                    pct = float(d['_percent_str'].strip().replace('%', '')) / 100
-                    self.window.after(0, lambda p=pct: self.progress_bar.set(p))
-                except Exception:
-                    pass
-
-            if '_percent_str' in d:
-                speed = d.get('_speed_str', 'N/A')
-                self.add_log(f"Descargando: {d['_percent_str']} - Velocidad: {speed}")
-
-        elif d['status'] == 'finished':
-            self.window.after(0, lambda: self.progress_bar.set(1))
-            self.add_log("Descarga completada, procesando...")
+    def _on_engine_error(self, job, url, kind, message):
+        self.ui_events.call(self.refresh_metrics_panel)
+        if job is not None:
+            return      # En la cola los errores solo van al log
+        if kind == "cookies":
+            title, text = (
+                "Error de Cookies",
+                "El navegador Brave está abierto y bloqueó el acceso a las cookies.\n\n"
+                "SOLUCIÓN:\n"
+                "1. Cierra Brave completamente\n"
+                "2. Intenta de nuevo\n\n"
+                "O cambia 'Usar cookies' a 'no'"
+            )
+        elif kind == "unavailable":
+            title, text = (
+                "Video no accesible",
+                "No se puede acceder a este video.\n\n"
+                "Verifica que:\n"
+                "• El video sea público O\n"
+                "• Estés usando cookies con sesión iniciada"
+            )
+        elif kind == "throttled":
+            title, text = (
+                "Demasiadas peticiones",
+                "La plataforma está limitando las descargas (HTTP 429/403).\n\n"
+                "Espera unos minutos antes de volver a intentarlo."
+            )
+        elif kind == "unexpected":
+            title, text = "Error", f"Error inesperado:\n\n{message}"
+        else:
+            title, text = "Error", f"Error al descargar:\n\n{message}"
+        self.ui_events.call(lambda: messagebox.showerror(title, text))
 
     # ─────────────────────────────────────────────
-    #  Descarga
+    #  Descarga directa
     # ─────────────────────────────────────────────
 
-    def download_video(self, url, output_path, quality, use_cookies, silent=False):
+    def download_video(self, url, output_path, quality, use_cookies):
+        """Hilo de la descarga directa (botón "Descargar Video")"""
         try:
-            plataforma = self.detectar_plataforma(url)
-            self.add_log(f"Iniciando descarga desde: {url}")
-            self.add_log(f"→ Plataforma detectada: {plataforma.upper()}")
-
-            ydl_opts = {
-                'outtmpl': os.path.join(output_path, '%(title)s [%(uploader)s].%(ext)s'),
-                'logger': MyLogger(self.add_log),
-                'progress_hooks': [self.progress_hook],
-                'merge_output_format': 'mp4',
-                'postprocessor_args': {'ffmpeg': ['-c:a', 'aac']},
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-us,en;q=0.5',
-                    'Sec-Fetch-Mode': 'navigate',
-                },
-                'extractor_retries': 3,
-                'fragment_retries': 10,
-                'skip_unavailable_fragments': True,
-                'ignoreerrors': False,
-                'nocheckcertificate': False,
-            }
-
-            if use_cookies == "si":
-                self.add_log("→ Usando cookies de Brave...")
-                ydl_opts['cookiesfrombrowser'] = ('brave',)
-
-            if quality == "best":
-                if plataforma == 'youtube':
-                    ydl_opts['format'] = 'bestvideo[height<=2160][protocol^=https]+bestaudio[protocol^=https]/best[height<=2160]/bestvideo+bestaudio/best'
-                    self.add_log("→ Formato: YouTube optimizado (hasta 4K)")
-                else:
-                    ydl_opts['format'] = 'bestvideo+bestaudio/best'
-                    self.add_log("→ Formato: Mejor calidad disponible")
-            elif quality == "720p":
-                ydl_opts['format'] = 'bestvideo[height<=720]+bestaudio/best[height<=720]'
-                self.add_log("→ Formato: 720p")
-            elif quality == "480p":
-                ydl_opts['format'] = 'bestvideo[height<=480]+bestaudio/best[height<=480]'
-                self.add_log("→ Formato: 480p")
-            elif quality == "360p":
-                ydl_opts['format'] = 'bestvideo[height<=360]+bestaudio/best[height<=360]'
-                self.add_log("→ Formato: 360p")
-
-            if plataforma == 'facebook':
-                self.add_log("→ Aplicando optimizaciones para Facebook...")
-                ydl_opts['extractor_args'] = {'facebook': {'logged_in_tab': False}}
-            elif plataforma == 'instagram':
-                self.add_log("→ Aplicando optimizaciones para Instagram...")
-                if use_cookies != "si":
-                    self.add_log("  ⚠️ Consejo: Usa cookies para mejor compatibilidad")
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                self.add_log("→ Extrayendo información del video...")
-                info = ydl.extract_info(url, download=True)
-
-                if info:
-                    title    = info.get('title', 'Video sin título')
-                    duration = info.get('duration', 0)
-                    uploader = info.get('uploader', 'Desconocido')
-
-                    self.add_log("")
-                    self.add_log(f"✓ ¡Descarga completada!")
-                    self.add_log(f"  Título: {title}")
-                    self.add_log(f"  Autor:  {uploader}")
-                    if duration:
-                        m, s = divmod(int(duration), 60)
-                        self.add_log(f"  Duración: {m}m {s:02d}s")
-                    self.add_log(f"  Guardado en: {output_path}")
-
-                    # Guardar en historial
-                    self.window.after(0, lambda: self.add_to_history(url, title, uploader, duration))
-
-                    if not silent:
-                        messagebox.showinfo(
-                            "¡Éxito!",
-                            f"Video descargado correctamente:\n\n{title}\n\nGuardado en:\n{output_path}"
-                        )
-                else:
-                    raise Exception("No se pudo extraer información del video")
-
-        except yt_dlp.utils.DownloadError as e:
-            error_msg = str(e)
-            self.add_log("")
-            self.add_log(f"✗ Error de descarga: {error_msg}")
-
-            if "cookie" in error_msg.lower() or "could not copy" in error_msg.lower():
-                self.add_log("")
-                self.add_log("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
-                self.add_log("⚠️  ERROR DE COOKIES")
-                self.add_log("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
-                self.add_log("1. CIERRA completamente Brave")
-                self.add_log("2. Intenta descargar de nuevo")
-                if not silent:
-                    messagebox.showerror(
-                        "Error de Cookies",
-                        "El navegador Brave está abierto y bloqueó el acceso a las cookies.\n\n"
-                        "SOLUCIÓN:\n"
-                        "1. Cierra Brave completamente\n"
-                        "2. Intenta de nuevo\n\n"
-                        "O cambia 'Usar cookies' a 'no'"
-                    )
-            elif "Cannot parse data" in error_msg or "Unsupported URL" in error_msg:
-                self.add_log("")
-                self.add_log("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
-                self.add_log("⚠️  NO SE PUEDE ACCEDER AL VIDEO")
-                self.add_log("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
-                self.add_log("• Video privado, URL inválida, o necesitas autenticación")
-                if not silent:
-                    messagebox.showerror(
-                        "Video no accesible",
-                        "No se puede acceder a este video.\n\n"
-                        "Verifica que:\n"
-                        "• El video sea público O\n"
-                        "• Estés usando cookies con sesión iniciada"
-                    )
-            else:
-                if not silent:
-                    messagebox.showerror("Error", f"Error al descargar:\n\n{error_msg}")
-
-        except Exception as e:
-            self.add_log(f"✗ Error inesperado: {e}")
-            if not silent:
-                messagebox.showerror("Error", f"Error inesperado:\n\n{e}")
-
+            self.engine.download(url, output_path, quality, use_cookies)
         finally:
             self.is_downloading = False
-            self.window.after(0, lambda: self.download_button.configure(
+            self.ui_events.call(lambda: self.download_button.configure(
                 state="normal", text="⬇ Descargar Video"
             ))
-            self.window.after(0, lambda: self.progress_bar.set(0))
+            self.ui_events.progress(None, 0)
 
     def start_download(self):
         if self.is_downloading:
@@ -713,7 +1228,7 @@ class VideoDownloaderApp:
             return
 
         # ── Comprobación de duplicado ──
-        if self.is_duplicate(url):
+        if self.engine.history.is_duplicate(url) or self._in_folder(url):
             respuesta = messagebox.askyesno(
                 "Video ya descargado",
                 "Esta URL ya fue descargada anteriormente.\n\n¿Deseas descargarla de nuevo?"
@@ -748,8 +1263,355 @@ class VideoDownloaderApp:
 
     def run(self):
         self.window.mainloop()
+        if self.api is not None:
+            self.api.stop()
+        # Primero los workers: si no, uno que termine la transferencia se
+        # encuentra el pool de post-procesado cerrado
+        self.download_queue.shutdown(SHUTDOWN_TIMEOUT)
+        self.download_queue.close()
+        self.engine.close()                 # Termina los post-procesados en curso
+        self.download_queue.journal.close()
+
+
+# ─────────────────────────────────────────────
+#  Modo por lotes (sin GUI)
+# ─────────────────────────────────────────────
+
+def history_line(h):
+    """'• 2024-05-01 12:00  —  Título  [3m07s]' de una entrada del historial"""
+    dur = f"  [{format_duration(h['duration'], sep='')}]" if h.get("duration") else ""
+    return f"• {h['date']}  —  {(h['title'] or h['url'])[:60]}{dur}"
+
+
+def info_line(info):
+    """'3m07s · 1080p mp4 · 45.2 MB' a partir de info_summary"""
+    parts = (format_duration(info["duration"], sep=""), info["format"], format_bytes(info["size"]))
+    return " · ".join(p for p in parts if p)
+
+
+def summarize_metrics(metrics):
+    """Como history.metrics_summary() pero de los DownloadMetrics dados (último intento)"""
+    groups = {}
+    for m in metrics:
+        if m is not None:
+            groups.setdefault(m.platform, []).append(m.as_dict())
+    rows = []
+    for platform, items in groups.items():
+        n = len(items)
+        transfer = sum(d["t_transfer"] for d in items)
+        row = {"platform": platform, "attempts": n, "ok": sum(d["ok"] for d in items)}
+        for f in ("t_cookies", "t_extract", "t_transfer", "t_postproc", "t_total"):
+            row[f] = sum(d[f] for d in items) / n
+        row["bytes"] = sum(d["bytes"] for d in items)
+        row["avg_speed"] = row["bytes"] / transfer if transfer else None
+        row["peak_speed"] = max(d["peak_speed"] for d in items)
+        row["retries"] = sum(d["retries"] for d in items)
+        row["fragment_failures"] = sum(d["fragment_failures"] for d in items)
+        rows.append(row)
+    return sorted(rows, key=lambda r: -r["t_total"] * r["attempts"])
+
+
+def format_decision_line(key, entry):
+    """'Formato YOUTUBE best: best[height<=2160] (https) · 1 rama descartada'"""
+    plataforma, quality, uploader = key.split("|", 2)
+    line = f"Formato {plataforma.upper()} {quality}"
+    if uploader != "*":
+        line += f" ({uploader})"
+    line += f": {entry['branch']}"
+    if entry.get("protocol"):
+        line += f" ({entry['protocol']})"
+    demoted = FormatDecisions.demoted(entry)
+    if demoted:
+        line += f" · {len(demoted)} rama(s) descartada(s)"
+    return line
+
+
+def metrics_line(row):
+    """Una línea del resumen de history.metrics_summary()"""
+    speed = f"{format_bytes(row['avg_speed'])}/s" if row["avg_speed"] else "—"
+    line = (f"{(row['platform'] or '?').upper():9s} {row['ok'] or 0}/{row['attempts']} ok · "
+            f"cookies {row['t_cookies'] or 0:.1f}s · extracción {row['t_extract'] or 0:.1f}s · "
+            f"transferencia {row['t_transfer'] or 0:.1f}s · post {row['t_postproc'] or 0:.1f}s · "
+            f"{format_bytes(row['bytes']) or '0 B'} a {speed}")
+    if row["peak_speed"]:
+        line += f" (pico {format_bytes(row['peak_speed'])}/s)"
+    if row["retries"] or row["fragment_failures"]:
+        line += f" · {row['retries'] or 0} reintento(s), {row['fragment_failures'] or 0} fragmento(s) fallido(s)"
+    return line
+
+
+def feed_playlist(engine, queue, url, use_cookies="no", options=None, force=False, log=print):
+    """
+    Expande una playlist/canal en trabajos de la cola a medida que yt-dlp la
+    pagina; los workers pueden ir descargando mientras tanto. Las entradas ya
+    descargadas o que ya están en la carpeta de destino (salvo `force`) y
+    las que ya están en cola se omiten. Devuelve (añadidos, omitidos).
+    """
+    added = skipped = 0
+    output_path = (options or {}).get("output_path")
+    folder = engine.folder_index(output_path) if output_path else None
+    with queue.producer():
+        try:
+            for entry in engine.iter_playlist(url, use_cookies):
+                if not force and (
+                        engine.history.is_duplicate(entry["url"], entry["extractor"], entry["id"])
+                        or (folder is not None and entry["extractor"] and entry["id"]
+                            and folder.lookup(entry["extractor"], entry["id"]) is not None)):
+                    skipped += 1
+                    continue
+                job = queue.add(entry["url"], options)
+                if job is None:
+                    skipped += 1
+                    continue
+                job.title = job.title or entry["title"]
+                added += 1
+                if added % 100 == 0:
+                    log(f"  … {added} video(s) de la lista en cola")
+        except Exception as e:
+            log(f"✗ No se pudo expandir la lista: {e}")
+    return added, skipped
+
+
+THROTTLE_RETRIES = 3     # Intentos de un trabajo que la plataforma bloquea con 429/403
+
+
+def run_job(engine, job):
+    """
+    Descarga un trabajo de la cola con sus propias opciones.
+    Un trabajo recuperado que ya está en el historial terminó justo antes del
+    cierre (solo faltaba apuntarlo en el diario): no se vuelve a descargar.
+    Si la plataforma lo bloquea (429/403) vuelve a la cola, que espera a que
+    pase la pausa del planificador antes de reintentarlo. La fusión con
+    ffmpeg se encola aparte (devuelve un Future) y el worker sigue con la
+    siguiente URL. Si el video ya está en la carpeta de destino se da por
+    hecho sin tocar la red.
+    """
+    opts = job.options or {}
+    output_path = opts.get("output_path")
+    if job.cancelled:
+        job.error, job.error_kind = "Cancelada", "cancelled"
+        engine.emit("log", job, "✗ Descarga cancelada")
+        return False
+    if job.resumed and not opts.get("force") and engine.history.is_duplicate(job.url):
+        engine.emit("log", job, "= Ya se había completado antes del cierre")
+        return True
+    if not output_path:
+        job.error = "Sin carpeta de destino"
+        engine.emit("log", job, "✗ El trabajo no tiene carpeta de destino")
+        return False
+    if not opts.get("force"):
+        existing = engine.in_folder(job.url, output_path)
+        if existing is not None:
+            engine.emit("log", job, f"= Ya está en la carpeta: {existing or job.url}")
+            return True
+    ok = engine.download(job.url, output_path, opts.get("quality", "best"),
+                         opts.get("use_cookies", "no"), job=job, pipeline=True)
+    if not ok and job.error_kind == "throttled" and job.attempts < THROTTLE_RETRIES:
+        engine.emit("log", job, f"↺ Se reintentará más tarde (intento {job.attempts}/{THROTTLE_RETRIES})")
+        return RETRY
+    return ok
+
+
+def read_url_file(path):
+    """URLs de un fichero (una por línea, '#' para comentarios; '-' = stdin)"""
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        return [line.strip() for line in f
+                if line.strip() and not line.lstrip().startswith("#")]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def run_batch(urls, output_path, quality="best", use_cookies="no", jobs=3, force=False,
+              journal_path=None, rate_limit=None, fragments=None, downloader="auto",
+              metrics_path=None, api_port=None, serve=False):
+    """
+    Descarga una lista de URLs sin tocar Tk. Devuelve el código de salida.
+    Los videos que ya están en el historial o en `output_path` se omiten
+    salvo con `force`.
+    Con `journal_path` la cola se guarda en disco y, si el proceso se corta,
+    la siguiente ejecución con el mismo diario continúa donde se quedó.
+    `rate_limit` (bytes/s) se reparte entre todas las descargas a la vez.
+    `fragments` y `downloader` van al DownloadEngine (HLS/DASH y aria2c).
+    Al terminar se resume la telemetría de esta ejecución por plataforma y,
+    con `metrics_path`, se exporta la de todo el historial (CSV o JSON).
+    Con `api_port` la API local (control_api) acepta más URLs y muestra el
+    estado mientras dura el lote; con `serve` el proceso sigue esperando
+    URLs por la API hasta Ctrl+C.
+    """
+    print_lock = threading.Lock()
+
+    def log(msg):
+        with print_lock:
+            print(msg, flush=True)
+
+    engine = DownloadEngine(scheduler=BandwidthScheduler(budget=rate_limit),
+                            fragments=fragments, downloader=downloader)
+    engine.subscribe("log", lambda job, msg: msg and log(f"[#{job.id}] {msg}" if job else msg))
+
+    Path(output_path).mkdir(parents=True, exist_ok=True)
+    journal = QueueJournal(journal_path) if journal_path else None
+
+    def prefetch(job):
+        # Metadatos de los siguientes mientras los primeros ya descargan
+        job.info = engine.prefetch(job.url, use_cookies, quality)
+        log(f"[#{job.id}] ℹ {job.info['title']}  ·  {info_line(job.info)}")
+
+    queue = DownloadQueue(max_workers=jobs, key_func=dedup_key, journal=journal,
+                          scheduler=engine.scheduler, prefetch=prefetch)
+    if queue.restored:
+        log(f"↺ {len(queue.restored)} video(s) recuperado(s) de {journal_path}")
+    options = {"output_path": output_path, "quality": quality, "use_cookies": use_cookies}
+    if force:
+        options["force"] = True
+    skipped = 0
+    lists = [url for url in urls if es_lista(url)]
+    for url in urls:
+        if url in lists:
+            continue
+        if not force and engine.history.is_duplicate(url):
+            log(f"= Ya descargado, se omite: {url}")
+            skipped += 1
+        elif not force and engine.in_folder(url, output_path) is not None:
+            log(f"= Ya está en la carpeta, se omite: {url}")
+            skipped += 1
+        elif queue.add(url, options) is None:
+            if not any(job.url == url for job in queue.restored):
+                log(f"= Repetido en la lista, se omite: {url}")
+                skipped += 1
+
+    log(f"▶ {queue.count(PENDING)} video(s)"
+        + (f" + {len(lists)} lista(s)" if lists else "")
+        + f", {jobs} en paralelo → {output_path}"
+        + (f" ({skipped} omitido(s))" if skipped else ""))
+    api = None
+    if api_port is not None:
+        from control_api import ControlAPI
+
+        api = ControlAPI(
+            queue, engine, port=api_port, defaults=lambda: options,
+            expand=lambda url, opts, frc: feed_playlist(engine, queue, url,
+                                                        opts.get("use_cookies", use_cookies),
+                                                        opts, frc, log),
+            log=log,
+        )
+        try:
+            host, port = api.start()
+            log(f"→ API local en http://{host}:{port}")
+        except OSError as e:
+            log(f"✗ No se pudo abrir la API local en el puerto {api_port}: {e}")
+            api = None
+    with queue.producer():
+        queue.start(lambda job: run_job(engine, job), options=options)
+        # Las listas se expanden mientras los workers ya descargan
+        for url in lists:
+            log(f"+ Expandiendo lista: {url}")
+            added, dupes = feed_playlist(engine, queue, url, use_cookies, options, force, log)
+            log(f"  {added} video(s) añadido(s)" + (f", {dupes} omitido(s)" if dupes else ""))
+        if serve and api is not None:
+            # Mientras el productor siga abierto la cola no se da por terminada
+            log("… Esperando URLs por la API (Ctrl+C para terminar)")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                log("■ Se dejan de aceptar URLs; terminando lo que queda en cola")
+    queue.wait()
+    if api is not None:
+        api.stop()
+    queue.close()
+    engine.close()
+    if journal is not None:
+        journal.close()             # La próxima carga descarta los ya terminados
+
+    failed = [j for j in queue.jobs() if j.state == FAILED]
+    log(f"✓ Terminado: {queue.count(DONE)} completada(s), {len(failed)} con error")
+    for job in failed:
+        log(f"  ✗ {job.url}" + (f" ({job.error})" if job.error else ""))
+    for row in summarize_metrics(j.metrics for j in queue.jobs()):
+        log(f"  {metrics_line(row)}")
+    if metrics_path:
+        n = export_metrics(engine.history.metrics(), metrics_path)
+        log(f"✓ Telemetría exportada: {n} intento(s) → {metrics_path}")
+    return 1 if failed else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Descargador de videos. Sin argumentos abre la interfaz gráfica."
+    )
+    parser.add_argument("urls", nargs="*", help="URLs a descargar sin abrir la GUI")
+    parser.add_argument("--batch", metavar="FICHERO",
+                        help="fichero con una URL por línea ('-' para stdin)")
+    parser.add_argument("--quality", choices=QUALITIES, default="best")
+    parser.add_argument("--out", default=str(Path.home() / "Downloads" / "MisVideos"),
+                        help="carpeta de destino")
+    parser.add_argument("--jobs", type=int, default=3, help="descargas simultáneas")
+    parser.add_argument("--cookies", action="store_true", help="usar cookies de Brave")
+    parser.add_argument("--force", action="store_true",
+                        help="descargar también los videos que ya están en el historial")
+    parser.add_argument("--limit-rate", metavar="VELOCIDAD",
+                        help="ancho de banda total, p. ej. 500K o 2M (bytes/s)")
+    parser.add_argument("--fragments", type=int, metavar="N",
+                        help="fragmentos HLS/DASH simultáneos (por defecto según la plataforma)")
+    parser.add_argument("--downloader", choices=DOWNLOADERS, default="auto",
+                        help="auto = aria2c para HTTP/DASH si está instalado")
+    parser.add_argument("--journal", metavar="FICHERO",
+                        help="guarda la cola en FICHERO y la reanuda si se interrumpe")
+    parser.add_argument("--dedup", metavar="CARPETA",
+                        help="indexa CARPETA y sustituye los archivos repetidos por enlaces")
+    parser.add_argument("--export-metrics", metavar="FICHERO",
+                        help="exporta la telemetría del historial a CSV o JSON (según la extensión)")
+    parser.add_argument("--log-file", metavar="FICHERO",
+                        help="GUI: copia el log completo a un fichero rotativo")
+    parser.add_argument("--api", nargs="?", type=int, const=0, metavar="PUERTO",
+                        help="abre la API HTTP local para controlar la cola (por defecto 8765)")
+    parser.add_argument("--serve", action="store_true",
+                        help="sin GUI: mantiene la cola abierta recibiendo URLs por la API")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    urls = list(args.urls)
+    if args.batch:
+        urls += read_url_file(args.batch)
+    if args.dedup:
+        store = ContentStore()
+        seen, linked, saved = store.scan(args.dedup)
+        store.close()
+        print(f"✓ {seen} archivo(s) revisado(s), {linked} duplicado(s) enlazado(s), "
+              f"{format_bytes(saved) or '0 B'} recuperados")
+        return 0
+    if args.export_metrics and not (args.batch or urls):
+        history = DownloadHistory()
+        n = export_metrics(history.metrics(), args.export_metrics)
+        history.close()
+        print(f"✓ {n} intento(s) exportado(s) a {args.export_metrics}")
+        return 0
+    api_port = None
+    if args.api is not None or args.serve:
+        from control_api import API_PORT
+        api_port = args.api or API_PORT
+    if args.batch or urls or args.serve:
+        rate_limit = None
+        if args.limit_rate:
+            from yt_dlp.utils import parse_bytes
+            rate_limit = parse_bytes(args.limit_rate)
+            if not rate_limit:
+                print(f"--limit-rate no válido: {args.limit_rate}", file=sys.stderr)
+                return 2
+        return run_batch(urls, args.out, args.quality,
+                         "si" if args.cookies else "no", max(1, args.jobs), args.force,
+                         args.journal, rate_limit, args.fragments, args.downloader,
+                         args.export_metrics, api_port, args.serve)
+
+    _load_gui()
+    app = VideoDownloaderApp(log_file=args.log_file, api_port=api_port)
+    app.run()
+    return 0
 
 
 if __name__ == "__main__":
-    app = VideoDownloaderApp()
-    app.run()
+    sys.exit(main())